@@ -7,28 +7,47 @@ RFID读写器通信模块
 import threading
 import time
 from typing import Callable, Optional, Any
+import asyncio
+from concurrent.futures import Future
 from SocketClient import SocketClient
-from command import device_command  # 导入指令字典
+from command import device_command, device_command_ack_type, is_inventory_frame  # 导入指令字典
+from command_tracker import CommandTracker
+from send_scheduler import PRIORITY_CONTROL, PRIORITY_NORMAL, PRIORITY_BULK
+
+# 指令的默认发送优先级，未列出的指令使用 PRIORITY_NORMAL
+COMMAND_PRIORITY = {
+    'CMD_RFID_LOOP_STOP': PRIORITY_CONTROL
+}
 
 
 class RFIDReader_CNNT:
     """RFID读写器通信类"""
 
-    def __init__(self, host: str = '192.168.3.173', port: int = 2000):
+    def __init__(self, host: str = '192.168.3.173', port: int = 2000, engine=None):
         """
         初始化RFID读写器
 
         Args:
             host: 服务器地址
             port: 服务器端口
+            engine: asyncio引擎（AsyncReaderEngine），为None时使用线程模式的SocketClient；
+                    多个读写器共享同一个引擎时只占用一个事件循环线程
         """
         self.host = host
         self.port = port
-        self.socket_client = SocketClient(host, port)
+        self.engine = engine
+        if engine is not None:
+            from async_transport import AsyncSocketClient
+            self.socket_client = AsyncSocketClient(host, port, engine)
+        else:
+            self.socket_client = SocketClient(host, port)
         self.is_connected = False
         self.command_queue = []
         self.loop_thread = None
+        self.loop_task = None
         self.loop_running = False
+        self._loop_generation = 0  # 每次开始/停止循环加一，旧循环据此退出且不改写 loop_running
+        self.command_tracker = CommandTracker(resend=self._resend_cmd, ignore=is_inventory_frame)
 
         # 回调函数
         self.receive_callback = None
@@ -81,14 +100,82 @@ class RFIDReader_CNNT:
         self.stop_loop_cmd()
         self.socket_client.disconnect()
         self.is_connected = False
+        self.command_tracker.cancel_all("RFID读写器已断开连接")
         print("RFID读写器已断开连接")
 
-    def send_single_cmd(self, command_name: str) -> bool:
+    def send_single_cmd(self, command_name: str, priority: Optional[int] = None) -> bool:
         """
         发送单次指令
 
         Args:
             command_name: 指令名称，如 'RFID_QUERY', 'PRODUCTION_START'
+            priority: 发送优先级，None时按 COMMAND_PRIORITY 确定（停止指令走控制通道）
+
+        Returns:
+            发送是否成功（自动重连期间指令进入队列，连接恢复后发送）
+        """
+        if not self.is_connected and not self.socket_client.reconnecting:
+            self._call_error_callback("未连接到RFID读写器")
+            return False
+
+        if command_name not in device_command:
+            self._call_error_callback(f"未知指令: {command_name}")
+            return False
+
+        command_bytes = device_command[command_name]
+        if priority is None:
+            priority = COMMAND_PRIORITY.get(command_name, PRIORITY_NORMAL)
+        success = self.socket_client.send_data(command_bytes, priority)
+
+        if success:
+            hex_str = ' '.join([f'{b:02X}' for b in command_bytes])
+            print(f"发送单次指令: {command_name} -> {hex_str}")
+        else:
+            self._call_error_callback(f"发送指令失败: {command_name}")
+
+        return success
+
+    def send_cmd_with_ack(self, command_name: str, timeout: float = 1.0, retries: int = 2) -> Future:
+        """
+        发送指令并等待读写器应答
+
+        Args:
+            command_name: 指令名称，必须在 device_command_ack_type 中定义了应答类型
+            timeout: 每次发送等待应答的时间（秒）
+            retries: 超时后最多重发次数
+
+        Returns:
+            Future: 收到应答时结果为应答帧（bytes）；超时抛出TimeoutError，断开连接抛出ConnectionError。
+                    asyncio中可通过 asyncio.wrap_future 等待
+        """
+        if command_name not in device_command_ack_type:
+            future = Future()
+            future.set_exception(ValueError(f"指令没有定义应答类型: {command_name}"))
+            return future
+
+        # 先登记再发送，避免应答先于登记到达
+        future = self.command_tracker.track(command_name, device_command_ack_type[command_name],
+                                            timeout, retries)
+        if not self.send_single_cmd(command_name):
+            self.command_tracker.discard(future)
+            future.set_exception(ConnectionError(f"发送指令失败: {command_name}"))
+        return future
+
+    async def send_cmd_with_ack_async(self, command_name: str, timeout: float = 1.0, retries: int = 2) -> bytes:
+        """发送指令并等待应答（可等待版本），返回应答帧"""
+        return await asyncio.wrap_future(self.send_cmd_with_ack(command_name, timeout, retries))
+
+    def _resend_cmd(self, command_name: str) -> bool:
+        """应答超时后重发指令"""
+        print(f"指令应答超时，重发: {command_name}")
+        return self.send_single_cmd(command_name)
+
+    async def send_single_cmd_async(self, command_name: str) -> bool:
+        """
+        发送单次指令（可等待版本，asyncio模式下需在引擎的事件循环中await）
+
+        Args:
+            command_name: 指令名称
 
         Returns:
             发送是否成功
@@ -102,7 +189,7 @@ class RFIDReader_CNNT:
             return False
 
         command_bytes = device_command[command_name]
-        success = self.socket_client.send_data(command_bytes)
+        success = await self.socket_client.send_async(command_bytes)
 
         if success:
             hex_str = ' '.join([f'{b:02X}' for b in command_bytes])
@@ -132,41 +219,76 @@ class RFIDReader_CNNT:
         self.stop_loop_cmd()
 
         # 开始新的循环
+        self._loop_generation += 1
+        generation = self._loop_generation
         self.loop_running = True
-        self.loop_thread = threading.Thread(
-            target=self._loop_send,
-            args=(command_name, interval),
-            daemon=True
-        )
-        self.loop_thread.start()
+        if self.engine is not None:
+            # asyncio模式下用定时协程代替线程
+            self.loop_task = self.engine.submit(self._loop_send_async(command_name, interval, generation))
+        else:
+            self.loop_thread = threading.Thread(
+                target=self._loop_send,
+                args=(command_name, interval, generation),
+                daemon=True
+            )
+            self.loop_thread.start()
 
         print(f"开始循环发送指令: {command_name}, 间隔: {interval}秒")
 
     def stop_loop_cmd(self):
         """停止循环发送指令"""
         if self.loop_running:
+            self._loop_generation += 1
             self.loop_running = False
-            if self.loop_thread and self.loop_thread.is_alive():
+            if self.loop_task:
+                self.loop_task.cancel()
+                self.loop_task = None
+            if self.loop_thread and self.loop_thread.is_alive() and self.loop_thread is not threading.current_thread():
                 self.loop_thread.join(timeout=2.0)
             print("停止循环发送指令")
 
-    def _loop_send(self, command_name: str, interval: float):
+    def _loop_current(self, generation: int) -> bool:
+        """循环是否仍是最新一次开始的循环且未被停止"""
+        return self.loop_running and self._loop_generation == generation
+
+    def _loop_finished(self, generation: int):
+        """循环自行结束（断开或出错）时清除运行标志，已被新循环取代时不改写"""
+        if self._loop_generation == generation:
+            self.loop_running = False
+
+    def _loop_send(self, command_name: str, interval: float, generation: int):
         """循环发送指令的线程函数"""
         command_bytes = device_command[command_name]
         hex_str = ' '.join([f'{b:02X}' for b in command_bytes])
 
-        while self.loop_running and self.is_connected:
+        while self._loop_current(generation) and self.is_connected:
             try:
-                self.socket_client.send_data(command_bytes)
+                self.socket_client.send_data(command_bytes, PRIORITY_BULK)
                 print(f"循环发送: {command_name} -> {hex_str}")
                 time.sleep(interval)
             except Exception as e:
                 self._call_error_callback(f"循环发送错误: {e}")
                 break
 
-        self.loop_running = False
+        self._loop_finished(generation)
 
+    async def _loop_send_async(self, command_name: str, interval: float, generation: int):
+        """循环发送指令的协程（asyncio模式）"""
+        command_bytes = device_command[command_name]
+        hex_str = ' '.join([f'{b:02X}' for b in command_bytes])
+
+        try:
+            while self._loop_current(generation) and self.is_connected:
+                await self.socket_client.send_async(command_bytes)
+                print(f"循环发送: {command_name} -> {hex_str}")
+                await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            # 被 stop_loop_cmd 取消：此时可能已经开始了新的循环，不能改写共享的运行标志
+            raise
+        except Exception as e:
+            self._call_error_callback(f"循环发送错误: {e}")
 
+        self._loop_finished(generation)
 
     def send_multiple_cmds(self, command_names: list, interval: float = 1.0):
         """
@@ -201,21 +323,61 @@ class RFIDReader_CNNT:
         """获取连接状态"""
         return self.is_connected and self.socket_client.is_connected
 
+    def can_send(self) -> bool:
+        """当前是否可以发送指令（已连接，或正在自动重连、指令会排队等待）"""
+        return self.get_connection_status() or self.socket_client.reconnecting
+
+    def enable_heartbeat(self, command_name: str = 'CMD_RFID_QUERY', interval: float = 0.5,
+                         dead_link_timeout: float = 1.5) -> bool:
+        """
+        启用应用层心跳，链路空闲时发送查询指令，超时无数据即判定断链并自动重连
+
+        Args:
+            command_name: 作为心跳的指令名称（应为读写器会应答的廉价查询指令）
+            interval: 心跳间隔（秒）
+            dead_link_timeout: 断链判定时间（秒）
+
+        Returns:
+            是否设置成功
+        """
+        if command_name not in device_command:
+            self._call_error_callback(f"未知指令: {command_name}")
+            return False
+        self.socket_client.set_heartbeat(device_command[command_name], interval, dead_link_timeout)
+        print(f"启用心跳: {command_name}, 间隔{interval}秒, 断链判定{dead_link_timeout}秒")
+        return True
+
+    def disable_heartbeat(self):
+        """关闭应用层心跳（仍保留TCP keepalive）"""
+        self.socket_client.set_heartbeat(None)
+
+    def get_ack_stats(self) -> dict:
+        """获取指令应答统计（应答数、超时、重试及应答延迟直方图）"""
+        return self.command_tracker.get_stats()
+
+    def get_send_stats(self) -> dict:
+        """获取各发送通道的计数和入队到写出的延迟（毫秒），可用于评估停止指令的下发延迟"""
+        return self.socket_client.get_send_stats()
+
+    def get_reconnect_stats(self) -> dict:
+        """获取自动重连统计信息（重连次数、中断时长、过期指令数等）"""
+        return self.socket_client.get_reconnect_stats()
+
     def get_available_commands(self) -> list:
         """获取所有可用的指令名称"""
         return list(device_command.keys())
 
     # Socket回调处理
-    def _on_socket_receive(self, data: bytes or dict):
-        """Socket数据接收回调"""
-        if isinstance(data, bytes):
+    def _on_socket_receive(self, data: memoryview or bytes or dict):
+        """Socket数据接收回调（二进制数据为一个完整的 A5 5A 帧）"""
+        if isinstance(data, (bytes, memoryview)):
+            # 匹配等待应答的指令
+            self.command_tracker.on_frame(data)
+
             # 处理二进制数据
             if self.receive_callback:
-                self.receive_callback(data)
-
-            # 显示接收到的数据（调试用）
-            hex_str = ' '.join([f'{b:02X}' for b in data])
-            # print(f"收到RFID数据: {hex_str}")
+                # 帧视图指向接收缓冲区，上层可能异步处理，这里复制为独立的bytes
+                self.receive_callback(bytes(data))
 
         elif isinstance(data, dict):
             # 处理JSON数据
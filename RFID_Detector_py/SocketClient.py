@@ -1,21 +1,115 @@
 # SocketClient.py
 import socket
 import threading
-import queue
 import json
+import random
+import time
 from typing import Callable, Any, Optional
+from frame_assembler import FrameAssembler
+from packet_dispatcher import PacketDispatcher
+from send_scheduler import SendScheduler, PRIORITY_CONTROL, PRIORITY_NORMAL
+from traffic_capture import CaptureWriter, DIRECTION_RX, DIRECTION_TX
+
+
+def configure_keepalive(sock: socket.socket, idle: float = 1.0, interval: float = 1.0, count: int = 2,
+                        user_timeout: Optional[float] = 2.0):
+    """
+    开启并调整TCP keepalive，使半开连接（交换机重启、网线拔出）能被系统及时发现
+
+    Args:
+        sock: 已创建的TCP socket
+        idle: 连接空闲多久后开始发送探测包（秒，系统要求整数，向上取整）
+        interval: 探测包间隔（秒，向上取整）
+        count: 连续多少个探测包无响应后判定连接断开
+        user_timeout: 已发送数据多久未被确认即判定断开（秒，仅Linux的TCP_USER_TIMEOUT），None表示不设置
+    """
+    idle_s = max(1, int(-(-idle // 1)))
+    interval_s = max(1, int(-(-interval // 1)))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):  # Linux
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle_s)
+        elif hasattr(socket, 'TCP_KEEPALIVE'):  # macOS
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle_s)
+        elif hasattr(socket, 'SIO_KEEPALIVE_VALS'):  # Windows
+            sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, int(idle * 1000), int(interval * 1000)))
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval_s)
+        if hasattr(socket, 'TCP_KEEPCNT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+        if user_timeout is not None and hasattr(socket, 'TCP_USER_TIMEOUT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(user_timeout * 1000))
+    except OSError as e:
+        print(f"设置TCP keepalive失败: {e}")
 
 
 class SocketClient:
     """Socket通信客户端类"""
 
-    def __init__(self, host='192.168.1.200', port=2000):
+    def __init__(self, host='192.168.1.200', port=2000, auto_reconnect: bool = True,
+                 reconnect_min_delay: float = 0.5, reconnect_max_delay: float = 30.0,
+                 command_ttl: Optional[float] = 10.0):
+        """
+        初始化Socket客户端
+
+        Args:
+            host: 服务器地址
+            port: 服务器端口
+            auto_reconnect: 连接意外断开后是否自动重连
+            reconnect_min_delay: 重连初始等待时间（秒），之后按指数退避增长
+            reconnect_max_delay: 重连最大等待时间（秒）
+            command_ttl: 队列中指令的有效期（秒），重连期间超过有效期的指令被丢弃，None表示不过期
+
+        TCP keepalive参数（keepalive_idle/keepalive_interval/keepalive_count/tcp_user_timeout）
+        和应用层心跳（set_heartbeat）可在连接前修改。
+        """
         self.host = host
         self.port = port
         self.socket = None
         self.is_connected = False
         self.receive_thread = None
-        self.send_queue = queue.Queue()
+        self.send_thread = None
+        self.send_queue = SendScheduler()  # 按优先级分通道的发送队列
+        self.frame_assembler = FrameAssembler()
+        self.packet_dispatcher = PacketDispatcher(
+            binary_handler=self._on_binary_packet,
+            json_handler=self._on_json_packet,
+            unknown_handler=self._on_unknown_packet
+        )
+
+        # 自动重连
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.command_ttl = command_ttl
+        self.reconnecting = False
+        self._running = False  # connect()后为True，手动disconnect()后为False
+        self._stop_event = threading.Event()
+        self._connected_event = threading.Event()
+
+        # 重连统计
+        self.reconnect_count = 0
+        self.reconnect_attempts = 0
+        self.last_outage_time = 0.0
+        self.total_outage_time = 0.0
+        self._outage_start = 0.0
+        self.expired_commands = 0
+
+        # 断链检测：TCP keepalive + 可选的应用层心跳
+        self.keepalive_idle = 1.0
+        self.keepalive_interval = 1.0
+        self.keepalive_count = 2
+        self.tcp_user_timeout = 2.0
+        self.heartbeat_data = None  # 心跳帧，None表示不启用应用层心跳
+        self.heartbeat_interval = 0.5  # 无数据多久后发送心跳（秒）
+        self.dead_link_timeout = 1.5  # 无数据多久后判定链路断开（秒）
+        self.last_receive_time = 0.0
+        self._last_heartbeat_time = 0.0
+        self.heartbeats_sent = 0
+        self.dead_links_detected = 0
+
+        # 抓包（可选）
+        self.capture: Optional[CaptureWriter] = None
 
         # 回调函数
         self.receive_callback = None
@@ -31,21 +125,72 @@ class SocketClient:
         self.connection_callback = connection_callback
         self.error_callback = error_callback
 
+    def set_heartbeat(self, data: Optional[bytes], interval: float = 0.5, dead_link_timeout: float = 1.5):
+        """
+        设置应用层心跳：链路空闲 interval 秒后发送心跳帧，超过 dead_link_timeout 秒仍未收到任何数据则判定断链
+
+        Args:
+            data: 心跳帧（读写器会应答的廉价查询指令），None表示关闭心跳
+            interval: 心跳间隔（秒）
+            dead_link_timeout: 断链判定时间（秒），应大于interval
+        """
+        if data is not None and dead_link_timeout <= interval:
+            raise ValueError("断链判定时间必须大于心跳间隔")
+        self.heartbeat_data = data
+        self.heartbeat_interval = interval
+        self.dead_link_timeout = dead_link_timeout
+        if self.socket:
+            self.socket.settimeout(self._receive_timeout())
+
+    def start_capture(self, prefix: str, **kwargs) -> CaptureWriter:
+        """
+        开始抓包，收发的原始数据块写入 prefix 开头的分段文件
+
+        Args:
+            prefix: 抓包文件路径前缀
+            **kwargs: 传给 CaptureWriter 的分段参数
+
+        Returns:
+            CaptureWriter: 抓包写入器
+        """
+        self.stop_capture()
+        self.capture = CaptureWriter(prefix, **kwargs)
+        print(f"开始抓包: {prefix}")
+        return self.capture
+
+    def stop_capture(self):
+        """停止抓包并关闭文件"""
+        capture, self.capture = self.capture, None
+        if capture:
+            capture.close()
+            print(f"停止抓包: {capture.get_stats()}")
+
+    def feed_received_data(self, data: bytes):
+        """
+        把一块原始数据当作从socket收到的数据处理（回放抓包、测试用）
+
+        Args:
+            data: 原始数据，可以包含多个帧或不完整的帧
+        """
+        for frame in self.frame_assembler.feed(data):
+            self._process_received_data(frame)
+
     def connect(self) -> bool:
         """连接服务器"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(5)
-            self.socket.connect((self.host, self.port))
-            self.is_connected = True
+            self._open_socket()
+            self._running = True
+            self._stop_event.clear()
 
-            # 启动接收线程
-            self.receive_thread = threading.Thread(target=self._receive_loop, daemon=True)
-            self.receive_thread.start()
+            # 启动接收线程（同时负责断线重连）
+            if not (self.receive_thread and self.receive_thread.is_alive()):
+                self.receive_thread = threading.Thread(target=self._receive_loop, daemon=True)
+                self.receive_thread.start()
 
-            # 启动发送线程
-            send_thread = threading.Thread(target=self._send_loop, daemon=True)
-            send_thread.start()
+            # 启动发送线程（重连期间保持运行，队列中的指令不会丢失）
+            if not (self.send_thread and self.send_thread.is_alive()):
+                self.send_thread = threading.Thread(target=self._send_loop, daemon=True)
+                self.send_thread.start()
 
             if self.connection_callback:
                 self.connection_callback(True, f"成功连接到服务器 {self.host}:{self.port}")
@@ -61,9 +206,30 @@ class SocketClient:
                 self.error_callback(error_msg)
             return False
 
-    def disconnect(self):
-        """断开连接"""
+    def _open_socket(self):
+        """建立TCP连接"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            configure_keepalive(sock, self.keepalive_idle, self.keepalive_interval,
+                                self.keepalive_count, self.tcp_user_timeout)
+            sock.settimeout(5)
+            sock.connect((self.host, self.port))
+            sock.settimeout(self._receive_timeout())
+        except Exception:
+            sock.close()
+            raise
+        self.socket = sock
+        self.last_receive_time = time.monotonic()
+        self.frame_assembler.reset()
+        self.is_connected = True
+        self._connected_event.set()
+
+    def _close_socket(self, sock=None):
+        """关闭当前socket（指定sock时，仅当它仍是当前连接才关闭）"""
+        if sock is not None and self.socket is not sock:
+            return
         self.is_connected = False
+        self._connected_event.clear()
         if self.socket:
             try:
                 self.socket.close()
@@ -71,95 +237,256 @@ class SocketClient:
                 pass
             self.socket = None
 
-    def send_data(self, data: dict or str or bytes) -> bool:
-        """发送数据到队列"""
-        if self.is_connected:
-            self.send_queue.put(data)
-            return True
+    def disconnect(self):
+        """断开连接（手动断开，不会自动重连）"""
+        self._running = False
+        self._stop_event.set()
+        self._close_socket()
+
+    def send_data(self, data: dict or str or bytes, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        发送数据到队列（重连期间指令会保留在队列中，连接恢复后发送）
+
+        Args:
+            data: 待发送的数据
+            priority: 发送通道优先级，PRIORITY_CONTROL 的数据总是在下一次写出时优先发送
+
+        Returns:
+            是否成功加入队列
+        """
+        if self.is_connected or self.reconnecting:
+            return self.send_queue.put(data, priority)
         return False
 
+    async def send_async(self, data: dict or str or bytes, priority: int = PRIORITY_NORMAL) -> bool:
+        """发送数据（可等待版本，线程模式下等同于send_data）"""
+        return self.send_data(data, priority)
+
+    @staticmethod
+    def _encode_data(data: dict or str or bytes) -> bytes:
+        """将待发送的数据转换为字节"""
+        if isinstance(data, dict):
+            return json.dumps(data, ensure_ascii=False).encode('utf-8')
+        elif isinstance(data, str):
+            return data.encode('utf-8')
+        elif isinstance(data, bytes):
+            # 如果是字节数组，直接使用
+            return data
+        else:
+            # 其他类型转换为字符串
+            return str(data).encode('utf-8')
+
     def _send_loop(self):
-        """发送循环 - 直接发送原始数据"""
+        """发送循环 - 直接发送原始数据，每次取优先级最高的一项"""
         print('_send_loop start')
-        while self.is_connected:
+        while self._running:
+            if not self.is_connected:
+                self._connected_event.wait(timeout=1)
+                continue
+
+            item = self.send_queue.get(timeout=1)
+            if item is None:
+                continue
+
+            _, enqueue_time, data = item
+            if not data:
+                continue
+            if self.command_ttl is not None and time.monotonic_ns() - enqueue_time > self.command_ttl * 1e9:
+                # 指令已过期（例如重连时间过长），不再发送
+                self.expired_commands += 1
+                self.send_queue.mark_expired(item)
+                continue
+
+            sock = self.socket
             try:
-                data = self.send_queue.get(timeout=1)
-                if data and self.socket:
-                    if isinstance(data, dict):
-                        data = json.dumps(data, ensure_ascii=False).encode('utf-8')
-                    elif isinstance(data, str):
-                        data = data.encode('utf-8')
-                    elif isinstance(data, bytes):
-                        # 如果是字节数组，直接使用
-                        pass
-                    else:
-                        # 其他类型转换为字符串
-                        data = str(data).encode('utf-8')
+                if sock:
+                    data = self._encode_data(data)
 
                     # 直接发送数据，不添加任何前缀
-                    self.socket.sendall(data)
+                    sock.sendall(data)
+                    self.send_queue.mark_sent(item)
+                    if self.capture:
+                        self.capture.write(DIRECTION_TX, data)
                     print(f"发送数据: {data.hex().upper()}")  # 调试用
+                else:
+                    # 连接已关闭，放回队列等待重连
+                    self.send_queue.requeue(item)
 
-            except queue.Empty:
-                continue
             except Exception as e:
                 if self.is_connected and self.error_callback:
                     self.error_callback(f"发送数据错误: {e}")
-                break
+                if not (self._running and self.auto_reconnect):
+                    break
+                # 放回队首，关闭socket使接收线程进入重连流程
+                self.send_queue.requeue(item)
+                self._close_socket(sock)
 
     def _receive_loop(self):
-        """接收循环 - 直接接收原始数据"""
+        """接收循环 - 接收数据到预分配缓冲区并重组为完整帧，连接意外断开时自动重连"""
         print('_receive_loop start')
-        while self.is_connected:
-            try:
-                # 直接接收数据，不处理任何头部
-                received_data = self.socket.recv(1024)  # 接收最多1024字节
-                if not received_data:
+        assembler = self.frame_assembler
+        while self._running:
+            sock = self.socket
+            if sock is None or not self.is_connected:
+                if not self._reconnect():
                     break
+                continue
 
-                # 处理接收到的数据
-                self._process_received_data(received_data)
+            try:
+                # 直接接收到重组缓冲区，避免每次recv分配新的bytes对象
+                buffer = assembler.writable()
+                received_size = sock.recv_into(buffer)
+                if not received_size:
+                    self._on_link_lost(sock)
+                    continue
+                self.last_receive_time = time.monotonic()
+                if self.capture:
+                    self.capture.write(DIRECTION_RX, buffer[:received_size])
+
+                # 逐帧处理（一次接收可能包含多个帧，也可能不足一帧）
+                for frame in assembler.commit(received_size):
+                    self._process_received_data(frame)
 
             except socket.timeout:
+                if self.heartbeat_data is not None:
+                    self._check_heartbeat(sock)
                 continue
             except Exception as e:
                 if self.is_connected and self.error_callback:
                     self.error_callback(f"接收数据错误: {e}")
-                break
+                self._on_link_lost(sock)
 
-        self.is_connected = False
+    def _receive_timeout(self) -> float:
+        """接收超时：启用心跳时需要足够频繁地醒来检查链路"""
+        if self.heartbeat_data is None:
+            return 5.0
+        return max(0.05, min(self.heartbeat_interval, self.dead_link_timeout - self.heartbeat_interval) / 2)
+
+    def _check_heartbeat(self, sock):
+        """链路空闲时发送心跳，超过断链判定时间仍无数据则断开（随后自动重连）"""
+        now = time.monotonic()
+        idle = now - self.last_receive_time
+        if idle >= self.dead_link_timeout:
+            self.dead_links_detected += 1
+            if self.error_callback:
+                self.error_callback(f"链路无响应超过{idle:.1f}秒，判定连接已断开")
+            self._on_link_lost(sock)
+        elif idle >= self.heartbeat_interval and now - self._last_heartbeat_time >= self.heartbeat_interval:
+            self._last_heartbeat_time = now
+            self.heartbeats_sent += 1
+            self.send_data(self.heartbeat_data, PRIORITY_CONTROL)
+
+    def _on_link_lost(self, sock):
+        """连接断开"""
+        if self.socket is not None and self.socket is not sock:
+            # 已经建立了新的连接
+            return
+        self._close_socket()
+        if not self._running:
+            # 手动断开
+            if self.connection_callback:
+                self.connection_callback(False, "与服务器连接断开")
+            return
+
+        self._outage_start = time.monotonic()
+        if not self.auto_reconnect:
+            self._running = False
+            if self.connection_callback:
+                self.connection_callback(False, "与服务器连接断开")
+            return
+
+        self.reconnecting = True
         if self.connection_callback:
-            self.connection_callback(False, "与服务器连接断开")
+            self.connection_callback(False, "与服务器连接断开，正在自动重连")
 
-    def _process_received_data(self, data: bytes):
-        """处理接收到的数据"""
-        try:
-            # 首先尝试解码为UTF-8文本（JSON格式）
+    def _reconnect(self) -> bool:
+        """
+        按指数退避（带随机抖动）重连，直到成功或被手动断开
+
+        Returns:
+            是否重连成功
+        """
+        if not self._running:
+            return False
+
+        attempt = 0
+        while self._running:
+            delay = min(self.reconnect_max_delay, self.reconnect_min_delay * (2 ** attempt))
+            # 抖动：在[delay/2, delay]之间随机，避免多个客户端同时重连
+            if self._stop_event.wait(random.uniform(delay / 2, delay)):
+                break
+
+            attempt += 1
+            self.reconnect_attempts += 1
             try:
-                data_str = data.decode('utf-8')
-                data_dict = json.loads(data_str)
-                if self.receive_callback:
-                    self.receive_callback(data_dict)
-                print(f"接收到JSON数据: {data_dict}")
-                return
-            except (UnicodeDecodeError, json.JSONDecodeError):
-                # 如果不是UTF-8文本或JSON格式，作为二进制数据处理
-                pass
+                self._open_socket()
+            except Exception as e:
+                print(f"重连失败（第{attempt}次）: {e}")
+                continue
 
-            # 作为二进制数据处理
-            if self.receive_callback:
-                self.receive_callback(data)
+            self.reconnecting = False
+            self.reconnect_count += 1
+            self.last_outage_time = time.monotonic() - self._outage_start
+            self.total_outage_time += self.last_outage_time
+            if self.connection_callback:
+                self.connection_callback(True, f"重新连接到服务器 {self.host}:{self.port}，"
+                                               f"中断{self.last_outage_time:.1f}秒")
+            return True
 
-            # 调试信息
-            hex_data = data.hex().upper()
-            formatted_hex = ' '.join([hex_data[i:i + 2] for i in range(0, len(hex_data), 2)])
-            # print(f"接收到二进制数据: {formatted_hex}")
-            # print(f"数据长度: {len(data)}字节")
+        self.reconnecting = False
+        return False
 
+    def _process_received_data(self, data: memoryview):
+        """处理接收到的数据（data为重组缓冲区中的帧视图，仅在回调期间有效）"""
+        try:
+            # 按首字节分发：二进制帧直接回调，只有JSON消息才进行文本解码
+            self.packet_dispatcher.dispatch(data)
         except Exception as e:
             if self.error_callback:
                 self.error_callback(f"数据处理错误: {e}")
 
+    def _on_binary_packet(self, data: memoryview):
+        """二进制协议帧"""
+        if self.receive_callback:
+            self.receive_callback(data)
+
+    def _on_json_packet(self, data_dict: Any):
+        """JSON消息"""
+        if self.receive_callback:
+            self.receive_callback(data_dict)
+        print(f"接收到JSON数据: {data_dict}")
+
+    def _on_unknown_packet(self, data: memoryview):
+        """无法识别的数据（非协议帧且不是有效JSON）"""
+        if self.error_callback:
+            self.error_callback(f"收到无法识别的数据: {len(data)}字节")
+
     def get_connection_status(self) -> bool:
         """获取连接状态"""
-        return self.is_connected
\ No newline at end of file
+        return self.is_connected
+
+    def get_reconnect_stats(self) -> dict:
+        """获取重连统计信息"""
+        return {
+            'reconnecting': self.reconnecting,
+            'reconnect_count': self.reconnect_count,
+            'reconnect_attempts': self.reconnect_attempts,
+            'last_outage_time': round(self.last_outage_time, 3),
+            'total_outage_time': round(self.total_outage_time, 3),
+            'expired_commands': self.expired_commands,
+            'heartbeats_sent': self.heartbeats_sent,
+            'dead_links_detected': self.dead_links_detected,
+            'queued_commands': self.send_queue.qsize()
+        }
+
+    def get_send_stats(self) -> dict:
+        """获取各发送通道的计数和入队到写出的延迟（毫秒）"""
+        return self.send_queue.get_stats()
+
+    def get_frame_stats(self) -> dict:
+        """获取帧重组统计信息（帧数、重新同步次数、丢弃的无效字节数等）"""
+        return self.frame_assembler.get_stats()
+
+    def get_packet_stats(self) -> dict:
+        """获取按首字节分类的数据包计数（二进制帧、JSON、无效JSON、未知数据）"""
+        return self.packet_dispatcher.get_stats()
\ No newline at end of file
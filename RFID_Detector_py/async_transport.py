@@ -0,0 +1,341 @@
+# async_transport.py
+"""
+asyncio传输模块
+所有读写器连接共享一个事件循环线程，取代每个连接的接收/发送线程。
+AsyncSocketClient 与 SocketClient 接口一致，可直接替换到 RFIDReader_CNNT 中使用。
+"""
+
+import asyncio
+import concurrent.futures
+import random
+import threading
+import time
+from typing import Optional, Coroutine
+from SocketClient import SocketClient, configure_keepalive
+from traffic_capture import DIRECTION_RX, DIRECTION_TX
+from send_scheduler import PRIORITY_CONTROL, PRIORITY_NORMAL
+
+
+class AsyncReaderEngine:
+    """事件循环引擎，在单独的线程中运行一个asyncio事件循环"""
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, name: str = 'rfid-asyncio'):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+
+    @classmethod
+    def get_default(cls) -> 'AsyncReaderEngine':
+        """获取进程内共享的默认引擎（首次调用时启动）"""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+                cls._default.start()
+            return cls._default
+
+    def start(self):
+        """启动事件循环线程"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """停止事件循环线程"""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=timeout)
+
+    def in_loop_thread(self) -> bool:
+        """当前是否在事件循环线程中"""
+        return self.thread is threading.current_thread()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """从任意线程提交协程，返回线程安全的Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """从任意线程安排回调在事件循环中执行"""
+        if self.in_loop_thread():
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+class _ReaderProtocol(asyncio.BufferedProtocol):
+    """直接接收到帧重组缓冲区的协议类"""
+
+    def __init__(self, client: 'AsyncSocketClient'):
+        self.client = client
+        self.buffer = None
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=self.client.write_buffer_high)
+        self.client.transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        self.buffer = self.client.frame_assembler.writable()
+        return self.buffer
+
+    def buffer_updated(self, nbytes: int):
+        self.client.last_receive_time = time.monotonic()
+        if self.client.capture:
+            self.client.capture.write(DIRECTION_RX, self.buffer[:nbytes])
+        for frame in self.client.frame_assembler.commit(nbytes):
+            self.client._process_received_data(frame)
+
+    def eof_received(self):
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.client._on_connection_lost(self.transport, exc)
+
+    def pause_writing(self):
+        self.client._can_write.clear()
+
+    def resume_writing(self):
+        self.client._can_write.set()
+        self.client._flush()
+
+
+class AsyncSocketClient(SocketClient):
+    """
+    基于asyncio的Socket客户端，回调在事件循环线程中执行
+
+    发送同样经过按优先级分通道的 SendScheduler：传输层写缓冲区未满时数据立即写出，
+    写缓冲区超过 write_buffer_high 后暂停写出，排队的数据按优先级发送，控制帧优先。
+    已经写入传输层缓冲区的数据无法再调整顺序，因此写缓冲区上限取得较小。
+    """
+
+    write_buffer_high = 4096  # 传输层写缓冲区上限（字节），超过后数据留在优先级队列中
+
+    def __init__(self, host='192.168.1.200', port=2000, engine: Optional[AsyncReaderEngine] = None,
+                 connect_timeout: float = 5.0, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.engine = engine or AsyncReaderEngine.get_default()
+        self.connect_timeout = connect_timeout
+        self.transport = None
+        self._can_write = None
+        self._heartbeat_timer = None
+        self._reconnect_task = None
+
+    def set_heartbeat(self, data: Optional[bytes], interval: float = 0.5, dead_link_timeout: float = 1.5):
+        """
+        设置应用层心跳，已连接时立即生效（由事件循环定时器检查，不占用额外线程）
+
+        Args:
+            data: 心跳帧，None表示关闭心跳
+            interval: 链路空闲多久后发送心跳（秒）
+            dead_link_timeout: 多久未收到任何数据判定链路断开（秒）
+        """
+        super().set_heartbeat(data, interval, dead_link_timeout)
+        if self.is_connected and not self.engine.loop.is_closed():
+            self.engine.call_soon(self._schedule_heartbeat)
+
+    def connect(self) -> bool:
+        """连接服务器（阻塞等待结果，不能在事件循环线程中调用）"""
+        if self.engine.in_loop_thread():
+            raise RuntimeError("不能在事件循环线程中调用阻塞的connect，请使用connect_async")
+        return self.engine.submit(self.connect_async()).result()
+
+    async def connect_async(self) -> bool:
+        """连接服务器"""
+        self._cancel_reconnect()
+        try:
+            await self._open_transport()
+            self._running = True
+
+            if self.connection_callback:
+                self.connection_callback(True, f"成功连接到服务器 {self.host}:{self.port}")
+
+            return True
+
+        except Exception as e:
+            self.is_connected = False
+            error_msg = f"连接失败: {str(e) or type(e).__name__}"
+            if self.connection_callback:
+                self.connection_callback(False, error_msg)
+            if self.error_callback:
+                self.error_callback(error_msg)
+            return False
+
+    async def _open_transport(self):
+        """建立TCP连接并开始发送排队的数据"""
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+        self.frame_assembler.reset()
+        transport, _ = await asyncio.wait_for(
+            self.engine.loop.create_connection(lambda: _ReaderProtocol(self), self.host, self.port),
+            timeout=self.connect_timeout
+        )
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            configure_keepalive(sock, self.keepalive_idle, self.keepalive_interval,
+                                self.keepalive_count, self.tcp_user_timeout)
+        self.is_connected = True
+        self.last_receive_time = time.monotonic()
+        self._schedule_heartbeat()
+        self._flush()
+
+    def disconnect(self):
+        """断开连接（手动断开，不会自动重连）"""
+        self._running = False
+        self.is_connected = False
+        transport = self.transport
+        self.transport = None
+        if not self.engine.loop.is_closed():
+            self.engine.call_soon(self._cancel_reconnect)
+            if transport:
+                self.engine.call_soon(transport.close)
+
+    def send_data(self, data: dict or str or bytes, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        发送数据（任意线程调用，重连期间数据保留在队列中，连接恢复后发送）
+
+        Args:
+            data: 待发送的数据
+            priority: 发送通道优先级，写缓冲区已满时 PRIORITY_CONTROL 的数据最先写出
+
+        Returns:
+            是否成功加入队列
+        """
+        if not (self.is_connected or self.reconnecting):
+            return False
+        if not self.send_queue.put(data, priority):
+            return False
+        if self.is_connected:
+            self.engine.call_soon(self._flush)
+        return True
+
+    async def send_async(self, data: dict or str or bytes, priority: int = PRIORITY_NORMAL) -> bool:
+        """发送数据并在写缓冲区过满时等待（需在事件循环中await）"""
+        if not self.send_data(data, priority):
+            return False
+        if self.is_connected:
+            await self._can_write.wait()
+        return True
+
+    def _flush(self):
+        """在事件循环线程中按优先级写出排队的数据，直到队列为空或写缓冲区已满"""
+        while self.transport and not self.transport.is_closing() and self._can_write.is_set():
+            item = self.send_queue.get(timeout=0)
+            if item is None:
+                return
+            _, enqueue_time, data = item
+            if not data:
+                continue
+            if self.command_ttl is not None and time.monotonic_ns() - enqueue_time > self.command_ttl * 1e9:
+                # 指令已过期（例如重连时间过长），不再发送
+                self.expired_commands += 1
+                self.send_queue.mark_expired(item)
+                continue
+            self._write(self._encode_data(data))
+            self.send_queue.mark_sent(item)
+
+    def _write(self, data: bytes):
+        """在事件循环线程中写出数据"""
+        if self.transport and not self.transport.is_closing():
+            self.transport.write(data)
+            if self.capture:
+                self.capture.write(DIRECTION_TX, data)
+
+    def _on_connection_lost(self, transport, exc: Optional[Exception]):
+        """连接断开，非手动断开时按指数退避自动重连"""
+        if self.transport is not None and self.transport is not transport:
+            # 已经建立了新的连接
+            return
+        if exc and self.is_connected and self.error_callback:
+            self.error_callback(f"接收数据错误: {exc}")
+
+        self.is_connected = False
+        self.transport = None
+        self._cancel_heartbeat()
+        if not (self._running and self.auto_reconnect):
+            self._running = False
+            if self.connection_callback:
+                self.connection_callback(False, "与服务器连接断开")
+            return
+
+        self._outage_start = time.monotonic()
+        self.reconnecting = True
+        if self.connection_callback:
+            self.connection_callback(False, "与服务器连接断开，正在自动重连")
+        self._reconnect_task = self.engine.loop.create_task(self._reconnect_async())
+
+    async def _reconnect_async(self):
+        """按指数退避（带随机抖动）重连，直到成功或被手动断开"""
+        attempt = 0
+        try:
+            while self._running:
+                delay = min(self.reconnect_max_delay, self.reconnect_min_delay * (2 ** attempt))
+                # 抖动：在[delay/2, delay]之间随机，避免多个客户端同时重连
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+                if not self._running:
+                    break
+
+                attempt += 1
+                self.reconnect_attempts += 1
+                try:
+                    await self._open_transport()
+                except Exception as e:
+                    print(f"重连失败（第{attempt}次）: {e}")
+                    continue
+
+                self.reconnecting = False
+                self.reconnect_count += 1
+                self.last_outage_time = time.monotonic() - self._outage_start
+                self.total_outage_time += self.last_outage_time
+                if self.connection_callback:
+                    self.connection_callback(True, f"重新连接到服务器 {self.host}:{self.port}，"
+                                                   f"中断{self.last_outage_time:.1f}秒")
+                return
+        finally:
+            self.reconnecting = False
+            self._reconnect_task = None
+
+    def _cancel_reconnect(self):
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+            self.reconnecting = False
+
+    def _schedule_heartbeat(self):
+        """（重新）安排心跳检查定时器，需在事件循环线程中调用"""
+        self._cancel_heartbeat()
+        if self.heartbeat_data is not None and self.transport is not None:
+            self._heartbeat_timer = self.engine.loop.call_later(self._receive_timeout(), self._heartbeat_tick)
+
+    def _cancel_heartbeat(self):
+        if self._heartbeat_timer is not None:
+            self._heartbeat_timer.cancel()
+            self._heartbeat_timer = None
+
+    def _heartbeat_tick(self):
+        """链路空闲时发送心跳，超过断链判定时间仍无数据则中止连接（随后进入connection_lost）"""
+        self._heartbeat_timer = None
+        transport = self.transport
+        if self.heartbeat_data is None or transport is None or transport.is_closing():
+            return
+        now = time.monotonic()
+        idle = now - self.last_receive_time
+        if idle >= self.dead_link_timeout:
+            self.dead_links_detected += 1
+            if self.error_callback:
+                self.error_callback(f"链路无响应超过{idle:.1f}秒，判定连接已断开")
+            transport.abort()
+            return
+        if idle >= self.heartbeat_interval and now - self._last_heartbeat_time >= self.heartbeat_interval:
+            self._last_heartbeat_time = now
+            self.heartbeats_sent += 1
+            self.send_data(self.heartbeat_data, PRIORITY_CONTROL)
+        self._schedule_heartbeat()
@@ -0,0 +1,261 @@
+# storage_benchmark.py
+"""
+标签解析与存储模块的基准测试
+测试数据由读写器模拟器的 TagPopulation 生成，生产模块本身不依赖模拟器。
+
+用法:
+    python benchmarks/storage_benchmark.py              # 运行全部测试
+    python benchmarks/storage_benchmark.py tag_store tag_log
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reader_simulator import TagPopulation
+from reported_filter import ReportedFilter
+from rfid_tag import RFIDTag
+from tag_batch import decode_inventory
+from tag_event_store import TagEventStore
+from tag_log import TagLogWriter, TagLogReader, record_frame
+from tag_store import TagSessionStore, TagReadAggregator
+
+
+def _frames(count: int, tag_count: Optional[int] = None, duplicate_ratio: float = 0.0) -> List[bytes]:
+    """生成count个盘存帧（固定随机种子，结果可重复）"""
+    population = TagPopulation(tag_count=tag_count or count, duplicate_ratio=duplicate_ratio, seed=1)
+    return [population.next_frame() for _ in range(count)]
+
+
+def _tags(count: int) -> List[RFIDTag]:
+    """生成count个不同的已解析标签"""
+    tags = []
+    for frame in _frames(count):
+        tag = RFIDTag()
+        tag.from_bytes(frame)
+        tags.append(tag)
+    return tags
+
+
+def bench_rfid_tag(count: int = 10000):
+    """对比保留原始帧的紧凑标签与逐字段格式化的内存占用（模拟 max_history_size = 10000 的历史记录）"""
+    frames = _frames(count)
+
+    tracemalloc.start()
+    tags = []
+    for frame in frames:
+        tag = RFIDTag()
+        tag.from_bytes(frame)
+        tags.append(tag)
+    compact = tracemalloc.get_traced_memory()[0]
+    for tag in tags:
+        tag.to_dict()  # 触发全部延迟字段
+    expanded = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{count}个标签: 仅解析 {compact / count:.0f} 字节/个，"
+          f"全部字段展开后 {expanded / count:.0f} 字节/个")
+
+
+def bench_tag_batch(count: int = 10000, rounds: int = 5, population: Optional[int] = 500):
+    """批量解码与逐帧 RFIDTag.from_bytes 的对比"""
+    frames = _frames(count, tag_count=population, duplicate_ratio=0.9)
+    buffer = b''.join(frames)
+
+    def best(func):
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - started)
+        return min(timings), result
+
+    def per_frame():
+        parsed = []
+        for frame in frames:
+            tag = RFIDTag()
+            tag.from_bytes(frame)
+            parsed.append(tag)
+        return parsed
+
+    t_single, parsed = best(per_frame)
+    t_batch, batch = best(lambda: decode_inventory(buffer))
+    t_checked, _ = best(lambda: decode_inventory(buffer, verify_checksum=True))
+    t_unique, unique_tags = best(lambda: [batch.tag(i) for i in decode_inventory(buffer).unique_tid_indices()])
+
+    # 结果一致性检查
+    for index in (0, count // 2, count - 1):
+        assert parsed[index].tid == batch.tid_at(index).hex().upper()
+        assert parsed[index].rssi == batch.rssi_dbm(index)
+        assert parsed[index].antenna_num == batch.antenna[index]
+    assert batch.valid_count == count
+
+    print(f"{count}帧，取{rounds}次最好成绩:")
+    print(f"  逐帧 RFIDTag.from_bytes:      {t_single * 1000:8.2f} ms  ({count / t_single:,.0f} 帧/秒)")
+    print(f"  批量解码:                     {t_batch * 1000:8.2f} ms  ({count / t_batch:,.0f} 帧/秒)")
+    print(f"  批量解码+校验:                {t_checked * 1000:8.2f} ms")
+    print(f"  批量解码+去重后构造{len(unique_tags)}个标签: {t_unique * 1000:8.2f} ms")
+
+
+def bench_tag_store(count: int = 200000, writers: int = 2, seal_interval: float = 0.005):
+    """并发测试：多个线程持续插入（含重复读取），另一线程周期性封存；检查不丢失、不重复计数并统计锁争用"""
+    tags = _tags(count)
+    store = TagSessionStore(max_size=count, aggregator=TagReadAggregator())
+    sealed_passes = []
+    done = threading.Event()
+
+    def writer(offset):
+        # 每个线程负责一半标签，每个标签读两次（第二次为重复读取）
+        part = tags[offset::writers]
+        for tag in part:
+            store.add(tag)
+            store.add(tag)
+
+    def sealer():
+        while not done.is_set():
+            time.sleep(seal_interval)
+            sealed_passes.append(store.seal())
+
+    sealer_thread = threading.Thread(target=sealer)
+    writer_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    sealer_thread.start()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    sealer_thread.join()
+    sealed_passes.append(store.seal())
+
+    counted = [tag.tid_bytes for sealed in sealed_passes for tag, _ in sealed]
+    unique = len(set(counted))
+    stats = store.get_stats()
+    print(f"{writers}个线程插入{count * 2}次，封存{len(sealed_passes)}次，耗时{elapsed:.2f}秒"
+          f"（{count * 2 / elapsed:,.0f} 次/秒）")
+    print(f"计数标签{len(counted)}个，不同TID{unique}个（同一标签被封存前后的两次读取各计一次属正常）")
+    print(f"锁统计: 获取{stats['lock_acquisitions']}次，争用{stats['lock_contended']}次，"
+          f"累计等待{stats['lock_wait_ms']}ms，最长等待{stats['lock_max_wait_us']}us")
+    assert unique == count, "有标签在封存时丢失"
+    assert len(counted) <= count * 2
+
+
+def bench_tag_event_store(count: int = 50000):
+    """吞吐量测试：热路径入队耗时与写线程落盘速度"""
+    tags = _tags(count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = TagEventStore(os.path.join(directory, 'events.db'))
+        store.start()
+        pass_id = store.begin_pass('inbound')
+        started = time.perf_counter()
+        for tag in tags:
+            store.record_read(tag, pass_id)
+        enqueue_time = time.perf_counter() - started
+        store.end_pass(pass_id, count)
+        store.close(timeout=60)
+        total_time = time.perf_counter() - started
+
+        print(f"{count}条读取: 入队 {enqueue_time / count * 1e6:.2f} us/条，"
+              f"落盘完成 {total_time:.2f} 秒（{count / total_time:,.0f} 条/秒）")
+        print(f"统计: {store.get_stats()}")
+        print(f"按TID查询: {store.query_reads(tid=tags[123].tid)}")
+        print(f"过门记录: {store.query_passes()}")
+
+
+def bench_tag_log(count: int = 200000):
+    """写入吞吐量（持续写入速度需高于读写器线速）和范围扫描测试"""
+    tags = _tags(1000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, 'reads')
+        writer = TagLogWriter(prefix, max_segment_bytes=2 * 1024 * 1024, max_segments=0)
+        writer.start()
+        started = time.perf_counter()
+        base_ns = time.time_ns()
+        for i in range(count):
+            tag = tags[i % 1000]
+            writer.append(tag.raw[19:31], tag.raw[7:19], int(tag.rssi * 10), tag.antenna_num,
+                          i // 1000, base_ns + i * 1000)
+        append_time = time.perf_counter() - started
+        writer.close()
+        total_time = time.perf_counter() - started
+        print(f"{count}条: 追加 {append_time / count * 1e6:.2f} us/条，"
+              f"落盘完成 {total_time:.2f} 秒（{count / total_time:,.0f} 条/秒）")
+        print(f"统计: {writer.get_stats()}")
+
+        reader = TagLogReader(prefix)
+        middle = base_ns + count // 2 * 1000
+        started = time.perf_counter()
+        window = list(reader.scan(middle, middle + 1000 * 1000))
+        scan_time = time.perf_counter() - started
+        assert len(window) == 1000 and window[0].timestamp_ns == middle
+        print(f"范围扫描1000条: {scan_time * 1000:.2f} ms")
+        started = time.perf_counter()
+        total = sum(1 for _ in reader.scan())
+        print(f"全量扫描{total}条: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        replayed = RFIDTag()
+        assert replayed.from_bytes(record_frame(window[0])) and replayed.tid == window[0].tid.hex().upper()
+
+
+def bench_reported_filter(count: int = 200000):
+    """查询速度测试：count个已上报标签，再查询同样数量的未上报标签"""
+    with tempfile.TemporaryDirectory() as directory:
+        reported = ReportedFilter(directory, expected_per_day=count)
+        tids = [i.to_bytes(12, 'big') for i in range(count)]
+        started = time.perf_counter()
+        for i in range(0, count, 1000):
+            reported.mark_reported(tids[i:i + 1000], 'inbound')
+        insert_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        hits = sum(reported.seen(tid, 'inbound') for tid in tids[:10000])
+        hit_time = time.perf_counter() - started
+
+        fresh = [(count + i).to_bytes(12, 'big') for i in range(count)]
+        started = time.perf_counter()
+        misses = sum(reported.seen(tid, 'inbound') for tid in fresh)
+        miss_time = time.perf_counter() - started
+        stats = reported.get_stats()
+        reported.close()
+
+        print(f"写入{count}个: {insert_time / count * 1e6:.1f} us/个")
+        print(f"查询已上报: {hit_time / 10000 * 1e6:.1f} us/次，命中{hits}/10000")
+        print(f"查询未上报: {miss_time / count * 1e6:.1f} us/次，误报{misses}，"
+              f"Bloom误判{stats['false_positives']}次")
+        print(f"统计: {stats}")
+
+
+BENCHMARKS = {
+    'rfid_tag': bench_rfid_tag,
+    'tag_batch': bench_tag_batch,
+    'tag_store': bench_tag_store,
+    'tag_event_store': bench_tag_event_store,
+    'tag_log': bench_tag_log,
+    'reported_filter': bench_reported_filter,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='标签解析与存储模块基准测试')
+    parser.add_argument('names', nargs='*', help=f"要运行的测试，默认全部: {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的测试: {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
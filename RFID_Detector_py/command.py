@@ -41,6 +41,9 @@ CMD_RFID_LOOP_STOP = bytes([0xA5, 0x5A, 0x00, 0x08, 0x8C, 0x84, 0x0D, 0x0A])
 CMD_ACK_TYPE_RFID_LOOP_START = 0x83
 CMD_ACK_TYPE_RFID_LOOP_STOP = 0x8D
 
+# 0x83 同时是盘存数据帧的命令字：盘存帧固定53字节（带标签数据），开始盘存的状态应答是短帧
+INVENTORY_FRAME_SIZE = 53
+
 # 指令字典（可选，便于批量操作）
 device_command = {
     'CMD_RFID_LOOP_START': CMD_RFID_LOOP_START,
@@ -53,6 +56,47 @@ device_command_ack = {
     'CMD_ACK_TYPE_RFID_LOOP_STOP': CMD_ACK_TYPE_RFID_LOOP_STOP
 }
 
+# 指令 -> 期望的应答类型（应答帧 data[4]）
+device_command_ack_type = {
+    'CMD_RFID_LOOP_START': CMD_ACK_TYPE_RFID_LOOP_START,
+    'CMD_RFID_LOOP_STOP': CMD_ACK_TYPE_RFID_LOOP_STOP
+}
+
+
+def is_inventory_frame(frame) -> bool:
+    """是否为0x83盘存数据帧（按长度字段区分，开始盘存的短状态应答返回False）"""
+    return (len(frame) >= 5 and frame[4] == CMD_ACK_TYPE_RFID_LOOP_START
+            and ((frame[2] << 8) | frame[3]) == INVENTORY_FRAME_SIZE)
+
+
+def frame_checksum(frame) -> int:
+    """计算帧校验值：长度字段起到校验位之前所有字节的异或"""
+    checksum = 0
+    for b in frame[2:-3]:
+        checksum ^= b
+    return checksum
+
+
+def build_frame(command: int, payload: bytes = b'') -> bytes:
+    """
+    按 A5 5A 协议组帧：帧头 + 总长度(2字节) + 命令字 + 数据 + 校验 + 0D 0A
+
+    Args:
+        command: 命令字
+        payload: 数据部分
+
+    Returns:
+        bytes: 完整帧
+    """
+    frame = bytearray(b'\xA5\x5A')
+    frame += (len(payload) + 8).to_bytes(2, 'big')
+    frame.append(command)
+    frame += payload
+    frame += b'\x00\x0D\x0A'
+    frame[-3] = frame_checksum(frame)
+    return bytes(frame)
+
+
 # 使用示例
 # if __name__ == "__main__":
 #     # 直接使用常量
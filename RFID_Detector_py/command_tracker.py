@@ -0,0 +1,189 @@
+# command_tracker.py
+"""
+指令应答关联模块
+每条需要应答的指令返回一个Future，收到对应类型的应答帧（data[4]）时完成，
+超时后按重试策略重发，全部重试失败则以TimeoutError结束。同一应答类型的多条指令按发送顺序匹配。
+与应答共用命令字的数据帧（如0x83盘存帧）由 ignore 判定后跳过，既不完成指令也不计为未匹配应答。
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Optional
+from latency_histogram import LatencyHistogram
+
+
+class PendingCommand:
+    """等待应答的指令"""
+
+    __slots__ = ('command_name', 'ack_type', 'future', 'timeout', 'max_retries',
+                 'attempts', 'first_sent_ns', 'last_sent_ns', 'deadline')
+
+    def __init__(self, command_name: str, ack_type: int, timeout: float, max_retries: int):
+        self.command_name = command_name
+        self.ack_type = ack_type
+        self.future = Future()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.attempts = 1
+        self.first_sent_ns = self.last_sent_ns = time.monotonic_ns()
+        self.deadline = time.monotonic() + timeout
+
+
+class CommandTracker:
+    """指令应答跟踪器"""
+
+    def __init__(self, resend: Callable[[str], bool], ignore: Optional[Callable[[Any], bool]] = None):
+        """
+        初始化跟踪器
+
+        Args:
+            resend: 重发指令的函数，参数为指令名称，返回是否发送成功
+            ignore: 判定帧不是应答的函数（例如盘存数据帧），None表示所有帧都按应答类型匹配
+        """
+        self.resend = resend
+        self.ignore = ignore
+        self._pending: Dict[int, deque] = {}
+        self._deadlines = []  # (截止时间, 序号, PendingCommand)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._timer_thread = None
+        self.pending_count = 0
+
+        # 统计
+        self.acked = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.unmatched_acks = 0
+        self.rtt = LatencyHistogram()  # 最后一次发送到应答的延迟
+        self.latency = LatencyHistogram()  # 首次发送到应答的延迟（包含重试）
+
+    def track(self, command_name: str, ack_type: int, timeout: float = 1.0, max_retries: int = 2) -> Future:
+        """
+        登记一条已发送的指令
+
+        Args:
+            command_name: 指令名称（重试时用于重发）
+            ack_type: 期望的应答类型
+            timeout: 每次发送等待应答的时间（秒）
+            max_retries: 最多重试次数
+
+        Returns:
+            Future: 收到应答时结果为应答帧（bytes）
+        """
+        pending = PendingCommand(command_name, ack_type, timeout, max_retries)
+        with self._cond:
+            self._pending.setdefault(ack_type, deque()).append(pending)
+            self.pending_count += 1
+            heapq.heappush(self._deadlines, (pending.deadline, next(self._seq), pending))
+            self._ensure_timer()
+            self._cond.notify()
+        return pending.future
+
+    def on_frame(self, frame) -> bool:
+        """
+        处理一个接收到的帧，匹配最早发送的同类型指令
+
+        Args:
+            frame: 完整的 A5 5A 帧
+
+        Returns:
+            bool: 是否匹配到等待中的指令
+        """
+        if not self.pending_count or len(frame) < 5:
+            return False
+        if self.ignore is not None and self.ignore(frame):
+            return False
+
+        with self._cond:
+            queue = self._pending.get(frame[4])
+            if not queue:
+                self.unmatched_acks += 1
+                return False
+            pending = queue.popleft()
+            self.pending_count -= 1
+
+        now = time.monotonic_ns()
+        self.acked += 1
+        self.rtt.record(now - pending.last_sent_ns)
+        self.latency.record(now - pending.first_sent_ns)
+        if not pending.future.done():
+            pending.future.set_result(bytes(frame))
+        return True
+
+    def discard(self, future: Future):
+        """撤销一条登记（例如指令未能发送）"""
+        with self._cond:
+            for queue in self._pending.values():
+                for pending in queue:
+                    if pending.future is future:
+                        queue.remove(pending)
+                        self.pending_count -= 1
+                        return
+
+    def cancel_all(self, reason: str = "连接已断开"):
+        """以ConnectionError结束所有等待中的指令"""
+        with self._cond:
+            pendings = [p for queue in self._pending.values() for p in queue]
+            self._pending.clear()
+            self._deadlines.clear()
+            self.pending_count = 0
+        for pending in pendings:
+            if not pending.future.done():
+                pending.future.set_exception(ConnectionError(reason))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'pending': self.pending_count,
+            'acked': self.acked,
+            'timeouts': self.timeouts,
+            'retries': self.retries,
+            'unmatched_acks': self.unmatched_acks,
+            'rtt_ms': self.rtt.snapshot('ms'),
+            'latency_ms': self.latency.snapshot('ms')
+        }
+
+    def _ensure_timer(self):
+        if self._timer_thread is None or not self._timer_thread.is_alive():
+            self._timer_thread = threading.Thread(target=self._timer_loop, name='command-tracker', daemon=True)
+            self._timer_thread.start()
+
+    def _timer_loop(self):
+        """超时检测线程：等待到最近的截止时间，到期后重发或以超时结束"""
+        while True:
+            with self._cond:
+                while not self._deadlines:
+                    self._cond.wait()
+                deadline, _, pending = self._deadlines[0]
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._deadlines)
+                queue = self._pending.get(pending.ack_type)
+                if queue is None or pending not in queue or pending.deadline != deadline:
+                    # 已应答或已取消
+                    continue
+
+                give_up = pending.attempts > pending.max_retries
+                if give_up:
+                    queue.remove(pending)
+                    self.pending_count -= 1
+                    self.timeouts += 1
+                else:
+                    pending.attempts += 1
+                    pending.last_sent_ns = time.monotonic_ns()
+                    pending.deadline = time.monotonic() + pending.timeout
+                    heapq.heappush(self._deadlines, (pending.deadline, next(self._seq), pending))
+                    self.retries += 1
+
+            # 在锁外完成Future或重发，避免回调中再次进入跟踪器造成死锁
+            if give_up:
+                pending.future.set_exception(
+                    TimeoutError(f"指令 {pending.command_name} 等待应答超时（共发送{pending.attempts}次）"))
+            elif not self.resend(pending.command_name):
+                print(f"重发指令失败: {pending.command_name}")
@@ -0,0 +1,413 @@
+# curtain_simulator.py
+"""
+光栅控制器模拟器
+用伪终端（PTY）代替 /dev/tty.usbserial-1410 上的真实光栅控制器：SerialComm 打开模拟器给出的从端设备路径，
+模拟器在主端应答 FE 02 00 00 00 08 CRC 读取请求（功能码0x01~0x04，CRC正确），
+光栅状态按脚本随时间变化，用于在没有硬件时测试 SerialComm、SerialEngine、SerialBus 和过门状态机。
+
+- 脚本：内置入库/出库路径1、路径2、中断、传感器卡死、光栅抖动等场景，也可以自定义 (持续秒数, 状态) 序列；
+- 故障注入：应答延迟和抖动、按波特率模拟线路传输时间、杂散字节、CRC损坏、丢失应答；
+- 主动上报：设定 push_interval 后不等请求，按周期发送状态帧；
+- 记录每次状态变化的时间，measure() 据此统计从光栅变化到状态机检测到的端到端延迟和采样吞吐量。
+
+用法:
+    python curtain_simulator.py --scenario inbound1,outbound2 --repeat 3
+    python curtain_simulator.py --scenario all --measure --noise-rate 0.05 --response-delay 0.01
+"""
+
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from serial_comm import crc16_modbus
+
+# 场景：(持续秒数, 光栅状态) 序列，状态 0x00无遮挡、0x01光栅1、0x02光栅2、0x03同时遮挡
+SCENARIOS: Dict[str, List[Tuple[float, int]]] = {
+    'inbound1': [(0.5, 0x00), (0.4, 0x01), (0.4, 0x03), (0.4, 0x02), (1.5, 0x00)],  # 入库路径1
+    'inbound2': [(0.5, 0x00), (0.4, 0x01), (0.3, 0x00), (0.4, 0x02), (1.5, 0x00)],  # 入库路径2
+    'outbound1': [(0.5, 0x00), (0.4, 0x02), (0.4, 0x03), (0.4, 0x01), (1.5, 0x00)],  # 出库路径1
+    'outbound2': [(0.5, 0x00), (0.4, 0x02), (0.3, 0x00), (0.4, 0x01), (1.5, 0x00)],  # 出库路径2
+    'abort': [(0.5, 0x00), (0.4, 0x01), (0.4, 0x03), (1.5, 0x00)],  # 中间状态退回
+    'stuck': [(0.5, 0x00), (12.0, 0x01), (1.5, 0x00)],  # 光栅1卡死，触发10秒超时
+    'flicker': [(0.5, 0x00)] + [(0.03, 0x01), (0.03, 0x00)] * 5 + [(1.5, 0x00)],  # 30ms的短暂遮挡
+}
+
+
+def build_script(names: Iterable[str], repeat: int = 1) -> List[Tuple[float, int]]:
+    """
+    按场景名拼接脚本
+
+    Args:
+        names: 场景名列表，'all' 表示除 stuck 以外的全部场景
+        repeat: 重复次数
+
+    Returns:
+        (持续秒数, 状态) 列表
+    """
+    steps = []
+    for name in names:
+        if name == 'all':
+            for key, value in SCENARIOS.items():
+                if key != 'stuck':
+                    steps.extend(value)
+        else:
+            steps.extend(SCENARIOS[name])
+    return steps * repeat
+
+
+class CurtainSimulator:
+    """基于伪终端的光栅控制器模拟器"""
+
+    def __init__(self, script: Optional[List[Tuple[float, int]]] = None, addresses: Iterable[int] = (0xFE,),
+                 baudrate: int = 9600, emulate_line: bool = True, response_delay: float = 0.002,
+                 response_jitter: float = 0.0, noise_rate: float = 0.0, corrupt_rate: float = 0.0,
+                 drop_rate: float = 0.0, push_interval: Optional[float] = None, seed: Optional[int] = None):
+        """
+        初始化模拟器
+
+        Args:
+            script: (持续秒数, 状态) 序列，脚本结束后保持无遮挡；None表示一直无遮挡
+            addresses: 应答的设备地址（模拟RS-485总线上的多个控制器，共用同一脚本）
+            baudrate: 模拟的波特率，用于计算线路传输时间
+            emulate_line: 是否按波特率延迟请求接收和应答发送（伪终端本身没有传输时间）
+            response_delay: 设备处理时间（秒）
+            response_jitter: 处理时间的随机抖动上限（秒）
+            noise_rate: 应答前插入杂散字节的概率
+            corrupt_rate: 应答CRC损坏的概率
+            drop_rate: 不应答的概率
+            push_interval: 主动上报周期（秒），None表示只应答请求
+            seed: 随机种子
+        """
+        self.script = list(script or [])
+        self.addresses = tuple(addresses)
+        self.baudrate = baudrate
+        self.emulate_line = emulate_line
+        self.response_delay = response_delay
+        self.response_jitter = response_jitter
+        self.noise_rate = noise_rate
+        self.corrupt_rate = corrupt_rate
+        self.drop_rate = drop_rate
+        self.push_interval = push_interval
+        self._random = random.Random(seed)
+
+        self.port_name = None
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._running = False
+        self._buffer = bytearray()
+        self._started_ns = 0
+        self._timeline: List[Tuple[int, int]] = []  # (相对开始的ns, 状态)
+        self._cursor = 0
+        self._script_lock = threading.Lock()  # 保护 _started_ns 和 _cursor（restart_script 在调用方线程执行）
+
+        # 统计
+        self.requests = 0
+        self.replies = 0
+        self.pushed = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.noise_bytes = 0
+        self.bad_requests = 0
+        self.ignored = 0  # 其他地址的请求
+
+    @property
+    def duration(self) -> float:
+        """脚本总时长（秒）"""
+        return sum(step for step, _ in self.script)
+
+    def start(self) -> str:
+        """
+        创建伪终端并开始播放脚本
+
+        Returns:
+            str: 供 SerialComm 打开的从端设备路径
+        """
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port_name = os.ttyname(self._slave)
+        self._build_timeline()
+        self._running = True
+        with self._script_lock:
+            self._started_ns = time.monotonic_ns()
+        self._thread = threading.Thread(target=self._run, name='curtain-simulator', daemon=True)
+        self._thread.start()
+        print(f"光栅模拟器已启动: {self.port_name}，地址 {', '.join(f'0x{a:02X}' for a in self.addresses)}，"
+              f"脚本 {self.duration:.1f} 秒")
+        return self.port_name
+
+    def stop(self):
+        """停止模拟器并关闭伪终端"""
+        self._running = False
+        if self._thread:
+            self._thread.join(1.0)
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = self._slave = None
+
+    def restart_script(self):
+        """从头重新播放脚本"""
+        with self._script_lock:
+            self._started_ns = time.monotonic_ns()
+            self._cursor = 0
+
+    def finished(self) -> bool:
+        """脚本是否已播放完"""
+        with self._script_lock:
+            started_ns = self._started_ns
+        return time.monotonic_ns() - started_ns >= int(self.duration * 1e9)
+
+    def status_at(self, now_ns: Optional[int] = None) -> int:
+        """当前光栅状态（时间单调递增，游标只向前移动）"""
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        timeline = self._timeline
+        with self._script_lock:
+            elapsed = now_ns - self._started_ns
+            while self._cursor + 1 < len(timeline) and timeline[self._cursor + 1][0] <= elapsed:
+                self._cursor += 1
+            return timeline[self._cursor][1] if elapsed >= 0 else 0
+
+    def transitions(self) -> List[Tuple[int, int]]:
+        """脚本中每次状态变化的绝对时间（单调时钟ns）和新状态"""
+        result = []
+        previous = 0x00
+        with self._script_lock:
+            started_ns = self._started_ns
+        for offset, status in self._timeline:
+            if status != previous:
+                result.append((started_ns + offset, status))
+                previous = status
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'requests': self.requests,
+            'replies': self.replies,
+            'pushed': self.pushed,
+            'dropped': self.dropped,
+            'corrupted': self.corrupted,
+            'noise_bytes': self.noise_bytes,
+            'bad_requests': self.bad_requests,
+            'ignored': self.ignored
+        }
+
+    def _build_timeline(self):
+        timeline = [(0, 0x00)]
+        offset = 0
+        for seconds, status in self.script:
+            timeline.append((offset, status))
+            offset += int(seconds * 1e9)
+        timeline.append((offset, 0x00))
+        self._timeline = timeline
+        self._cursor = 0
+
+    def _line_delay(self, size: int):
+        if self.emulate_line:
+            time.sleep(size * 10 / self.baudrate)
+
+    def _run(self):
+        next_push = time.monotonic() + (self.push_interval or 0)
+        while self._running:
+            wait = max(0.0, next_push - time.monotonic()) if self.push_interval else 0.1
+            try:
+                ready, _, _ = select.select([self._master], [], [], wait)
+                if ready:
+                    self._buffer += os.read(self._master, 256)
+                    self._process_requests()
+                if self.push_interval and time.monotonic() >= next_push:
+                    next_push += self.push_interval
+                    self._send(self._reply(self.addresses[0], 0x02, 8), pushed=True)
+            except OSError:
+                break
+
+    def _process_requests(self):
+        """按8字节请求帧解析，CRC不对时后移一个字节重新同步"""
+        buffer = self._buffer
+        while len(buffer) >= 8:
+            if crc16_modbus(buffer[:8]) != 0:
+                self.bad_requests += 1
+                del buffer[:1]
+                continue
+            request = bytes(buffer[:8])
+            del buffer[:8]
+            self.requests += 1
+            self._line_delay(len(request))
+            address, function = request[0], request[1]
+            if address not in self.addresses:
+                self.ignored += 1
+                continue
+            quantity = (request[4] << 8) | request[5]
+            delay = self.response_delay + self._random.uniform(0, self.response_jitter)
+            if delay > 0:
+                time.sleep(delay)
+            if self._random.random() < self.drop_rate:
+                self.dropped += 1
+                continue
+            self._send(self._reply(address, function, quantity))
+
+    def _reply(self, address: int, function: int, quantity: int) -> bytes:
+        """组装应答：读线圈/离散输入每个字节都是当前状态，读寄存器每个寄存器低字节为当前状态"""
+        status = self.status_at()
+        if function in (0x01, 0x02):
+            data = bytes((status,)) * ((quantity + 7) // 8)
+        elif function in (0x03, 0x04):
+            data = bytes((0x00, status)) * quantity
+        else:
+            frame = bytes((address, function | 0x80, 0x01))  # 非法功能码
+            crc = crc16_modbus(frame)
+            return frame + bytes((crc & 0xFF, crc >> 8))
+        frame = bytes((address, function, len(data))) + data
+        crc = crc16_modbus(frame)
+        return frame + bytes((crc & 0xFF, crc >> 8))
+
+    def _send(self, reply: bytes, pushed: bool = False):
+        if self._random.random() < self.corrupt_rate:
+            damaged = bytearray(reply)
+            damaged[-1] ^= 0x5A
+            reply = bytes(damaged)
+            self.corrupted += 1
+        if self._random.random() < self.noise_rate:
+            noise = bytes(self._random.choice([b for b in range(256) if b not in self.addresses])
+                          for _ in range(self._random.randint(1, 3)))
+            reply = noise + reply
+            self.noise_bytes += len(noise)
+        self._line_delay(len(reply))
+        os.write(self._master, reply)
+        if pushed:
+            self.pushed += 1
+        else:
+            self.replies += 1
+
+
+def measure(simulator: CurtainSimulator, poll_interval: float = 0.02, push_mode: bool = False) -> Dict[str, Any]:
+    """
+    端到端测试：SerialComm + SerialEngine + GateFSM 连接模拟器，播放完整脚本，
+    统计每次光栅变化到状态机收到对应样本的延迟，以及过门事件和采样吞吐量
+
+    Args:
+        simulator: 已启动的模拟器
+        poll_interval: 采样周期（秒）
+        push_mode: 模拟器主动上报时为True
+
+    Returns:
+        统计字典
+    """
+    from latency_histogram import LatencyHistogram
+    from gate_fsm import GateFSM
+    from serial_comm import SerialComm
+    from serial_engine import SerialEngine
+
+    comm = SerialComm(simulator.port_name, simulator.baudrate, address=simulator.addresses[0])
+    if not comm.open():
+        raise RuntimeError("无法打开模拟器串口")
+    engine = SerialEngine(comm, 0x02, poll_interval=poll_interval, push_mode=push_mode,
+                          push_interval=simulator.push_interval)
+    fsm = GateFSM()
+    simulator.restart_script()
+    engine.start()
+    samples = []
+    deadline = time.monotonic() + simulator.duration + 0.5
+    while time.monotonic() < deadline:
+        sample = engine.get_sample(timeout=0.05)
+        if sample is None:
+            fsm.tick()
+            continue
+        samples.append((sample.timestamp_ns, sample.value))
+        fsm.feed(sample.value, sample.timestamp_ns)
+    engine.stop()
+    comm.close()
+
+    # 每次脚本变化后第一个反映新状态的样本即为检测时刻；下一次变化前都没采到则记为漏检
+    detection = LatencyHistogram()
+    missed = 0
+    changes = simulator.transitions()
+    index = 0
+    for number, (changed_ns, status) in enumerate(changes):
+        until_ns = changes[number + 1][0] if number + 1 < len(changes) else float('inf')
+        while index < len(samples) and samples[index][0] < changed_ns:
+            index += 1
+        probe = index
+        while probe < len(samples) and samples[probe][0] < until_ns and samples[probe][1] != status:
+            probe += 1
+        if probe < len(samples) and samples[probe][0] < until_ns:
+            detection.record(samples[probe][0] - changed_ns)
+        else:
+            missed += 1
+
+    events = []
+    while not fsm.events.empty():
+        event = fsm.events.get_nowait()
+        events.append((event.kind, event.direction))
+    elapsed = simulator.duration + 0.5
+    return {
+        'transitions': len(changes),
+        'missed_transitions': missed,
+        'detection_ms': detection.snapshot('ms'),
+        'samples_per_second': round(len(samples) / elapsed, 1),
+        'events': events,
+        'engine': engine.get_stats(),
+        'simulator': simulator.get_stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='光栅控制器模拟器（伪终端）')
+    parser.add_argument('--scenario', default='inbound1', help=f"场景，逗号分隔: {', '.join(SCENARIOS)}, all")
+    parser.add_argument('--repeat', type=int, default=1, help='脚本重复次数')
+    parser.add_argument('--address', action='append', type=lambda text: int(text, 0), help='设备地址，可重复')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--no-line-delay', action='store_true', help='不模拟线路传输时间')
+    parser.add_argument('--response-delay', type=float, default=0.002, help='设备处理时间（秒）')
+    parser.add_argument('--response-jitter', type=float, default=0.0, help='处理时间抖动（秒）')
+    parser.add_argument('--noise-rate', type=float, default=0.0, help='杂散字节概率')
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help='CRC损坏概率')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='丢失应答概率')
+    parser.add_argument('--push-interval', type=float, default=None, help='主动上报周期（秒）')
+    parser.add_argument('--poll-interval', type=float, default=0.02, help='measure模式的采样周期（秒）')
+    parser.add_argument('--measure', action='store_true', help='播放脚本并测量端到端检测延迟')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    args = parser.parse_args()
+
+    simulator = CurtainSimulator(build_script(args.scenario.split(','), args.repeat),
+                                 addresses=args.address or (0xFE,), baudrate=args.baudrate,
+                                 emulate_line=not args.no_line_delay, response_delay=args.response_delay,
+                                 response_jitter=args.response_jitter, noise_rate=args.noise_rate,
+                                 corrupt_rate=args.corrupt_rate, drop_rate=args.drop_rate,
+                                 push_interval=args.push_interval, seed=args.seed)
+    simulator.start()
+    try:
+        if args.measure:
+            result = measure(simulator, args.poll_interval, push_mode=args.push_interval is not None)
+            detection = result['detection_ms']
+            print(f"光栅变化{result['transitions']}次，漏检{result['missed_transitions']}次，"
+                  f"检测延迟 p50={detection['p50']}ms p99={detection['p99']}ms max={detection['max']}ms")
+            print(f"采样 {result['samples_per_second']}/秒，过门事件: {result['events']}")
+            print(f"引擎统计: missed={result['engine']['missed']} crc_errors={result['engine']['crc_errors']} "
+                  f"discarded_bytes={result['engine']['discarded_bytes']}")
+            print(f"模拟器统计: {result['simulator']}")
+        else:
+            print(f"请将 SerialComm 的串口设置为 {simulator.port_name}，Ctrl+C 退出")
+            while True:
+                time.sleep(1)
+                if simulator.finished():
+                    simulator.restart_script()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
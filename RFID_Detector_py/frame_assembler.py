@@ -0,0 +1,254 @@
+# frame_assembler.py
+"""
+A5 5A 协议帧重组模块
+TCP是字节流，读写器的多个应答帧可能被合并到一次recv中，一个帧也可能被拆分到多次recv中。
+本模块在预分配缓冲区上增量重组完整帧：按 A5 5A 同步帧头，按长度字段(data[2:4])截取，
+校验 0D 0A 帧尾，并以零拷贝的memoryview形式输出完整帧。
+以 '{' 或 '[' 开头的文本段（JSON消息）在括号配平（忽略字符串内的括号）后才原样输出，由上层分发器识别；
+被拆分到多次recv中的文本段等待后续数据，遇到二进制字节或超过最大长度时按无效数据丢弃。
+"""
+
+from typing import Dict, Iterator
+
+FRAME_HEADER = b'\xA5\x5A'
+FRAME_TRAILER = b'\x0D\x0A'
+FRAME_MIN_SIZE = 8  # 帧头2 + 长度2 + 命令1 + 校验1 + 帧尾2
+FRAME_MAX_SIZE = 1024
+TEXT_MAX_SIZE = 16 * 1024
+TEXT_LEADING_BYTES = (0x7B, 0x5B)  # '{' 和 '['
+TEXT_WHITESPACE = (0x20, 0x09, 0x0A, 0x0D)
+
+_TEXT_INCOMPLETE = -1
+_TEXT_INVALID = -2
+
+
+class FrameAssembler:
+    """A5 5A 协议增量帧重组器"""
+
+    def __init__(self, capacity: int = 64 * 1024, max_frame_size: int = FRAME_MAX_SIZE,
+                 text_segments: bool = True, max_text_size: int = TEXT_MAX_SIZE):
+        """
+        初始化帧重组器
+
+        Args:
+            capacity: 预分配缓冲区大小（字节）
+            max_frame_size: 允许的最大帧长度，超过视为长度字段错误
+            text_segments: 是否输出以 '{' / '[' 开头的文本段，False时按无效数据丢弃
+            max_text_size: 文本段最大长度，超过仍未配平时丢弃
+        """
+        if capacity < max_frame_size * 2:
+            raise ValueError("缓冲区大小至少需要为最大帧长度的2倍")
+        if text_segments and capacity < max_text_size + max_frame_size:
+            raise ValueError("缓冲区大小至少需要为最大文本长度加最大帧长度")
+
+        self.capacity = capacity
+        self.max_frame_size = max_frame_size
+        self.text_segments = text_segments
+        self.max_text_size = max_text_size
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # 未解析数据的起始位置
+        self._start_after_text = False  # 上一个输出的是文本段，紧随的空白字符作为分隔符跳过
+        self._end = 0  # 已写入数据的结束位置
+
+        # 统计计数
+        self.bytes_received = 0
+        self.frames = 0
+        self.text_frames = 0
+        self.resyncs = 0
+        self.garbage_bytes = 0
+
+    def writable(self, min_size: int = 0) -> memoryview:
+        """
+        获取可写入区域，供 socket.recv_into 直接写入
+
+        注意：调用本方法可能会移动缓冲区中的剩余数据，之前输出的帧视图随之失效。
+
+        Args:
+            min_size: 至少需要的可写空间，0表示使用默认值（最大帧长度）
+
+        Returns:
+            memoryview: 缓冲区尾部的可写视图
+        """
+        min_size = min_size or self.max_frame_size
+        if self.capacity - self._end < min_size:
+            self._compact()
+        return self._view[self._end:]
+
+    def commit(self, size: int) -> Iterator[memoryview]:
+        """
+        确认已写入 size 字节，并返回本次可以解析出的完整帧
+
+        Args:
+            size: recv_into 实际写入的字节数
+
+        Returns:
+            完整帧的memoryview迭代器（仅在下一次写入前有效）
+        """
+        self._end += size
+        self.bytes_received += size
+        return self._frames()
+
+    def feed(self, data: bytes) -> Iterator[memoryview]:
+        """
+        复制一段数据到缓冲区并返回完整帧（用于非socket数据源）
+
+        Args:
+            data: 接收到的原始数据
+
+        Returns:
+            完整帧的memoryview迭代器
+        """
+        data = memoryview(data)
+        offset = 0
+        while offset < len(data):
+            target = self.writable()
+            size = min(len(target), len(data) - offset)
+            target[:size] = data[offset:offset + size]
+            offset += size
+            yield from self.commit(size)
+
+    def reset(self):
+        """丢弃缓冲区中所有未解析的数据（重新连接时调用）"""
+        self._start = 0
+        self._end = 0
+        self._start_after_text = False
+
+    def pending(self) -> int:
+        """缓冲区中尚未组成完整帧的字节数"""
+        return self._end - self._start
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取统计信息"""
+        return {
+            'bytes_received': self.bytes_received,
+            'frames': self.frames,
+            'text_frames': self.text_frames,
+            'resyncs': self.resyncs,
+            'garbage_bytes': self.garbage_bytes,
+            'pending_bytes': self.pending()
+        }
+
+    def _frames(self) -> Iterator[memoryview]:
+        """从缓冲区中解析完整帧"""
+        buffer = self._buffer
+        while self._end - self._start >= 2:
+            start = self._start
+
+            # 同步帧头
+            if buffer[start] != 0xA5 or buffer[start + 1] != 0x5A:
+                if buffer[start] in TEXT_WHITESPACE and self._start_after_text:
+                    # 文本段之后的换行等分隔符
+                    self._start += 1
+                    continue
+                if self.text_segments and buffer[start] in TEXT_LEADING_BYTES:
+                    end = self._text_end(start)
+                    if end == _TEXT_INCOMPLETE:
+                        return
+                    if end >= 0:
+                        self._start = end
+                        self._start_after_text = True
+                        self.text_frames += 1
+                        yield self._view[start:end]
+                        continue
+                    # 不是文本段（二进制数据中的 '{' / '['），按无效数据跳过
+
+                self._start_after_text = False
+                header = buffer.find(FRAME_HEADER, start + 1, self._end)
+                if self.text_segments:
+                    # 无效数据之后也可能紧跟着文本段
+                    for leading in (b'{', b'['):
+                        text = buffer.find(leading, start + 1, header if header >= 0 else self._end)
+                        if text >= 0:
+                            header = text
+                if header < 0:
+                    # 保留最后一个字节，它可能是被拆分的帧头的第一个字节
+                    keep = 1 if buffer[self._end - 1] == 0xA5 else 0
+                    self._discard(self._end - keep - start)
+                    return
+                self._discard(header - start)
+                continue
+
+            if self._end - start < FRAME_MIN_SIZE:
+                # 帧头后的长度字段尚未收全
+                return
+
+            length = (buffer[start + 2] << 8) | buffer[start + 3]
+            if length < FRAME_MIN_SIZE or length > self.max_frame_size:
+                # 长度字段非法，跳过当前帧头重新同步
+                self._discard(1)
+                continue
+
+            if self._end - start < length:
+                # 帧不完整，等待更多数据
+                return
+
+            end = start + length
+            if buffer[end - 2] != 0x0D or buffer[end - 1] != 0x0A:
+                # 帧尾错误，跳过当前帧头重新同步
+                self._discard(1)
+                continue
+
+            self._start = end
+            self._start_after_text = False
+            self.frames += 1
+            yield self._view[start:end]
+
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def _text_end(self, start: int) -> int:
+        """
+        查找从 start 开始的JSON文本段的结束位置：括号配平即结束，字符串内的括号和转义字符不计
+
+        Returns:
+            int: 结束位置（不含）；_TEXT_INCOMPLETE 表示需要更多数据；
+                 _TEXT_INVALID 表示出现了JSON中不可能出现的字节（控制字符、帧头）或超过最大长度
+        """
+        buffer = self._buffer
+        limit = min(self._end, start + self.max_text_size)
+        depth = 0
+        in_string = False
+        escape = False
+        for index in range(start, limit):
+            byte = buffer[index]
+            if byte < 0x20 and byte not in TEXT_WHITESPACE:
+                return _TEXT_INVALID
+            if in_string:
+                if escape:
+                    escape = False
+                elif byte == 0x5C:  # '\\'
+                    escape = True
+                elif byte == 0x22:  # '"'
+                    in_string = False
+                elif byte < 0x20:
+                    return _TEXT_INVALID  # 字符串内不允许未转义的控制字符
+            elif byte == 0x22:
+                in_string = True
+            elif byte == 0x7B or byte == 0x5B:
+                depth += 1
+            elif byte == 0x7D or byte == 0x5D:
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+            elif byte == 0xA5 and index + 1 < self._end and buffer[index + 1] == 0x5A:
+                return _TEXT_INVALID
+        if limit - start >= self.max_text_size:
+            return _TEXT_INVALID
+        return _TEXT_INCOMPLETE
+
+    def _discard(self, size: int):
+        """丢弃 size 字节的无效数据并计数"""
+        if size <= 0:
+            return
+        self._start += size
+        self.resyncs += 1
+        self.garbage_bytes += size
+
+    def _compact(self):
+        """将未解析的数据移动到缓冲区开头"""
+        remaining = self._end - self._start
+        if remaining and self._start:
+            self._view[:remaining] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = remaining
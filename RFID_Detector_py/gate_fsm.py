@@ -0,0 +1,285 @@
+# gate_fsm.py
+"""
+光栅过门状态机
+把原来 read_loop 中约200行嵌套if的过门判断整理成声明式的转换表：
+输入带时间戳的光栅状态样本（0x00无遮挡、0x01光栅1遮挡、0x02光栅2遮挡、0x03同时遮挡），
+输出过门事件（开始、完成、中断、超时）到队列，由调用方在其他线程中启动/停止盘存和上报，
+状态机本身不做任何IO，也不读取系统时间，可以用记录的样本离线回放。
+
+规则与原实现一致：
+- 入库：光栅1 → (路径1: 1+2同时遮挡 → 光栅2 | 路径2: 无遮挡或直接光栅2) → 无遮挡，完成；出库方向相反；
+- 中间状态检测到无遮挡、结束状态又回到起始光栅：中断，停止盘存，不清空标签记录；
+- 完成时两次上报间隔不足 report_cooldown 则跳过上报；
+- 非空闲状态超过 idle_timeout 光栅状态无变化：超时，停止盘存并清空本次标签记录；
+- 转换后仍处于开始/中间状态却检测到无遮挡（异常中断）：中断并清空本次标签记录。
+"""
+
+import queue
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# 状态
+STATE_IDLE = 0  # 空闲状态
+STATE_INBOUND_START = 1  # 入库开始（光栅1遮挡）
+STATE_INBOUND_MIDDLE = 2  # 入库中间（光栅1+2同时遮挡）
+STATE_INBOUND_END = 3  # 入库结束（光栅2遮挡）
+STATE_OUTBOUND_START = 4  # 出库开始（光栅2遮挡）
+STATE_OUTBOUND_MIDDLE = 5  # 出库中间（光栅1+2同时遮挡）
+STATE_OUTBOUND_END = 6  # 出库结束（光栅1遮挡）
+
+# 方向（与 RFIDProductionSystem.direction 一致）
+DIRECTION_NONE = 0
+DIRECTION_INBOUND = 1
+DIRECTION_OUTBOUND = 2
+
+# 光栅状态
+CURTAIN_CLEAR = 0x00
+CURTAIN_1 = 0x01
+CURTAIN_2 = 0x02
+CURTAIN_BOTH = 0x03
+
+# 事件
+EVENT_START = 'start'  # 开始过门，启动盘存
+EVENT_COMPLETE = 'complete'  # 过门完成，停止盘存，report为True时上报
+EVENT_ABORT = 'abort'  # 过门中断，停止盘存，clear为True时清空本次标签记录
+EVENT_TIMEOUT = 'timeout'  # 超时，停止盘存并清空本次标签记录
+
+# 转换动作
+_MOVE = None
+_START = EVENT_START
+_COMPLETE = EVENT_COMPLETE
+_ABORT = EVENT_ABORT
+
+
+class GateEvent(NamedTuple):
+    """过门事件"""
+    kind: str  # EVENT_*
+    direction: int  # DIRECTION_*
+    timestamp_ns: int  # 触发事件的样本时间（单调时钟ns）
+    state: int  # 触发前的状态
+    message: str = ''
+    report: bool = False  # 完成事件：是否需要上报（未处于冷却期）
+    clear: bool = False  # 中断/超时事件：是否清空本次标签记录
+
+
+# 转换表：(当前状态, 光栅状态) -> (下一状态, 动作, 说明)，表中没有的组合保持当前状态
+TRANSITIONS: Dict[Tuple[int, int], Tuple[int, Optional[str], str]] = {
+    (STATE_IDLE, CURTAIN_1): (STATE_INBOUND_START, _START, "入库开始：光栅1遮挡"),
+    (STATE_IDLE, CURTAIN_2): (STATE_OUTBOUND_START, _START, "出库开始：光栅2遮挡"),
+
+    (STATE_INBOUND_START, CURTAIN_BOTH): (STATE_INBOUND_MIDDLE, _MOVE, "入库中间：光栅1+2同时遮挡（路径1）"),
+    (STATE_INBOUND_START, CURTAIN_CLEAR): (STATE_INBOUND_END, _MOVE, "入库路径2：光栅1遮挡后直接无遮挡"),
+    (STATE_INBOUND_START, CURTAIN_2): (STATE_INBOUND_END, _MOVE, "入库结束：光栅2遮挡（直接进入）"),
+    (STATE_INBOUND_MIDDLE, CURTAIN_2): (STATE_INBOUND_END, _MOVE, "入库结束：光栅2遮挡"),
+    (STATE_INBOUND_MIDDLE, CURTAIN_CLEAR): (STATE_IDLE, _ABORT, "入库中断：中间状态检测到无遮挡"),
+    (STATE_INBOUND_END, CURTAIN_2): (STATE_INBOUND_END, _MOVE, "入库结束：检测到光栅2遮挡"),
+    (STATE_INBOUND_END, CURTAIN_CLEAR): (STATE_IDLE, _COMPLETE, "入库完成"),
+    (STATE_INBOUND_END, CURTAIN_1): (STATE_IDLE, _ABORT, "入库异常：结束状态又回到光栅1遮挡"),
+
+    (STATE_OUTBOUND_START, CURTAIN_BOTH): (STATE_OUTBOUND_MIDDLE, _MOVE, "出库中间：光栅1+2同时遮挡（路径1）"),
+    (STATE_OUTBOUND_START, CURTAIN_CLEAR): (STATE_OUTBOUND_END, _MOVE, "出库路径2：光栅2遮挡后直接无遮挡"),
+    (STATE_OUTBOUND_START, CURTAIN_1): (STATE_OUTBOUND_END, _MOVE, "出库结束：光栅1遮挡（直接进入）"),
+    (STATE_OUTBOUND_MIDDLE, CURTAIN_1): (STATE_OUTBOUND_END, _MOVE, "出库结束：光栅1遮挡"),
+    (STATE_OUTBOUND_MIDDLE, CURTAIN_CLEAR): (STATE_IDLE, _ABORT, "出库中断：中间状态检测到无遮挡"),
+    (STATE_OUTBOUND_END, CURTAIN_1): (STATE_OUTBOUND_END, _MOVE, "出库结束：检测到光栅1遮挡"),
+    (STATE_OUTBOUND_END, CURTAIN_CLEAR): (STATE_IDLE, _COMPLETE, "出库完成"),
+    (STATE_OUTBOUND_END, CURTAIN_2): (STATE_IDLE, _ABORT, "出库异常：结束状态又回到光栅2遮挡"),
+}
+
+# 各状态所属方向
+STATE_DIRECTION = {
+    STATE_IDLE: DIRECTION_NONE,
+    STATE_INBOUND_START: DIRECTION_INBOUND,
+    STATE_INBOUND_MIDDLE: DIRECTION_INBOUND,
+    STATE_INBOUND_END: DIRECTION_INBOUND,
+    STATE_OUTBOUND_START: DIRECTION_OUTBOUND,
+    STATE_OUTBOUND_MIDDLE: DIRECTION_OUTBOUND,
+    STATE_OUTBOUND_END: DIRECTION_OUTBOUND,
+}
+
+_END_STATES = (STATE_INBOUND_END, STATE_OUTBOUND_END)
+
+
+class GateFSM:
+    """光栅过门状态机（单线程使用：同一时间只由一个线程调用 feed/tick）"""
+
+    def __init__(self, idle_timeout: float = 10.0, report_cooldown: float = 1.0,
+                 events: Optional[queue.Queue] = None, log: Optional[Callable[[str], None]] = None):
+        """
+        初始化状态机
+
+        Args:
+            idle_timeout: 非空闲状态下光栅状态无变化的超时时间（秒）
+            report_cooldown: 两次上报的最小间隔（秒）
+            events: 事件队列，None表示新建
+            log: 日志函数（例如print），None表示不输出，回放时使用
+        """
+        self.idle_timeout_ns = int(idle_timeout * 1e9)
+        self.report_cooldown_ns = int(report_cooldown * 1e9)
+        self.events = events if events is not None else queue.Queue()
+        self.log = log
+
+        self.state = STATE_IDLE
+        self.previous_status = CURTAIN_CLEAR
+        self.last_change_ns = 0  # 最近一次光栅状态变化（或状态转换）的时间
+        self.last_report_ns = None
+
+        # 统计
+        self.samples = 0
+        self.status_changes = 0
+        self.event_counts = {EVENT_START: 0, EVENT_COMPLETE: 0, EVENT_ABORT: 0, EVENT_TIMEOUT: 0}
+        self.cooldown_skips = 0
+
+    @property
+    def direction(self) -> int:
+        """当前过门方向"""
+        return STATE_DIRECTION[self.state]
+
+    def feed(self, status: int, timestamp_ns: int):
+        """
+        输入一个光栅状态样本
+
+        Args:
+            status: 光栅状态字节
+            timestamp_ns: 样本到达时间（单调时钟ns），必须不递减
+        """
+        self.samples += 1
+        # 两个样本之间可能已经超时（实时运行时由tick()在样本间隔中检测）
+        if self.state != STATE_IDLE and timestamp_ns - self.last_change_ns > self.idle_timeout_ns:
+            self._timeout(timestamp_ns)
+        if status == self.previous_status:
+            return
+
+        self.status_changes += 1
+        state = self.state
+        if self.log:
+            self.log(f"状态变化: {self.previous_status:02X}->{status:02X}, 当前状态: {state}")
+        self.last_change_ns = timestamp_ns
+
+        transition = TRANSITIONS.get((state, status))
+        if transition is not None:
+            next_state, action, message = transition
+            self.state = next_state
+            if action is _MOVE:
+                if self.log:
+                    self.log(message)
+            elif action is _START:
+                self._emit(EVENT_START, STATE_DIRECTION[next_state], timestamp_ns, state, message)
+            elif action is _COMPLETE:
+                report = self.last_report_ns is None or \
+                    timestamp_ns - self.last_report_ns >= self.report_cooldown_ns
+                if report:
+                    self.last_report_ns = timestamp_ns
+                else:
+                    self.cooldown_skips += 1
+                    message += "（跳过重复报告）"
+                self._emit(EVENT_COMPLETE, STATE_DIRECTION[state], timestamp_ns, state, message, report=report)
+            else:
+                self._emit(EVENT_ABORT, STATE_DIRECTION[state], timestamp_ns, state, message)
+
+        # 转换后仍处于开始/中间状态却无遮挡：异常中断，清空本次标签记录
+        if status == CURTAIN_CLEAR and self.state != STATE_IDLE and self.state not in _END_STATES:
+            aborted = self.state
+            self.state = STATE_IDLE
+            self._emit(EVENT_ABORT, STATE_DIRECTION[aborted], timestamp_ns, aborted,
+                       f"异常中断：状态{aborted}检测到无遮挡，不累积识别总量", clear=True)
+
+        self.previous_status = status
+
+    def tick(self, now_ns: Optional[int] = None):
+        """
+        超时检测（没有新样本时定期调用）
+
+        Args:
+            now_ns: 当前时间（单调时钟ns），None表示现取
+        """
+        if self.state == STATE_IDLE:
+            return
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        if now_ns - self.last_change_ns > self.idle_timeout_ns:
+            self._timeout(now_ns)
+
+    def reset(self, status: int = CURTAIN_CLEAR):
+        """回到空闲状态且不产生事件（输送线模式下只跟踪光栅状态）"""
+        self.state = STATE_IDLE
+        self.previous_status = status
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取统计信息"""
+        stats = {
+            'state': self.state,
+            'samples': self.samples,
+            'status_changes': self.status_changes,
+            'cooldown_skips': self.cooldown_skips
+        }
+        stats.update(self.event_counts)
+        return stats
+
+    def _timeout(self, now_ns: int):
+        state = self.state
+        self.state = STATE_IDLE
+        self.last_change_ns = now_ns
+        self._emit(EVENT_TIMEOUT, STATE_DIRECTION[state], now_ns, state,
+                   f"超时检测：状态{state}超过{self.idle_timeout_ns / 1e9:g}秒无变化，重置状态", clear=True)
+
+    def _emit(self, kind: str, direction: int, timestamp_ns: int, state: int, message: str,
+              report: bool = False, clear: bool = False):
+        self.event_counts[kind] += 1
+        if self.log:
+            self.log(message)
+        self.events.put(GateEvent(kind, direction, timestamp_ns, state, message, report, clear))
+
+
+def replay_samples(samples: Iterable[Tuple[int, int]], **kwargs) -> List[GateEvent]:
+    """
+    离线回放光栅样本
+
+    Args:
+        samples: (时间ns, 光栅状态) 序列，按时间排列
+        **kwargs: 传给 GateFSM 的参数
+
+    Returns:
+        产生的事件列表
+    """
+    events = []
+
+    class _ListQueue:
+        put = events.append
+
+    fsm = GateFSM(events=_ListQueue(), **kwargs)
+    feed = fsm.feed
+    for timestamp_ns, status in samples:
+        feed(status, timestamp_ns)
+    return events
+
+
+def _benchmark(hours: float = 24.0, rate: float = 50.0, passes_per_hour: int = 120):
+    """回放一天的采样（50次/秒，每小时120次过门）"""
+    import random
+    rng = random.Random(1)
+    step = int(1e9 / rate)
+    total = int(hours * 3600 * rate)
+    pass_every = int(3600 * rate / passes_per_hour)
+    paths = ([1, 3, 2, 0], [1, 0, 2, 0], [2, 3, 1, 0], [2, 0, 1, 0], [1, 3, 0])
+    samples = []
+    status = 0
+    pending = []
+    for i in range(total):
+        if i % pass_every == 0:
+            pending = [s for s in rng.choice(paths) for _ in range(rng.randint(5, 40))]
+        if pending:
+            status = pending.pop(0)
+        samples.append((i * step, status))
+
+    started = time.perf_counter()
+    events = replay_samples(samples)
+    elapsed = time.perf_counter() - started
+    counts = {}
+    for event in events:
+        counts[event.kind] = counts.get(event.kind, 0) + 1
+    print(f"回放{hours:g}小时共{total}个样本: {elapsed:.2f} 秒（{total / elapsed:,.0f} 样本/秒），事件: {counts}")
+
+
+if __name__ == "__main__":
+    _benchmark()
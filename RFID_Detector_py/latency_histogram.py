@@ -0,0 +1,139 @@
+# latency_histogram.py
+"""
+延迟直方图模块
+对数-线性分桶（HDR风格）：每个2的幂区间再均分为若干子桶，相对误差固定，
+记录一次只需几次整数运算，适合在热路径上长期开启。
+"""
+
+from typing import Dict, Optional
+
+
+class LatencyHistogram:
+    """纳秒级延迟直方图"""
+
+    def __init__(self, sub_bucket_bits: int = 4, max_value_bits: int = 40):
+        """
+        初始化直方图
+
+        Args:
+            sub_bucket_bits: 每个2的幂区间的子桶数（2^sub_bucket_bits），4表示16个子桶，相对误差约6%
+            max_value_bits: 可记录的最大值位数，40位约为1100秒，超出的值计入最后一个桶
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.bucket_count = (max_value_bits - sub_bucket_bits + 1) * self.sub_bucket_count
+        self.counts = [0] * self.bucket_count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value_ns: int):
+        """记录一个值（纳秒）"""
+        if value_ns < 0:
+            value_ns = 0
+        index = self._index(value_ns)
+        if index >= self.bucket_count:
+            index = self.bucket_count - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value_ns
+        if self.min is None or value_ns < self.min:
+            self.min = value_ns
+        if value_ns > self.max:
+            self.max = value_ns
+
+    def percentile(self, percent: float) -> int:
+        """
+        获取百分位数
+
+        Args:
+            percent: 百分比（0-100）
+
+        Returns:
+            int: 对应的值（纳秒，为所在桶的中间值）
+        """
+        if not self.count:
+            return 0
+        target = max(1, int(self.count * percent / 100.0 + 0.5))
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            if bucket:
+                seen += bucket
+                if seen >= target:
+                    return max(min(self._value(index), self.max), self.min)
+        return self.max
+
+    def mean(self) -> float:
+        """平均值（纳秒）"""
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other: 'LatencyHistogram'):
+        """合并另一个相同配置的直方图"""
+        if other.bucket_count != self.bucket_count or other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("直方图配置不一致，无法合并")
+        for index, bucket in enumerate(other.counts):
+            if bucket:
+                self.counts[index] += bucket
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        """清空"""
+        self.counts = [0] * self.bucket_count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def snapshot(self, unit: str = 'ms') -> Dict[str, float]:
+        """
+        获取统计摘要
+
+        Args:
+            unit: 输出单位，'ms'、'us' 或 'ns'
+
+        Returns:
+            包含count、min、max、mean和常用百分位数的字典
+        """
+        scale = {'ns': 1.0, 'us': 1e3, 'ms': 1e6}[unit]
+        return {
+            'count': self.count,
+            'min': round((self.min or 0) / scale, 3),
+            'mean': round(self.mean() / scale, 3),
+            'p50': round(self.percentile(50) / scale, 3),
+            'p90': round(self.percentile(90) / scale, 3),
+            'p99': round(self.percentile(99) / scale, 3),
+            'p999': round(self.percentile(99.9) / scale, 3),
+            'max': round(self.max / scale, 3)
+        }
+
+    def _index(self, value: int) -> int:
+        """值 -> 桶索引"""
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return shift * self.sub_bucket_count + (value >> shift)
+
+    def _value(self, index: int) -> int:
+        """桶索引 -> 桶中间值"""
+        if index < self.sub_bucket_count:
+            return index
+        shift = index // self.sub_bucket_count - 1
+        top = index - shift * self.sub_bucket_count
+        return (top << shift) + ((1 << shift) >> 1)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def format_histogram(name: str, histogram: Optional[LatencyHistogram], unit: str = 'ms') -> str:
+    """格式化为一行文本，便于打印到日志"""
+    if histogram is None or not histogram.count:
+        return f"{name}: 无数据"
+    s = histogram.snapshot(unit)
+    return (f"{name}: n={s['count']} min={s['min']}{unit} p50={s['p50']}{unit} "
+            f"p90={s['p90']}{unit} p99={s['p99']}{unit} max={s['max']}{unit}")
@@ -1,4 +1,5 @@
 # main.py
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime
@@ -6,14 +7,34 @@ import time
 import threading
 from RFIDReader_CNNT import RFIDReader_CNNT
 from rfid_tag import RFIDTag
-from command import device_command
+from tag_store import TagSessionStore, TagReadAggregator
+from reported_filter import ReportedFilter
+from tag_event_store import TagEventStore, PASS_STATUS_COMPLETED, PASS_STATUS_ABORTED
+from tag_log import TagLogWriter
+from command import device_command, is_inventory_frame
 from mqtt_client import MqttClient
 import json
 from serial_comm import SerialComm
+from serial_engine import SerialEngine
+from gate_fsm import GateFSM, GateEvent, EVENT_START, EVENT_COMPLETE, EVENT_TIMEOUT, DIRECTION_NONE, \
+    DIRECTION_INBOUND
+from pass_trace import PassTracer, STAGE_LOOP_START, STAGE_FIRST_FRAME, STAGE_FIRST_ACCEPT, STAGE_PASS_END, \
+    STAGE_REPORT, OUTCOME_COMPLETED, OUTCOME_ABORTED
 
 DATA_TYPE_INBOUND = "inbound"
 DATA_TYPE_OUTBOUND = "outbound"
 
+DEDUP_MODE_PASS = "pass"  # 过门模式：光栅驱动，每次过门内按TID去重
+DEDUP_MODE_TTL = "ttl"  # 输送线模式：连续盘存，标签计数后经过TTL秒才会再次计数
+DEDUP_MODE_NAMES = {DEDUP_MODE_PASS: "过门模式", DEDUP_MODE_TTL: "输送线模式"}
+
+EVENT_BACKEND_SQLITE = "sqlite"  # SQLite事件库，可按TID、批号、时间查询
+EVENT_BACKEND_LOG = "log"  # 追加日志，资源受限的站点使用
+EVENT_BACKEND = EVENT_BACKEND_SQLITE
+
+# 数据目录按程序所在目录解析，不依赖启动时的工作目录
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
 
 class RFIDProductionSystem:
     def __init__(self, root):
@@ -56,8 +77,32 @@ class RFIDProductionSystem:
 
         # RFID标签管理
         self.current_tag = None
-        self.tag_history = []
         self.max_history_size = 10000
+        # 按TID去重，O(1)判重和淘汰，附带每个TID的读取次数、首末时间、RSSI和天线统计；
+        # 串口线程和界面线程共用，内部加锁，上报时用seal()原子地换下本次过门
+        self.tag_history = TagSessionStore(self.max_history_size, TagReadAggregator())
+        self.filtered_load = 0  # 本次过门中此前已上报过、不计入装载数量的标签数
+
+        # 跨会话的已上报过滤（持久化，重启后仍可识别最近N天已上报的标签）
+        self.reported_filter = ReportedFilter(os.path.join(DATA_DIR, 'reported'), window_days=7)
+
+        # 标签事件持久化（每次读取和过门都写入SQLite，程序中途崩溃也不丢失）
+        if EVENT_BACKEND == EVENT_BACKEND_LOG:
+            self.event_store = TagLogWriter(os.path.join(DATA_DIR, 'tag_log', 'reads'), fsync_interval=1.0)
+        else:
+            self.event_store = TagEventStore(os.path.join(DATA_DIR, 'tag_events.db'), retention_days=30)
+        self.event_store.start()
+        self.current_pass_id = None
+
+        # 过门端到端延迟追踪（光栅遮挡 → 盘存 → 去重 → 上报发出），按F9输出直方图
+        self.pass_tracer = PassTracer()
+        self.root.bind('<F9>', self.dump_pass_trace)
+
+        # 去重模式
+        self.dedup_mode = DEDUP_MODE_PASS
+        self.dedup_ttl = 30.0  # 输送线模式的去重时间窗口（秒）
+        self.conveyor_report_interval = 5.0  # 输送线模式的上报周期（秒）
+        self._conveyor_report_job = None
 
         # RFID读写器（替换原来的SocketClient）
         self.rfid_reader = RFIDReader_CNNT('192.168.1.200', 2000)
@@ -418,6 +463,26 @@ class RFIDProductionSystem:
         self.port_entry.insert(0, "2000")
         self.port_entry.pack(side='left', padx=(0, 20))
 
+        # 去重模式选择
+        tk.Label(config_frame, text="去重模式:", font=("微软雅黑", 9, "bold"),
+                 bg=self.industrial_colors['panel_bg'],
+                 fg=self.industrial_colors['primary_bg']).pack(side='left', padx=(0, 5))
+
+        self.dedup_mode_combo = ttk.Combobox(config_frame, width=10, font=("微软雅黑", 9), state='readonly',
+                                             values=list(DEDUP_MODE_NAMES.values()))
+        self.dedup_mode_combo.set(DEDUP_MODE_NAMES[self.dedup_mode])
+        self.dedup_mode_combo.bind('<<ComboboxSelected>>', self.on_dedup_mode_selected)
+        self.dedup_mode_combo.pack(side='left', padx=(0, 10))
+
+        tk.Label(config_frame, text="计数间隔(秒):", font=("微软雅黑", 9, "bold"),
+                 bg=self.industrial_colors['panel_bg'],
+                 fg=self.industrial_colors['primary_bg']).pack(side='left', padx=(0, 5))
+
+        self.dedup_ttl_entry = tk.Entry(config_frame, width=6, font=("微软雅黑", 9),
+                                        relief='solid', bd=1, bg='white')
+        self.dedup_ttl_entry.insert(0, str(self.dedup_ttl))
+        self.dedup_ttl_entry.pack(side='left')
+
         # 连接状态和控制按钮
         status_frame = tk.Frame(socket_frame, bg=self.industrial_colors['panel_bg'])
         status_frame.pack(fill='x', padx=10, pady=8)
@@ -492,7 +557,7 @@ class RFIDProductionSystem:
         self.is_running = not self.is_running
         if self.is_running:
             # 发送开始生产指令到RFID读写器
-            if self.rfid_reader.get_connection_status():
+            if self.rfid_reader.can_send():
                 if self.rfid_reader.send_single_cmd('CMD_RFID_LOOP_START'):
                     self.add_message("发送开始生产指令成功")
                 else:
@@ -510,7 +575,7 @@ class RFIDProductionSystem:
         # self.add_message("紧急制动！系统已停止")
 
         # 发送紧急停止指令到RFID读写器
-        if self.rfid_reader.get_connection_status():
+        if self.rfid_reader.can_send():
             if self.rfid_reader.send_single_cmd('CMD_RFID_LOOP_STOP'):
                 self.add_message("发送紧急停止指令成功")
                 self.report_rfid_tags_via_mqtt()
@@ -521,13 +586,112 @@ class RFIDProductionSystem:
 
         messagebox.showwarning("手动停止", "数据已经上报！")
 
+    def on_dedup_mode_selected(self, event=None):
+        """去重模式下拉框选择回调"""
+        name = self.dedup_mode_combo.get()
+        mode = next(m for m, n in DEDUP_MODE_NAMES.items() if n == name)
+        try:
+            ttl = float(self.dedup_ttl_entry.get())
+            if ttl <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("参数错误", "计数间隔必须是大于0的数字")
+            self.dedup_mode_combo.set(DEDUP_MODE_NAMES[self.dedup_mode])
+            return
+        self.set_dedup_mode(mode, ttl)
+
+    def set_dedup_mode(self, mode: str, ttl: float = None):
+        """
+        切换去重模式
+
+        Args:
+            mode: DEDUP_MODE_PASS（光栅驱动的过门模式）或 DEDUP_MODE_TTL（连续盘存的输送线模式）
+            ttl: 输送线模式下同一标签再次计数的间隔（秒）
+        """
+        if ttl is not None:
+            self.dedup_ttl = ttl
+        if mode == self.dedup_mode and (mode == DEDUP_MODE_PASS or self.tag_history.ttl == self.dedup_ttl):
+            return
+
+        # 切换前上报未上报的标签
+        if len(self.tag_history):
+            self.report_rfid_tags_via_mqtt()
+
+        self.dedup_mode = mode
+        self.tag_history = TagSessionStore(self.max_history_size, TagReadAggregator(),
+                                           ttl=self.dedup_ttl if mode == DEDUP_MODE_TTL else None)
+        self.filtered_load = 0
+        self.current_load = 0
+        self.current_load_label.config(text=str(self.current_load))
+
+        if self._conveyor_report_job is not None:
+            self.root.after_cancel(self._conveyor_report_job)
+            self._conveyor_report_job = None
+
+        if mode == DEDUP_MODE_TTL:
+            # 输送线模式不依赖光栅，持续盘存并周期上报
+            self._send_loop_cmd(True)
+            self._conveyor_report_job = self.root.after(int(self.conveyor_report_interval * 1000),
+                                                        self._conveyor_report_tick)
+            self.add_message(f"切换到输送线模式，同一标签{self.dedup_ttl:g}秒后可再次计数")
+        else:
+            self._send_loop_cmd(False)
+            self.add_message("切换到过门模式，由光栅触发盘存")
+
+    def _conveyor_report_tick(self):
+        """输送线模式：周期上报新计数的标签"""
+        self._conveyor_report_job = None
+        if self.dedup_mode != DEDUP_MODE_TTL:
+            return
+        self.tag_history.expire()
+        self.current_load = len(self.tag_history)
+        self.current_load_label.config(text=str(self.current_load))
+        if self.tag_history.unreported_count():
+            self.report_rfid_tags_via_mqtt()
+        self._conveyor_report_job = self.root.after(int(self.conveyor_report_interval * 1000),
+                                                    self._conveyor_report_tick)
+
     def start_rfid_loop_query(self, b_on):
         print(f"start_rfid_loop_query  === {b_on}")
+        if self.dedup_mode == DEDUP_MODE_TTL:
+            # 输送线模式持续盘存，忽略光栅触发
+            return
         if b_on:
-            # 发送开始生产指令到RFID读写器
+            # 开始新的一次过门，清空上次的标签记录
             self.tag_history.clear()
-            if self.rfid_reader.get_connection_status():
+            self.filtered_load = 0
+            self._begin_event_pass()
+        self._send_loop_cmd(b_on)
+
+    def _begin_event_pass(self):
+        """在事件存储中开始一次过门，上一次过门未结束（中途中断后未上报）时记为中断"""
+        self._end_event_pass(PASS_STATUS_ABORTED)
+        self.current_pass_id = self.event_store.begin_pass(self._current_data_type())
+        self.pass_tracer.bind_pass(self.current_pass_id)
+
+    def _end_event_pass(self, status, tag_count=None, data_type=None):
+        """
+        在事件存储中结束当前过门
+
+        Args:
+            status: 结果（completed/aborted）
+            tag_count: 标签数量，None表示当前会话中的标签数
+            data_type: 最终确定的数据类型，None表示保持开始时的方向
+        """
+        if self.current_pass_id is None:
+            return
+        if tag_count is None:
+            tag_count = len(self.tag_history)
+        self.event_store.end_pass(self.current_pass_id, tag_count, status, data_type)
+        self.current_pass_id = None
+
+    def _send_loop_cmd(self, b_on):
+        """发送开始/停止盘存指令"""
+        if b_on:
+            # 发送开始生产指令到RFID读写器
+            if self.rfid_reader.can_send():
                 if self.rfid_reader.send_single_cmd('CMD_RFID_LOOP_START'):
+                    self.pass_tracer.mark(STAGE_LOOP_START)
                     self.add_message("发送开始生产指令成功")
                 else:
                     self.add_message("发送开始生产指令失败")
@@ -535,7 +699,7 @@ class RFIDProductionSystem:
                 self.add_message("RFID读写器未连接，无法发送指令")
         else:
             # 发送紧急停止指令到RFID读写器
-            if self.rfid_reader.get_connection_status():
+            if self.rfid_reader.can_send():
                 if self.rfid_reader.send_single_cmd('CMD_RFID_LOOP_STOP'):
                     self.add_message("发送紧急停止指令成功")
                 else:
@@ -599,6 +763,9 @@ class RFIDProductionSystem:
     # RFID读写器回调函数
     def on_rfid_data_received(self, data):
         """RFID数据接收回调"""
+        if isinstance(data, bytes) and is_inventory_frame(data):
+            # 在接收线程中打点，不计入界面线程的排队时间
+            self.pass_tracer.mark(STAGE_FIRST_FRAME)
 
         def update_ui():
             if isinstance(data, bytes):
@@ -661,7 +828,11 @@ class RFIDProductionSystem:
 
             # 根据命令类型更新界面
             if command == 0x83:  # loop应答
-                self.update_rfid_data(data)
+                if is_inventory_frame(data):
+                    self.update_rfid_data(data)
+                else:
+                    # 开始盘存的短状态应答与盘存帧命令字相同，不含标签数据
+                    self.update_production_status(data)
             elif command == 0x8D:  # loop停止应答
                 self.update_production_status(data)
 
@@ -776,20 +947,21 @@ class RFIDProductionSystem:
         tag = self.process_rfid_data_epc_tid_user(data)
 
         if tag.success:
-            # 检查TID是否已存在
-            tid_exists = any(existing_tag.tid == tag.tid for existing_tag in self.tag_history)
-
-            if not tid_exists:
-                # TID不存在，添加到历史记录并更新显示
+            # 加入历史记录（TID已存在时返回False，超出上限时自动淘汰最早的标签）
+            if self.tag_history.add(tag):
+                # TID不存在，已添加到历史记录，更新显示
                 self.current_tag = tag
-                # 添加到历史记录
-                self.tag_history.append(tag)
-                # 限制历史记录大小
-                if len(self.tag_history) > self.max_history_size:
-                    self.tag_history.pop(0)
+                self.pass_tracer.mark(STAGE_FIRST_ACCEPT)
+                self.event_store.record_read(tag, self.current_pass_id)  # 只入队，不阻塞
+
+                # 过门模式下此前已上报过的标签上报时会被跳过，同样不计入装载数量
+                data_type = self._current_data_type()
+                already_reported = data_type is not None and self.reported_filter.seen(tag.tid_bytes, data_type)
+                if already_reported:
+                    self.filtered_load += 1
 
                 # 更新当前装载数量
-                self.current_load = len(self.tag_history)
+                self.current_load = max(0, len(self.tag_history) - self.filtered_load)
                 self.current_load_label.config(text=str(self.current_load))
 
                 # 关键修改：移除对每日生产总量的直接更新，只在完成出入库时更新
@@ -801,14 +973,25 @@ class RFIDProductionSystem:
                 self.update_element_text(self.fetch_text, display_text, clear_first=False)
 
                 # 添加消息
-                self.add_message(f"读取到新标签: {tag.product_name} (TID: {tag.tid}, RSSI: {tag.rssi:.1f}dBm)")
+                if already_reported:
+                    self.add_message(f"标签此前已上报过，本次不重复计数 (TID: {tag.tid})")
+                else:
+                    self.add_message(f"读取到新标签: {tag.product_name} (TID: {tag.tid}, RSSI: {tag.rssi:.1f}dBm)")
             else:
                 # TID已存在，只更新当前标签，不添加到历史记录和显示
                 self.current_tag = tag
-                self.add_message(f"检测到重复标签，TID: {tag.tid} 已存在")
+                stats = self.tag_history.read_stats(tag.tid_bytes)
+                read_count = stats['read_count'] if stats else 0
+                self.add_message(f"检测到重复标签，TID: {tag.tid} 已存在（第{read_count}次读取）")
         else:
             self.add_message(f"标签解析失败: {tag.error_message}")
 
+    def _current_data_type(self):
+        """当前过门方向对应的数据类型，方向未知或输送线模式（按时间窗口重复计数）时返回None"""
+        if self.dedup_mode != DEDUP_MODE_PASS:
+            return None
+        return {1: DATA_TYPE_INBOUND, 2: DATA_TYPE_OUTBOUND}.get(self.direction)
+
     def _format_tag_display(self, tag: RFIDTag) -> str:
         """格式化标签信息用于显示"""
         return (f"EPC: {tag.epc}\n"
@@ -840,6 +1023,7 @@ class RFIDProductionSystem:
         self.fetch_text.delete('1.0', tk.END)
         # 清空标签历史记录
         self.tag_history.clear()
+        self.filtered_load = 0
 
         # 重置当前标签
         self.current_tag = None
@@ -871,13 +1055,14 @@ class RFIDProductionSystem:
                 fieldnames = ['timestamp', 'epc', 'tid', 'user_data', 'rssi', 'antenna_num',
                               'product_name', 'manufacturer', 'license_number', 'production_date',
                               'batch_number', 'package_spec', 'package_method', 'quantity',
-                              'longitude', 'latitude']
+                              'longitude', 'latitude', 'read_count', 'first_seen', 'last_seen', 'dwell_ms',
+                              'rssi_min', 'rssi_max', 'rssi_mean', 'antennas']
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
                 writer.writeheader()
-                for tag in self.tag_history:
+                for tag, stats in self.tag_history.snapshot_with_stats():
                     if tag.success:
-                        writer.writerow({
+                        row = {
                             'timestamp': tag.timestamp,
                             'epc': tag.epc,
                             'tid': tag.tid,
@@ -894,7 +1079,11 @@ class RFIDProductionSystem:
                             'quantity': tag.quantity,
                             'longitude': tag.longitude,
                             'latitude': tag.latitude
-                        })
+                        }
+                        if stats:
+                            row.update(stats)
+                            row['antennas'] = '|'.join(str(n) for n in stats['antennas'])
+                        writer.writerow(row)
 
             self.add_message(f"标签数据已导出到: {filename}")
 
@@ -937,6 +1126,16 @@ class RFIDProductionSystem:
                 self.add_message("串口通信已关闭")
             except:
                 pass
+        # 关闭已上报过滤器
+        if hasattr(self, 'reported_filter'):
+            self.reported_filter.close()
+        # 输出过门延迟统计
+        if hasattr(self, 'pass_tracer'):
+            print(self.pass_tracer.dump())
+        # 写完剩余的标签事件
+        if hasattr(self, 'event_store'):
+            self._end_event_pass(PASS_STATUS_ABORTED)
+            self.event_store.close()
         self.root.destroy()
 
     def update_element_text(self, element, text: str, **kwargs) -> bool:
@@ -1027,6 +1226,7 @@ class RFIDProductionSystem:
         self.mqtt_client.client.on_connect = self._on_mqtt_connect
         self.mqtt_client.client.on_disconnect = self._on_mqtt_disconnect
         self.mqtt_client.client.on_message = self._on_mqtt_message
+        self.mqtt_client.client.on_publish = self._on_mqtt_publish
 
     def _on_mqtt_connect(self, client, userdata, flags, rc):
         """MQTT连接回调"""
@@ -1069,6 +1269,10 @@ class RFIDProductionSystem:
         # 在UI线程中安全处理
         self.root.after(0, process_message)
 
+    def _on_mqtt_publish(self, client, userdata, mid):
+        """MQTT发送确认回调（网络线程），用于过门延迟追踪"""
+        self.pass_tracer.on_published(mid)
+
     def start_mqtt_client(self):
         """启动MQTT客户端连接"""
 
@@ -1101,7 +1305,9 @@ class RFIDProductionSystem:
                 command_data.update(data)
 
             message = json.dumps(command_data)
-            self.mqtt_client.publish(self.mqtt_client.command_topic, message)
+            mid = self.mqtt_client.publish(self.mqtt_client.command_topic, message)
+            if command_type == 'report_tags':
+                self.pass_tracer.bind_message(mid)
             self.add_message(f"发送MQTT命令: {command_type}")
             return True
         except Exception as e:
@@ -1110,41 +1316,65 @@ class RFIDProductionSystem:
 
     def report_rfid_tags_via_mqtt(self, data_type=DATA_TYPE_INBOUND):
         """通过MQTT报告RFID标签"""
+        self.pass_tracer.mark(STAGE_REPORT)
         print(f"report_rfid_tags_via_mqtt type={data_type}")
         print(f"当前列表长度: {len(self.tag_history)}")
-        if self.tag_history:
-            # 可以发送最近的标签信息
-            recent_tags = self.tag_history[:]  # 发送所有标签
-            tag_data = []
-            for tag in recent_tags:
-                if tag.success:
-                    tag_data.append({
-                        'epc': tag.epc,
-                        'tid': tag.tid,
-                        'rssi': tag.rssi,
-                        'timestamp': tag.timestamp,
-                        'product_name': tag.product_name
-                    })
-
-            if tag_data:
-                # 根据数据类型更新入库或出库总量
-                if data_type == DATA_TYPE_INBOUND:
-                    self.inbound_total += len(tag_data)
-                    self.inbound_label.config(text=str(self.inbound_total))
-                elif data_type == DATA_TYPE_OUTBOUND:
-                    self.outbound_total += len(tag_data)
-                    self.outbound_label.config(text=str(self.outbound_total))
-
-                # 关键修改：更新识别总量为入库总量和出库总量之和
-                self.daily_production = self.inbound_total + self.outbound_total
-                self.daily_label.config(text=str(self.daily_production))
-
-                result = self.send_mqtt_command('report_tags', data_type, {'tags': tag_data})
-                self.tag_history.clear()  # 报告后清空历史记录
-                return result
+        if self.dedup_mode == DEDUP_MODE_TTL:
+            # 输送线模式：只上报上次上报之后新计数的标签，去重窗口保持不变
+            recent_tags = self.tag_history.take_unreported()
         else:
+            # 过门模式：封存本次过门的所有标签及读取统计，之后到达的读取计入下一次过门
+            recent_tags = self.tag_history.seal()
+            self.filtered_load = 0
+
+        result = False
+        tag_data = []
+        reported_tids = []
+        skipped = 0
+        for tag, stats in recent_tags:
+            if tag.success:
+                # 过门模式下跳过最近已上报过的标签（例如重启前已入库的托盘）
+                if self.dedup_mode == DEDUP_MODE_PASS and self.reported_filter.seen(tag.tid_bytes, data_type):
+                    skipped += 1
+                    continue
+                reported_tids.append(tag.tid_bytes)
+                item = {
+                    'epc': tag.epc,
+                    'tid': tag.tid,
+                    'rssi': tag.rssi,
+                    'timestamp': tag.timestamp,
+                    'product_name': tag.product_name
+                }
+                if stats:
+                    item['read_stats'] = stats
+                tag_data.append(item)
+
+        if skipped:
+            self.add_message(f"跳过{skipped}个此前已上报过的标签")
+
+        if tag_data:
+            # 根据数据类型更新入库或出库总量
+            if data_type == DATA_TYPE_INBOUND:
+                self.inbound_total += len(tag_data)
+                self.inbound_label.config(text=str(self.inbound_total))
+            elif data_type == DATA_TYPE_OUTBOUND:
+                self.outbound_total += len(tag_data)
+                self.outbound_label.config(text=str(self.outbound_total))
+
+            # 关键修改：更新识别总量为入库总量和出库总量之和
+            self.daily_production = self.inbound_total + self.outbound_total
+            self.daily_label.config(text=str(self.daily_production))
+
+            result = self.send_mqtt_command('report_tags', data_type, {'tags': tag_data})
+            if result and self.dedup_mode == DEDUP_MODE_PASS:
+                self.reported_filter.mark_reported(reported_tids, data_type)
+        elif not recent_tags:
             self.add_message("没有可报告的RFID标签数据")
-            return False
+
+        if self.dedup_mode == DEDUP_MODE_PASS:
+            # 空过门、全部读取失败或全部已上报过时同样结束本次过门，标签数记为0
+            self._end_event_pass(PASS_STATUS_COMPLETED, len(tag_data), data_type)
+        return result
 
     def start_serial_communication(self):
         """启动串口通信（在UI线程中安全调用）"""
@@ -1174,227 +1404,106 @@ class RFIDProductionSystem:
             return False
 
     def start_serial_reading_loop(self):
-        """启动串口读取循环（支持灵活路径和超时检测的状态机）"""
+        """启动串口读取循环：采样线程只驱动过门状态机，过门事件由单独的线程处理，上报不阻塞采样"""
+        self.gate_fsm = GateFSM(idle_timeout=10.0, report_cooldown=1.0, log=print)
+        read_interval = 0.05  # 没有新样本时做超时检测的间隔
 
-        def read_loop():
-            # 状态机定义
-            STATE_IDLE = 0  # 空闲状态
-            STATE_INBOUND_START = 1  # 入库开始（光栅1遮挡）
-            STATE_INBOUND_MIDDLE = 2  # 入库中间（光栅1+2同时遮挡）
-            STATE_INBOUND_END = 3  # 入库结束（光栅2遮挡）
-            STATE_OUTBOUND_START = 4  # 出库开始（光栅2遮挡）
-            STATE_OUTBOUND_MIDDLE = 5  # 出库中间（光栅1+2同时遮挡）
-            STATE_OUTBOUND_END = 6  # 出库结束（光栅1遮挡）
-
-            current_state = STATE_IDLE
-            previous_status = 0
-            read_interval = 0.05
-            # 防重复报告机制
-            last_report_time = 0
-            report_cooldown = 1.0  # 1秒冷却时间
-
-            # 超时检测机制
-            last_state_change_time = time.time()
-            idle_timeout = 10.0  # 10秒超时
-            process_start_time = None  # 流程开始时间
+        # 串口持续采样：光栅状态在到达时入队，不再每次轮询清空缓冲区、等待应答
+        engine = SerialEngine(self.serial_comm, 0x02, poll_interval=0.02)
+        self.serial_engine = engine
+        engine.start()
 
+        def read_loop():
+            fsm = self.gate_fsm
             while self.serial_comm.is_open():
                 try:
-                    start_time = time.time()
-                    data, length = self.serial_comm.read_register(0x02, timeout=0.5)
-
-                    if length > 0 and len(data) >= 4:
-                        current_status = data[3]
-                        self.current_status = current_status
-
-                        if current_status != previous_status:
-                            print(f"状态变化: {previous_status:02X}->{current_status:02X}, 当前状态: {current_state}")
-
-                            # 记录状态变化时间
-                            last_state_change_time = time.time()
-
-                            # 状态机处理
-                            old_state = current_state
-
-                            if current_state == STATE_IDLE:
-                                if current_status == 0x01:  # 光栅1遮挡
-                                    # 开始入库流程
-                                    current_state = STATE_INBOUND_START
-                                    self.direction = 1
-                                    self.start_rfid_loop_query(True)
-                                    process_start_time = time.time()  # 记录流程开始时间
-                                    print("入库开始：光栅1遮挡")
-
-                                elif current_status == 0x02:  # 光栅2遮挡
-                                    # 开始出库流程
-                                    current_state = STATE_OUTBOUND_START
-                                    self.direction = 2
-                                    self.start_rfid_loop_query(True)
-                                    process_start_time = time.time()  # 记录流程开始时间
-                                    print("出库开始：光栅2遮挡")
-
-                            elif current_state == STATE_INBOUND_START:
-                                if current_status == 0x03:  # 光栅1+2同时遮挡
-                                    # 路径1：有同时遮挡
-                                    current_state = STATE_INBOUND_MIDDLE
-                                    print("入库中间：光栅1+2同时遮挡（路径1）")
-                                elif current_status == 0x00:  # 无遮挡
-                                    # 路径2：无同时遮挡，允许直接进入无遮挡状态
-                                    current_state = STATE_INBOUND_END  # 直接进入结束状态等待光栅2遮挡
-                                    print("入库路径2：光栅1遮挡后直接无遮挡")
-                                elif current_status == 0x02:  # 光栅2遮挡（直接进入结束状态）
-                                    # 直接进入结束状态
-                                    current_state = STATE_INBOUND_END
-                                    print("入库结束：光栅2遮挡（直接进入）")
-
-                            elif current_state == STATE_INBOUND_MIDDLE:
-                                if current_status == 0x02:  # 光栅2遮挡
-                                    # 进入结束状态
-                                    current_state = STATE_INBOUND_END
-                                    print("入库结束：光栅2遮挡")
-                                elif current_status == 0x00:  # 无遮挡（异常情况）
-                                    # 重置状态
-                                    current_state = STATE_IDLE
-                                    self.direction = 0
-                                    self.start_rfid_loop_query(False)
-                                    process_start_time = None
-                                    print("入库中断：中间状态检测到无遮挡")
-
-                            elif current_state == STATE_INBOUND_END:
-                                if current_status == 0x02:  # 光栅2遮挡（路径2：从无遮挡进入光栅2遮挡）
-                                    # 保持结束状态，等待无遮挡
-                                    print("入库结束：检测到光栅2遮挡")
-                                elif current_status == 0x00:  # 无遮挡
-                                    # 完成入库
-                                    current_state = STATE_IDLE
-                                    self.direction = 0
-                                    self.start_rfid_loop_query(False)
-                                    process_start_time = None
-                                    # 防重复报告
-                                    current_time = time.time()
-                                    if current_time - last_report_time >= report_cooldown:
-                                        # 关键修改：只有在完成入库时才累积到识别总量
-                                        self.report_rfid_tags_via_mqtt(DATA_TYPE_INBOUND)
-                                        last_report_time = current_time
-                                        print("入库完成")
-                                    else:
-                                        print("入库完成（跳过重复报告）")
-                                elif current_status == 0x01:  # 又回到光栅1遮挡（异常）
-                                    # 重置状态
-                                    current_state = STATE_IDLE
-                                    self.direction = 0
-                                    self.start_rfid_loop_query(False)
-                                    process_start_time = None
-                                    print("入库异常：结束状态又回到光栅1遮挡")
-
-                            elif current_state == STATE_OUTBOUND_START:
-                                if current_status == 0x03:  # 光栅1+2同时遮挡
-                                    # 路径1：有同时遮挡
-                                    current_state = STATE_OUTBOUND_MIDDLE
-                                    print("出库中间：光栅1+2同时遮挡（路径1）")
-                                elif current_status == 0x00:  # 无遮挡
-                                    # 路径2：无同时遮挡，允许直接进入无遮挡状态
-                                    current_state = STATE_OUTBOUND_END  # 直接进入结束状态等待光栅1遮挡
-                                    print("出库路径2：光栅2遮挡后直接无遮挡")
-                                elif current_status == 0x01:  # 光栅1遮挡（直接进入结束状态）
-                                    # 直接进入结束状态
-                                    current_state = STATE_OUTBOUND_END
-                                    print("出库结束：光栅1遮挡（直接进入）")
-
-                            elif current_state == STATE_OUTBOUND_MIDDLE:
-                                if current_status == 0x01:  # 光栅1遮挡
-                                    # 进入结束状态
-                                    current_state = STATE_OUTBOUND_END
-                                    print("出库结束：光栅1遮挡")
-                                elif current_status == 0x00:  # 无遮挡（异常情况）
-                                    # 重置状态
-                                    current_state = STATE_IDLE
-                                    self.direction = 0
-                                    self.start_rfid_loop_query(False)
-                                    process_start_time = None
-                                    print("出库中断：中间状态检测到无遮挡")
-
-                            elif current_state == STATE_OUTBOUND_END:
-                                if current_status == 0x01:  # 光栅1遮挡（路径2：从无遮挡进入光栅1遮挡）
-                                    # 保持结束状态，等待无遮挡
-                                    print("出库结束：检测到光栅1遮挡")
-                                elif current_status == 0x00:  # 无遮挡
-                                    # 完成出库
-                                    current_state = STATE_IDLE
-                                    self.direction = 0
-                                    self.start_rfid_loop_query(False)
-                                    process_start_time = None
-                                    # 防重复报告
-                                    current_time = time.time()
-                                    if current_time - last_report_time >= report_cooldown:
-                                        # 关键修改：只有在完成出库时才累积到识别总量
-                                        self.report_rfid_tags_via_mqtt(DATA_TYPE_OUTBOUND)
-                                        last_report_time = current_time
-                                        print("出库完成")
-                                    else:
-                                        print("出库完成（跳过重复报告）")
-                                elif current_status == 0x02:  # 又回到光栅2遮挡（异常）
-                                    # 重置状态
-                                    current_state = STATE_IDLE
-                                    self.direction = 0
-                                    self.start_rfid_loop_query(False)
-                                    process_start_time = None
-                                    print("出库异常：结束状态又回到光栅2遮挡")
-
-                            # 处理其他异常状态转换
-                            if current_status == 0x00 and current_state != STATE_IDLE:
-                                # 如果在非结束状态检测到无遮挡，检查是否允许该转换
-                                if current_state not in [STATE_INBOUND_END, STATE_OUTBOUND_END]:
-                                    # 检查是否为允许的路径
-                                    if (current_state == STATE_INBOUND_START and previous_status == 0x01) or \
-                                            (current_state == STATE_OUTBOUND_START and previous_status == 0x02):
-                                        # 这是允许的路径2，不重置状态
-                                        print(f"允许的路径2：状态{current_state}检测到无遮挡")
-                                    else:
-                                        # 其他情况重置状态，并且不累积识别总量
-                                        print(f"异常中断：状态{current_state}检测到无遮挡，不累积识别总量")
-                                        self.start_rfid_loop_query(False)
-                                        current_state = STATE_IDLE
-                                        self.direction = 0
-                                        process_start_time = None
-                                        # 关键修改：中断时不报告标签，不累积到识别总量
-                                        self.tag_history.clear()  # 清空本次未完成的标签记录
-
-                            # 如果状态发生变化，更新状态变化时间
-                            if old_state != current_state:
-                                last_state_change_time = time.time()
-
-                            previous_status = current_status
-
-                        self.handle_serial_data(data)
-
-                    # 超时检测
-                    current_time = time.time()
-                    if current_state != STATE_IDLE and process_start_time is not None:
-                        # 检查是否超时（10秒内无状态变化）
-                        if current_time - last_state_change_time > idle_timeout:
-                            print(f"超时检测：状态{current_state}超过{idle_timeout}秒无变化，重置状态")
-                            self.start_rfid_loop_query(False)
-                            current_state = STATE_IDLE
-                            self.direction = 0
-                            process_start_time = None
-                            # 关键修改：超时时清空未完成的标签记录，不累积到识别总量
-                            self.tag_history.clear()
-                            print("系统已重置：超时保护，不累积识别总量")
-
-                    # 控制读取间隔
-                    elapsed = time.time() - start_time
-                    sleep_time = max(0, read_interval - elapsed)
-                    if sleep_time > 0:
-                        time.sleep(sleep_time)
+                    # 只有地址、功能码、长度和CRC都正确的应答才会成为样本，避免误触发过门
+                    sample = engine.get_sample(timeout=read_interval)
+
+                    if sample is not None:
+                        self.current_status = sample.value
+                        if self.dedup_mode == DEDUP_MODE_TTL:
+                            # 输送线模式不使用光栅状态机，只记录光栅状态
+                            fsm.reset(sample.value)
+                        else:
+                            changed = sample.value != fsm.previous_status
+                            fsm.feed(sample.value, sample.timestamp_ns)
+                            if changed:
+                                self.pass_tracer.note_transition(sample.timestamp_ns)
+                                # 采样周期20ms，只把状态变化的应答显示到消息区
+                                self.handle_serial_data(sample.raw)
+                    else:
+                        # 超时检测（10秒内无状态变化）
+                        fsm.tick()
 
                 except Exception as e:
                     self.add_message(f"串口读取错误: {e}")
                     time.sleep(0.5)
+            engine.stop()
+            fsm.events.put(None)
+
+        def event_loop():
+            while True:
+                event = self.gate_fsm.events.get()
+                if event is None:
+                    break
+                try:
+                    self.handle_gate_event(event)
+                except Exception as e:
+                    self.add_message(f"处理过门事件错误: {e}")
 
         threading.Thread(target=read_loop, daemon=True).start()
+        threading.Thread(target=event_loop, daemon=True).start()
         self.add_message("串口读取循环已启动（带超时检测版本）")
 
+    def handle_gate_event(self, event: GateEvent):
+        """处理过门状态机事件：启动/停止盘存、上报或清空本次标签记录"""
+        if event.kind == EVENT_START:
+            self.direction = event.direction
+            self.pass_tracer.begin(event.timestamp_ns, event.direction)
+            self.start_rfid_loop_query(True)
+            return
+
+        self.start_rfid_loop_query(False)
+        self.direction = DIRECTION_NONE
+        if event.kind == EVENT_COMPLETE:
+            self.pass_tracer.mark(STAGE_PASS_END, event.timestamp_ns)
+            if event.report:
+                # 关键修改：只有在完成出入库时才累积到识别总量
+                data_type = DATA_TYPE_INBOUND if event.direction == DIRECTION_INBOUND else DATA_TYPE_OUTBOUND
+                self.report_rfid_tags_via_mqtt(data_type)
+            self.pass_tracer.end(OUTCOME_COMPLETED)
+            return
+
+        self.pass_tracer.end(OUTCOME_ABORTED)
+        if event.clear:
+            # 关键修改：中断或超时时不报告标签，清空本次未完成的标签记录，不累积到识别总量
+            self._end_event_pass(PASS_STATUS_ABORTED)
+            self.tag_history.clear()
+            self.filtered_load = 0
+            if event.kind == EVENT_TIMEOUT:
+                print("系统已重置：超时保护，不累积识别总量")
+
+    def dump_pass_trace(self, event=None):
+        """输出过门端到端延迟直方图（F9）"""
+        print(self.pass_tracer.dump())
+        stats = self.pass_tracer.get_stats()['stages_ms']
+        if 'published' in stats:
+            s = stats['published']
+            self.add_message(f"光栅遮挡到上报发出: n={s['count']} p50={s['p50']}ms p99={s['p99']}ms max={s['max']}ms")
+        else:
+            self.add_message("过门延迟追踪：暂无已上报的过门")
+
+    def close_serial_communication(self):
+        """停止串口采样并关闭串口"""
+        if getattr(self, 'serial_engine', None) is not None:
+            stats = self.serial_engine.get_stats()
+            print(f"光栅采样统计: 样本{stats['samples']}个，漏采样{stats['missed']}次，CRC错误{stats['crc_errors']}次，"
+                  f"应答延迟p99={stats['latency_ms']['p99']}ms，抖动p99={stats['jitter_ms']['p99']}ms")
+            self.serial_engine.stop()
+            self.serial_engine = None
+        self.serial_comm.close()
+
     def handle_serial_data(self, data):
         """处理串口接收到的数据"""
 
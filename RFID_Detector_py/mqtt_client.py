@@ -61,13 +61,16 @@ class MqttClient:
         print(topic)
 
     def publish(self, topic, message):
+        """发布消息，返回MQTT消息ID（用于关联 on_publish 发送确认），未连接时返回None"""
         if self.connected:
-            self.client.publish(topic, message)
+            info = self.client.publish(topic, message)
             print(f"Published message: '{message}' to topic: '{topic}'")
             # 一定要加这一行！！！否则第一条收不到
             self.client.loop()
+            return info.mid
         else:
             print("Cannot publish message, client is not connected.")
+            return None
 
     def loop_forever(self):
         try:
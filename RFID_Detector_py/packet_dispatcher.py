@@ -0,0 +1,93 @@
+# packet_dispatcher.py
+"""
+数据包分发模块
+按首字节对接收到的帧分类：0xA5 为二进制协议帧，'{' / '[' 为JSON消息，其余为未知数据。
+只有真正的JSON消息才会进入JSON解码器，二进制帧不经过任何文本编解码。
+"""
+
+import json
+from typing import Callable, Optional, Any, Dict
+
+PACKET_BINARY = 'binary'
+PACKET_JSON = 'json'
+PACKET_INVALID_JSON = 'invalid_json'
+PACKET_UNKNOWN = 'unknown'
+
+
+class PacketDispatcher:
+    """按首字节分发数据包"""
+
+    def __init__(self,
+                 binary_handler: Optional[Callable[[memoryview], None]] = None,
+                 json_handler: Optional[Callable[[Any], None]] = None,
+                 unknown_handler: Optional[Callable[[memoryview], None]] = None):
+        """
+        初始化分发器
+
+        Args:
+            binary_handler: 二进制帧处理函数（参数为帧视图）
+            json_handler: JSON消息处理函数（参数为解码后的对象）
+            unknown_handler: 未知数据处理函数（包括无法解码的JSON）
+        """
+        self.binary_handler = binary_handler
+        self.json_handler = json_handler
+        self.unknown_handler = unknown_handler
+
+        # 首字节路由表，256项，直接按字节值索引
+        self._routes = [self._dispatch_unknown] * 256
+        self._routes[0xA5] = self._dispatch_binary
+        self._routes[ord('{')] = self._dispatch_json
+        self._routes[ord('[')] = self._dispatch_json
+
+        # 分类计数
+        self.counters = {
+            PACKET_BINARY: 0,
+            PACKET_JSON: 0,
+            PACKET_INVALID_JSON: 0,
+            PACKET_UNKNOWN: 0
+        }
+
+    def dispatch(self, packet: memoryview):
+        """
+        分发一个数据包
+
+        Args:
+            packet: 完整帧或文本段
+        """
+        if len(packet):
+            self._routes[packet[0]](packet)
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取各类数据包的计数"""
+        return dict(self.counters)
+
+    def reset_stats(self):
+        """清零计数"""
+        for key in self.counters:
+            self.counters[key] = 0
+
+    def _dispatch_binary(self, packet: memoryview):
+        """二进制协议帧"""
+        self.counters[PACKET_BINARY] += 1
+        if self.binary_handler:
+            self.binary_handler(packet)
+
+    def _dispatch_json(self, packet: memoryview):
+        """JSON消息"""
+        try:
+            data = json.loads(str(packet, 'utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            self.counters[PACKET_INVALID_JSON] += 1
+            if self.unknown_handler:
+                self.unknown_handler(packet)
+            return
+
+        self.counters[PACKET_JSON] += 1
+        if self.json_handler:
+            self.json_handler(data)
+
+    def _dispatch_unknown(self, packet: memoryview):
+        """无法识别的数据"""
+        self.counters[PACKET_UNKNOWN] += 1
+        if self.unknown_handler:
+            self.unknown_handler(packet)
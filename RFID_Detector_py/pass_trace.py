@@ -0,0 +1,336 @@
+# pass_trace.py
+"""
+过门端到端延迟追踪
+从光栅遮挡到标签上报到达MQTT服务器要经过多个线程：串口采样线程 → 状态机 → 事件线程发送盘存指令 →
+读写器接收线程收到0x83帧 → 界面线程去重 → 过门完成上报 → paho网络线程发出报文。
+本模块在每个环节打一个单调时钟时间戳（ns），按过门关联成一条追踪，并汇总到HDR风格的直方图：
+- 每个环节相对光栅遮挡（串口样本到达）的累计延迟；
+- 相邻两个已记录环节之间的分段延迟；
+- 最近若干次过门的完整追踪，便于对照事件库中的过门ID排查单次过门。
+
+每个环节只记录第一次出现，之后的调用只做一次列表下标检查即返回，可以常开在生产环境中。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+from latency_histogram import LatencyHistogram, format_histogram
+
+# 环节（按在一次过门中出现的顺序）
+STAGE_SAMPLE = 0  # 光栅遮挡的串口样本到达
+STAGE_FSM = 1  # 状态机完成转换（采样线程）
+STAGE_DISPATCH = 2  # 事件线程取到过门开始事件
+STAGE_LOOP_START = 3  # send_single_cmd 发出开始盘存指令
+STAGE_FIRST_FRAME = 4  # 收到第一个0x83盘存帧
+STAGE_FIRST_ACCEPT = 5  # 第一个标签通过去重
+STAGE_PASS_END = 6  # 过门完成（光栅恢复无遮挡的样本到达）
+STAGE_REPORT = 7  # 进入 report_rfid_tags_via_mqtt
+STAGE_PUBLISHED = 8  # 上报报文已发出（paho on_publish，QoS 0为写入套接字，QoS 1为收到PUBACK）
+STAGE_NAMES = ('sample', 'fsm', 'dispatch', 'loop_start', 'first_frame', 'first_accept',
+               'pass_end', 'report', 'published')
+STAGE_COUNT = len(STAGE_NAMES)
+
+# 追踪结果
+OUTCOME_PUBLISHED = 'published'  # 上报报文已发出
+OUTCOME_COMPLETED = 'completed'  # 过门完成但没有上报（冷却期、无标签或MQTT未连接）
+OUTCOME_ABORTED = 'aborted'  # 过门中断或超时
+OUTCOME_SUPERSEDED = 'superseded'  # 未结束就开始了下一次过门
+
+
+class PassTrace:
+    """一次过门的追踪"""
+    __slots__ = ('trace_id', 'pass_id', 'direction', 'times', 'last_stage', 'outcome', 'mid')
+
+    def __init__(self, trace_id: int, direction: int):
+        self.trace_id = trace_id
+        self.pass_id = None  # 事件库中的过门ID
+        self.direction = direction
+        self.times: List[Optional[int]] = [None] * STAGE_COUNT
+        self.last_stage = -1  # 已记录的最后一个环节，用于计算分段延迟
+        self.outcome = None
+        self.mid = None  # 上报报文的MQTT消息ID
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转为字典，各环节为相对光栅遮挡的毫秒数"""
+        t0 = self.times[STAGE_SAMPLE]
+        return {
+            'trace_id': self.trace_id,
+            'pass_id': self.pass_id,
+            'direction': self.direction,
+            'outcome': self.outcome,
+            'stages_ms': {STAGE_NAMES[stage]: round((t - t0) / 1e6, 3)
+                          for stage, t in enumerate(self.times) if t is not None}
+        }
+
+
+class PassTracer:
+    """过门端到端延迟追踪器（线程安全）"""
+
+    def __init__(self, history_size: int = 100, max_pending: int = 64):
+        """
+        初始化追踪器
+
+        Args:
+            history_size: 保留最近多少次过门的完整追踪
+            max_pending: 等待发送确认的上报报文上限，超出时丢弃最早的
+        """
+        self.max_pending = max_pending
+        self.active: Optional[PassTrace] = None  # 当前过门
+        self.recent = deque(maxlen=history_size)
+        self.stage_latency = [LatencyHistogram() for _ in range(STAGE_COUNT)]  # 相对光栅遮挡
+        self.segment_latency: Dict[tuple, LatencyHistogram] = {}  # (上一环节, 环节) -> 分段延迟
+        self.outcomes = {OUTCOME_PUBLISHED: 0, OUTCOME_COMPLETED: 0, OUTCOME_ABORTED: 0, OUTCOME_SUPERSEDED: 0}
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._transitions: Dict[int, int] = {}  # 样本时间 -> 状态机转换完成时间
+        self._pending: Dict[int, PassTrace] = {}  # MQTT消息ID -> 已结束、等待发送确认的追踪
+        self._early_acks: Dict[int, int] = {}  # 先于 bind_message 到达的发送确认
+
+    def note_transition(self, sample_ns: int, now_ns: Optional[int] = None):
+        """
+        记录状态机转换完成的时间（采样线程在状态变化后调用），过门开始时按样本时间取出
+
+        Args:
+            sample_ns: 触发转换的样本时间
+            now_ns: 转换完成时间，None表示当前时间
+        """
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        with self._lock:
+            transitions = self._transitions
+            if len(transitions) >= 32:
+                del transitions[next(iter(transitions))]
+            transitions[sample_ns] = now_ns
+
+    def begin(self, sample_ns: int, direction: int = 0) -> int:
+        """
+        开始一次过门的追踪（事件线程处理过门开始事件时调用）
+
+        Args:
+            sample_ns: 光栅遮挡样本的到达时间（GateEvent.timestamp_ns）
+            direction: 过门方向
+
+        Returns:
+            int: 追踪ID
+        """
+        now = time.monotonic_ns()
+        with self._lock:
+            previous = self.active
+            if previous is not None:
+                self._finish(previous, OUTCOME_SUPERSEDED)
+            trace = PassTrace(self._next_id, direction)
+            self._next_id += 1
+            trace.times[STAGE_SAMPLE] = sample_ns
+            trace.last_stage = STAGE_SAMPLE
+            transition_ns = self._transitions.pop(sample_ns, None)
+            if transition_ns is not None:
+                self._mark(trace, STAGE_FSM, transition_ns)
+            self._mark(trace, STAGE_DISPATCH, now)
+            self.active = trace
+            return trace.trace_id
+
+    def bind_pass(self, pass_id: Optional[int]):
+        """把当前追踪关联到事件库中的过门ID"""
+        trace = self.active
+        if trace is not None:
+            trace.pass_id = pass_id
+
+    def mark(self, stage: int, now_ns: Optional[int] = None):
+        """
+        记录当前过门到达某个环节，每个环节只记录第一次
+
+        Args:
+            stage: STAGE_*
+            now_ns: 时间（单调时钟ns），None表示当前时间
+        """
+        trace = self.active
+        if trace is None or trace.times[stage] is not None:
+            return
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        with self._lock:
+            if trace.times[stage] is None:
+                self._mark(trace, stage, now_ns)
+
+    def end(self, outcome: str = OUTCOME_COMPLETED):
+        """
+        结束当前过门：已绑定上报报文的追踪等待发送确认，否则按 outcome 归档
+
+        Args:
+            outcome: 没有上报报文时的结果（completed/aborted）
+        """
+        with self._lock:
+            trace = self.active
+            if trace is None:
+                return
+            self.active = None
+            if trace.mid is None or trace.times[STAGE_PUBLISHED] is not None:
+                self._finish(trace, outcome)
+
+    def bind_message(self, mid: Optional[int]):
+        """
+        把当前过门关联到上报报文的MQTT消息ID
+
+        Args:
+            mid: client.publish 返回的消息ID，None表示未发出
+        """
+        if mid is None:
+            return
+        with self._lock:
+            trace = self.active
+            if trace is None:
+                return
+            trace.mid = mid
+            acked_ns = self._early_acks.pop(mid, None)
+            if acked_ns is not None:
+                # 同步发送时 on_publish 可能先于 publish 返回
+                self._publish_acked(trace, acked_ns)
+            else:
+                pending = self._pending
+                if len(pending) >= self.max_pending:
+                    del pending[next(iter(pending))]
+                pending[mid] = trace
+
+    def on_published(self, mid: int, now_ns: Optional[int] = None):
+        """MQTT发送确认回调（paho on_publish，在网络线程中调用）"""
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        with self._lock:
+            trace = self._pending.pop(mid, None)
+            if trace is None:
+                trace = self.active
+                if trace is None or trace.mid != mid:
+                    early = self._early_acks
+                    if len(early) >= self.max_pending:  # 与过门无关的报文不会被取走
+                        del early[next(iter(early))]
+                    early[mid] = now_ns
+                    return
+            self._publish_acked(trace, now_ns)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        with self._lock:
+            return {
+                'traces': self._next_id - 1,
+                'active': self.active.trace_id if self.active else None,
+                'pending_acks': len(self._pending),
+                'outcomes': dict(self.outcomes),
+                'stages_ms': {STAGE_NAMES[stage]: h.snapshot('ms')
+                              for stage, h in enumerate(self.stage_latency) if h.count},
+                'segments_ms': {f"{STAGE_NAMES[a]}->{STAGE_NAMES[b]}": h.snapshot('ms')
+                                for (a, b), h in sorted(self.segment_latency.items())},
+                'recent': [trace.to_dict() for trace in list(self.recent)[-10:]]
+            }
+
+    def dump(self, recent: int = 5) -> str:
+        """
+        导出为多行文本，便于打印到日志
+
+        Args:
+            recent: 附带最近几次过门的完整追踪
+
+        Returns:
+            str: 文本
+        """
+        with self._lock:
+            outcomes = ', '.join(f"{name}={count}" for name, count in self.outcomes.items())
+            lines = [f"过门延迟追踪：共{self._next_id - 1}次过门（{outcomes}）", "相对光栅遮挡："]
+            lines += ['  ' + format_histogram(STAGE_NAMES[stage], h)
+                      for stage, h in enumerate(self.stage_latency) if stage != STAGE_SAMPLE]
+            lines.append("分段：")
+            lines += ['  ' + format_histogram(f"{STAGE_NAMES[a]}->{STAGE_NAMES[b]}", h)
+                      for (a, b), h in sorted(self.segment_latency.items())]
+            traces = list(self.recent)[-recent:] if recent else []
+        if traces:
+            lines.append("最近的过门：")
+            for trace in traces:
+                t0 = trace.times[STAGE_SAMPLE]
+                stages = ' '.join(f"{STAGE_NAMES[stage]}={(t - t0) / 1e6:.1f}"
+                                  for stage, t in enumerate(trace.times) if t is not None and stage)
+                lines.append(f"  #{trace.trace_id} 过门ID={trace.pass_id} {trace.outcome}: {stages} (ms)")
+        return '\n'.join(lines)
+
+    def reset(self):
+        """清空直方图和历史追踪，当前过门继续追踪"""
+        with self._lock:
+            for histogram in self.stage_latency:
+                histogram.reset()
+            self.segment_latency.clear()
+            self.recent.clear()
+            for outcome in self.outcomes:
+                self.outcomes[outcome] = 0
+
+    def _mark(self, trace: PassTrace, stage: int, now_ns: int):
+        """记录环节（调用方持有锁）"""
+        times = trace.times
+        times[stage] = now_ns
+        self.stage_latency[stage].record(now_ns - times[STAGE_SAMPLE])
+        previous = trace.last_stage
+        if stage > previous:
+            segment = (previous, stage)
+            histogram = self.segment_latency.get(segment)
+            if histogram is None:
+                histogram = self.segment_latency[segment] = LatencyHistogram()
+            histogram.record(now_ns - times[previous])
+            trace.last_stage = stage
+
+    def _publish_acked(self, trace: PassTrace, now_ns: int):
+        """上报报文已发出（调用方持有锁）"""
+        if trace.times[STAGE_PUBLISHED] is None:
+            self._mark(trace, STAGE_PUBLISHED, now_ns)
+        if trace is not self.active:
+            self._finish(trace, OUTCOME_PUBLISHED)
+
+    def _finish(self, trace: PassTrace, outcome: str):
+        """归档追踪（调用方持有锁）"""
+        if trace.outcome is not None:
+            return
+        if trace.times[STAGE_PUBLISHED] is not None:
+            outcome = OUTCOME_PUBLISHED
+        trace.outcome = outcome
+        self.outcomes[outcome] += 1
+        self.recent.append(trace)
+
+
+def _benchmark(passes: int = 20000, frames_per_pass: int = 200):
+    """测量追踪开销：每次过门完整记录各环节，并模拟每次过门收到的大量0x83帧"""
+    tracer = PassTracer()
+    start = time.perf_counter()
+    for i in range(passes):
+        t0 = time.monotonic_ns()
+        tracer.note_transition(t0)
+        tracer.begin(t0, 1)
+        tracer.bind_pass(i)
+        tracer.mark(STAGE_LOOP_START)
+        for _ in range(frames_per_pass):
+            tracer.mark(STAGE_FIRST_FRAME)
+        tracer.mark(STAGE_FIRST_ACCEPT)
+        tracer.mark(STAGE_PASS_END)
+        tracer.mark(STAGE_REPORT)
+        tracer.bind_message(i)
+        tracer.end()
+        tracer.on_published(i)
+    elapsed = time.perf_counter() - start
+
+    # 热路径：环节已记录后的重复调用
+    hot = PassTracer()
+    hot.begin(time.monotonic_ns())
+    hot.mark(STAGE_FIRST_FRAME)
+    repeats = 1000000
+    mark = hot.mark
+    hot_start = time.perf_counter()
+    for _ in range(repeats):
+        mark(STAGE_FIRST_FRAME)
+    hot_elapsed = time.perf_counter() - hot_start
+
+    per_frame = hot_elapsed / repeats * 1e9
+    per_pass = (elapsed - hot_elapsed / repeats * passes * frames_per_pass) / passes * 1e6
+    print(f"{passes}次过门 × {frames_per_pass}帧: {elapsed:.3f}s")
+    print(f"重复帧 mark(): {per_frame:.0f}ns/次")
+    print(f"每次过门记录全部环节: {per_pass:.1f}us")
+    print(tracer.dump(recent=2))
+
+
+if __name__ == "__main__":
+    _benchmark()
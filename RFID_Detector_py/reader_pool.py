@@ -0,0 +1,435 @@
+# reader_pool.py
+"""
+多读写器连接管理模块
+一个I/O线程通过selectors复用所有读写器的socket，每个解码后的帧都带上读写器编号，
+线程数量不再随读写器数量线性增长。
+"""
+
+import errno
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, Dict, Any
+from frame_assembler import FrameAssembler
+from packet_dispatcher import PacketDispatcher
+from command import device_command
+from SocketClient import configure_keepalive
+
+
+class ReaderEndpoint:
+    """单个读写器端点（连接状态、收发缓冲区和计数）"""
+
+    def __init__(self, pool: 'ReaderPool', reader_id: str, host: str, port: int):
+        self.pool = pool
+        self.reader_id = reader_id
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.is_connected = False
+        self.connecting = False
+        self.connect_deadline = 0.0
+
+        self.frame_assembler = FrameAssembler()
+        self.packet_dispatcher = PacketDispatcher(
+            binary_handler=self._on_binary_packet,
+            json_handler=self._on_json_packet
+        )
+        self.send_buffer = bytearray()
+        self.send_lock = threading.Lock()
+
+        # 吞吐量计数
+        self.frames = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.frames_per_second = 0.0
+        self._rate_frames = 0
+
+    def _on_binary_packet(self, data: memoryview):
+        self.frames += 1
+        self.pool._emit_receive(self.reader_id, bytes(data))
+
+    def _on_json_packet(self, data: Any):
+        self.frames += 1
+        self.pool._emit_receive(self.reader_id, data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取该读写器的统计信息"""
+        stats = {
+            'reader_id': self.reader_id,
+            'host': self.host,
+            'port': self.port,
+            'connected': self.is_connected,
+            'frames': self.frames,
+            'bytes_received': self.bytes_received,
+            'bytes_sent': self.bytes_sent,
+            'frames_per_second': round(self.frames_per_second, 1),
+            'pending_send_bytes': len(self.send_buffer)
+        }
+        stats.update(self.frame_assembler.get_stats())
+        return stats
+
+
+class ReaderPool:
+    """多读写器连接池，所有socket在同一个I/O线程中处理"""
+
+    def __init__(self, connect_timeout: float = 5.0):
+        """
+        初始化连接池
+
+        Args:
+            connect_timeout: 连接超时时间（秒）
+        """
+        self.connect_timeout = connect_timeout
+        self.endpoints: Dict[str, ReaderEndpoint] = {}
+        self.io_thread = None
+        self.running = False
+
+        # 跨线程操作队列及唤醒通道（selector在stop()后保持打开，停止期间的连接/发送操作直接注册，下次start()时生效）
+        self._pending_ops = deque()
+        self._open_selector()
+
+        # 回调函数
+        self.receive_callback = None
+        self.connection_callback = None
+        self.error_callback = None
+
+    def set_callbacks(self,
+                      receive_callback: Optional[Callable[[str, bytes or dict], None]] = None,
+                      connection_callback: Optional[Callable[[str, bool, str], None]] = None,
+                      error_callback: Optional[Callable[[str, str], None]] = None):
+        """
+        设置回调函数（回调在I/O线程中执行，第一个参数均为读写器编号）
+
+        Args:
+            receive_callback: 数据接收回调 (reader_id, data)
+            connection_callback: 连接状态回调 (reader_id, connected, message)
+            error_callback: 错误回调 (reader_id, error_msg)
+        """
+        self.receive_callback = receive_callback
+        self.connection_callback = connection_callback
+        self.error_callback = error_callback
+
+    def add_reader(self, reader_id: str, host: str, port: int = 2000) -> ReaderEndpoint:
+        """添加读写器端点"""
+        if reader_id in self.endpoints:
+            raise ValueError(f"读写器编号已存在: {reader_id}")
+        endpoint = ReaderEndpoint(self, reader_id, host, port)
+        self.endpoints[reader_id] = endpoint
+        return endpoint
+
+    def remove_reader(self, reader_id: str):
+        """移除读写器端点（会先断开连接）"""
+        endpoint = self.endpoints.get(reader_id)
+        if endpoint:
+            self._run_in_io_thread(self._close, endpoint, "读写器已移除")
+            self._run_in_io_thread(self.endpoints.pop, reader_id, None)
+
+    def start(self):
+        """启动I/O线程"""
+        if self.running:
+            return
+        if self.io_thread and self.io_thread.is_alive():
+            raise RuntimeError("上一次启动的I/O线程尚未退出")
+        self._drain_wakeup()
+        self.running = True
+        self.io_thread = threading.Thread(target=self._io_loop, name='reader-pool-io', daemon=True)
+        self.io_thread.start()
+        print(f"读写器连接池已启动，共{len(self.endpoints)}个读写器")
+
+    def stop(self):
+        """停止I/O线程并断开所有连接"""
+        if not self.running:
+            return
+        # I/O线程退出循环后执行剩余的操作并关闭所有连接（见 _io_loop 结尾）
+        self.running = False
+        self._wakeup()
+        if self.io_thread and self.io_thread is not threading.current_thread():
+            self.io_thread.join(timeout=2.0)
+            if self.io_thread.is_alive():
+                print("读写器连接池I/O线程未能在2秒内退出")
+        print("读写器连接池已停止")
+
+    def connect(self, reader_id: str):
+        """异步连接指定读写器，结果通过connection_callback通知"""
+        self._run_in_io_thread(self._start_connect, self.endpoints[reader_id])
+
+    def connect_all(self):
+        """异步连接所有读写器"""
+        for endpoint in self.endpoints.values():
+            self._run_in_io_thread(self._start_connect, endpoint)
+
+    def disconnect(self, reader_id: str):
+        """断开指定读写器"""
+        self._run_in_io_thread(self._close, self.endpoints[reader_id], "手动断开连接")
+
+    def send_data(self, reader_id: str, data: bytes) -> bool:
+        """发送数据到指定读写器（任意线程调用）"""
+        endpoint = self.endpoints.get(reader_id)
+        if not endpoint or not endpoint.is_connected:
+            return False
+        with endpoint.send_lock:
+            endpoint.send_buffer += data
+        self._run_in_io_thread(self._update_interest, endpoint)
+        return True
+
+    def send_single_cmd(self, reader_id: str, command_name: str) -> bool:
+        """发送单次指令到指定读写器"""
+        if command_name not in device_command:
+            self._emit_error(reader_id, f"未知指令: {command_name}")
+            return False
+        success = self.send_data(reader_id, device_command[command_name])
+        if not success:
+            self._emit_error(reader_id, f"发送指令失败: {command_name}")
+        return success
+
+    def broadcast_cmd(self, command_name: str) -> int:
+        """发送指令到所有已连接的读写器，返回成功发送的数量"""
+        return sum(1 for reader_id, endpoint in self.endpoints.items()
+                   if endpoint.is_connected and self.send_single_cmd(reader_id, command_name))
+
+    def get_connection_status(self, reader_id: str) -> bool:
+        """获取指定读写器的连接状态"""
+        endpoint = self.endpoints.get(reader_id)
+        return bool(endpoint and endpoint.is_connected)
+
+    def get_stats(self, reader_id: str) -> Dict[str, Any]:
+        """获取指定读写器的吞吐量统计"""
+        return self.endpoints[reader_id].get_stats()
+
+    def get_aggregate_stats(self) -> Dict[str, Any]:
+        """获取所有读写器的汇总统计"""
+        endpoints = list(self.endpoints.values())
+        return {
+            'readers': len(endpoints),
+            'connected': sum(1 for e in endpoints if e.is_connected),
+            'frames': sum(e.frames for e in endpoints),
+            'bytes_received': sum(e.bytes_received for e in endpoints),
+            'bytes_sent': sum(e.bytes_sent for e in endpoints),
+            'frames_per_second': round(sum(e.frames_per_second for e in endpoints), 1),
+            'resyncs': sum(e.frame_assembler.resyncs for e in endpoints),
+            'garbage_bytes': sum(e.frame_assembler.garbage_bytes for e in endpoints)
+        }
+
+    # I/O线程内部实现
+    def _run_in_io_thread(self, func, *args):
+        """安排函数在I/O线程中执行"""
+        if not self.running or self.io_thread is threading.current_thread():
+            func(*args)
+            return
+        self._pending_ops.append((func, args))
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_send.send(b'\x00')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _io_loop(self):
+        """I/O循环"""
+        print('reader_pool _io_loop start')
+        rate_time = time.monotonic()
+        while self.running:
+            try:
+                events = self.selector.select(timeout=0.5)
+            except OSError as e:
+                self._emit_error('', f"select错误: {e}")
+                continue
+
+            for key, mask in events:
+                endpoint = key.data
+                if endpoint is None:
+                    self._drain_wakeup()
+                    continue
+                if endpoint.socket is None or key.fileobj is not endpoint.socket:
+                    # 同一批事件中先处理的回调已关闭（或重连）了该端点
+                    continue
+                if endpoint.connecting:
+                    self._finish_connect(endpoint)
+                    continue
+                if mask & selectors.EVENT_READ:
+                    self._handle_read(endpoint)
+                if mask & selectors.EVENT_WRITE and endpoint.is_connected:
+                    self._handle_write(endpoint)
+
+            self._run_pending_ops()
+
+            now = time.monotonic()
+            for endpoint in list(self.endpoints.values()):
+                if endpoint.connecting and now > endpoint.connect_deadline:
+                    self._connect_failed(endpoint, "连接超时")
+
+            # 每秒更新一次吞吐量
+            if now - rate_time >= 1.0:
+                elapsed = now - rate_time
+                for endpoint in self.endpoints.values():
+                    endpoint.frames_per_second = (endpoint.frames - endpoint._rate_frames) / elapsed
+                    endpoint._rate_frames = endpoint.frames
+                rate_time = now
+
+        # 退出前执行排队中的操作，再关闭所有连接，避免socket泄漏
+        self._run_pending_ops()
+        for endpoint in list(self.endpoints.values()):
+            self._close(endpoint, "连接池已停止")
+        self._run_pending_ops()
+
+    def _run_pending_ops(self):
+        while self._pending_ops:
+            func, args = self._pending_ops.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                self._emit_error('', f"执行I/O操作错误: {e}")
+
+    def _open_selector(self):
+        """新建selector和唤醒通道"""
+        self.selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _start_connect(self, endpoint: ReaderEndpoint):
+        """发起非阻塞连接"""
+        if endpoint.is_connected or endpoint.connecting:
+            return
+        sock = None
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            configure_keepalive(sock)
+            sock.setblocking(False)
+            err = sock.connect_ex((endpoint.host, endpoint.port))
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                sock.close()
+                self._emit_connection(endpoint.reader_id, False, f"连接失败: {errno.errorcode.get(err, err)}")
+                return
+        except OSError as e:
+            if sock is not None:
+                sock.close()
+            self._emit_connection(endpoint.reader_id, False, f"连接失败: {e}")
+            return
+
+        endpoint.socket = sock
+        endpoint.connecting = True
+        endpoint.connect_deadline = time.monotonic() + self.connect_timeout
+        endpoint.frame_assembler.reset()
+        self.selector.register(sock, selectors.EVENT_WRITE, endpoint)
+
+    def _finish_connect(self, endpoint: ReaderEndpoint):
+        """非阻塞连接完成"""
+        err = endpoint.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self._connect_failed(endpoint, errno.errorcode.get(err, str(err)))
+            return
+        endpoint.connecting = False
+        endpoint.is_connected = True
+        self._update_interest(endpoint)
+        self._emit_connection(endpoint.reader_id, True,
+                              f"成功连接到服务器 {endpoint.host}:{endpoint.port}")
+
+    def _connect_failed(self, endpoint: ReaderEndpoint, reason: str):
+        endpoint.connecting = False
+        self._unregister(endpoint)
+        msg = f"连接失败: {reason}"
+        self._emit_connection(endpoint.reader_id, False, msg)
+        self._emit_error(endpoint.reader_id, msg)
+
+    def _handle_read(self, endpoint: ReaderEndpoint):
+        """读取数据并重组帧"""
+        assembler = endpoint.frame_assembler
+        try:
+            received_size = endpoint.socket.recv_into(assembler.writable())
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._emit_error(endpoint.reader_id, f"接收数据错误: {e}")
+            self._close(endpoint, "与服务器连接断开")
+            return
+
+        if not received_size:
+            self._close(endpoint, "与服务器连接断开")
+            return
+
+        endpoint.bytes_received += received_size
+        try:
+            for frame in assembler.commit(received_size):
+                endpoint.packet_dispatcher.dispatch(frame)
+        except Exception as e:
+            self._emit_error(endpoint.reader_id, f"数据处理错误: {e}")
+
+    def _handle_write(self, endpoint: ReaderEndpoint):
+        """写出发送缓冲区中的数据"""
+        sent = 0
+        with endpoint.send_lock:
+            if endpoint.send_buffer:
+                try:
+                    sent = endpoint.socket.send(endpoint.send_buffer)
+                except (BlockingIOError, InterruptedError):
+                    pass
+                except OSError as e:
+                    self._emit_error(endpoint.reader_id, f"发送数据错误: {e}")
+                    sent = -1
+                if sent > 0:
+                    del endpoint.send_buffer[:sent]
+                    endpoint.bytes_sent += sent
+        if sent < 0:
+            self._close(endpoint, "与服务器连接断开")
+            return
+        self._update_interest(endpoint)
+
+    def _update_interest(self, endpoint: ReaderEndpoint):
+        """根据发送缓冲区是否为空更新关注的事件"""
+        if not endpoint.is_connected or endpoint.socket is None:
+            return
+        events = selectors.EVENT_READ
+        if endpoint.send_buffer:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(endpoint.socket, events, endpoint)
+
+    def _unregister(self, endpoint: ReaderEndpoint):
+        if endpoint.socket is not None:
+            try:
+                if self.selector is not None:
+                    self.selector.unregister(endpoint.socket)
+            except (KeyError, ValueError):
+                pass
+            try:
+                endpoint.socket.close()
+            except OSError:
+                pass
+            endpoint.socket = None
+
+    def _close(self, endpoint: ReaderEndpoint, message: str):
+        """关闭连接"""
+        was_connected = endpoint.is_connected
+        endpoint.is_connected = False
+        endpoint.connecting = False
+        self._unregister(endpoint)
+        with endpoint.send_lock:
+            endpoint.send_buffer.clear()
+        if was_connected:
+            self._emit_connection(endpoint.reader_id, False, message)
+
+    # 回调
+    def _emit_receive(self, reader_id: str, data: bytes or dict):
+        if self.receive_callback:
+            self.receive_callback(reader_id, data)
+
+    def _emit_connection(self, reader_id: str, connected: bool, message: str):
+        if self.connection_callback:
+            self.connection_callback(reader_id, connected, message)
+        print(f"读写器[{reader_id}] {'连接成功' if connected else '连接断开'}: {message}")
+
+    def _emit_error(self, reader_id: str, error_msg: str):
+        if self.error_callback:
+            self.error_callback(reader_id, error_msg)
+        print(f"读写器[{reader_id}] 错误: {error_msg}")
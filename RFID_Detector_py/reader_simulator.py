@@ -0,0 +1,361 @@
+# reader_simulator.py
+"""
+RFID读写器模拟器
+在本机启动一个说 A5 5A 协议的TCP服务器，代替 192.168.1.200:2000 上的真实读写器：
+收到 CMD_RFID_LOOP_START / CMD_RFID_LOOP_STOP 时回复对应应答，盘存期间按设定速率
+推送 0x83 盘存帧（布局与 RFIDTag.from_bytes 一致）。标签数量、读取速率、重复率、
+RSSI分布、帧合并/拆分和断线注入均可配置，用于在没有硬件时压测整个接收链路。
+
+用法:
+    python reader_simulator.py --port 2000 --tags 500 --rate 5000
+"""
+
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+from typing import Optional, Dict, Any, List
+from command import (build_frame, frame_checksum, CMD_ACK_TYPE_RFID_LOOP_START,
+                     CMD_ACK_TYPE_RFID_LOOP_STOP)
+from frame_assembler import FrameAssembler
+
+CMD_LOOP_START = 0x82
+CMD_LOOP_STOP = 0x8C
+CMD_QUERY = 0x80
+CMD_ACK_TYPE_QUERY = 0x81
+
+INVENTORY_FRAME_SIZE = 53  # 帧头2 + 长度2 + 命令1 + PC2 + EPC12 + TID12 + USER16 + RSSI2 + 天线1 + 校验1 + 0D0A
+
+
+class SimulatedTag:
+    """模拟标签：预先组好除RSSI/天线外的帧内容，每次读取只需补齐尾部"""
+
+    __slots__ = ('tid', 'prefix', 'prefix_xor', 'base_rssi')
+
+    def __init__(self, pc: bytes, epc: bytes, tid: bytes, user: bytes, base_rssi: float):
+        self.tid = tid
+        self.prefix = (b'\xA5\x5A' + INVENTORY_FRAME_SIZE.to_bytes(2, 'big') +
+                       bytes([CMD_ACK_TYPE_RFID_LOOP_START]) + pc + epc + tid + user)
+        self.prefix_xor = frame_checksum(self.prefix + b'\x00\x00\x00')
+        self.base_rssi = base_rssi
+
+    def frame(self, rssi: float, antenna: int) -> bytes:
+        """生成一次读取的盘存帧"""
+        tail = struct.pack('>hB', int(round(rssi * 10)), antenna)
+        checksum = self.prefix_xor ^ tail[0] ^ tail[1] ^ tail[2]
+        return self.prefix + tail + bytes((checksum, 0x0D, 0x0A))
+
+
+class TagPopulation:
+    """标签总体：按重复率在已读标签和新标签之间抽样"""
+
+    def __init__(self, tag_count: int = 200, duplicate_ratio: float = 0.8, rssi_mean: float = -55.0,
+                 rssi_std: float = 6.0, rssi_jitter: float = 2.0, antennas: int = 4,
+                 seed: Optional[int] = None):
+        """
+        初始化标签总体
+
+        Args:
+            tag_count: 不同标签的数量
+            duplicate_ratio: 每次读取命中已读标签的概率（新标签耗尽后全部为重复读取）
+            rssi_mean: 标签基础RSSI的均值（dBm）
+            rssi_std: 标签基础RSSI的标准差（dBm）
+            rssi_jitter: 每次读取在基础RSSI上叠加的抖动标准差（dBm）
+            antennas: 天线数量（天线号从1开始）
+            seed: 随机种子，便于复现
+        """
+        self.random = random.Random(seed)
+        self.duplicate_ratio = duplicate_ratio
+        self.rssi_jitter = rssi_jitter
+        self.antennas = max(1, antennas)
+        self.tags: List[SimulatedTag] = [self._make_tag(i, rssi_mean, rssi_std) for i in range(tag_count)]
+        self.revealed = 0
+
+    def _make_tag(self, index: int, rssi_mean: float, rssi_std: float) -> SimulatedTag:
+        rnd = self.random
+        pc = b'\x30\x00'
+        epc = b'\xE2\x00' + index.to_bytes(4, 'big') + bytes(rnd.getrandbits(8) for _ in range(6))
+        tid = b'\xE2\x80\x11\x05' + index.to_bytes(4, 'big') + bytes(rnd.getrandbits(8) for _ in range(4))
+        user = bytes(rnd.getrandbits(8) for _ in range(16))
+        return SimulatedTag(pc, epc, tid, user, rnd.gauss(rssi_mean, rssi_std))
+
+    def reset(self):
+        """重新开始一轮（所有标签回到未读状态）"""
+        self.revealed = 0
+
+    def next_frame(self) -> bytes:
+        """抽取下一次读取并生成盘存帧"""
+        rnd = self.random
+        if self.revealed and (self.revealed >= len(self.tags) or rnd.random() < self.duplicate_ratio):
+            tag = self.tags[rnd.randrange(self.revealed)]
+        else:
+            tag = self.tags[self.revealed]
+            self.revealed += 1
+        rssi = max(-99.0, min(-10.0, rnd.gauss(tag.base_rssi, self.rssi_jitter)))
+        return tag.frame(rssi, rnd.randint(1, self.antennas))
+
+
+class ReaderSimulator:
+    """读写器模拟服务器"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 2000, tag_count: int = 200,
+                 read_rate: float = 1000.0, duplicate_ratio: float = 0.8, rssi_mean: float = -55.0,
+                 rssi_std: float = 6.0, rssi_jitter: float = 2.0, antennas: int = 4,
+                 merge_frames: int = 0, split_ratio: float = 0.0, disconnect_after: Optional[float] = None,
+                 fault_mode: str = 'close', answer_query: bool = True, seed: Optional[int] = None):
+        """
+        初始化模拟器
+
+        Args:
+            host: 监听地址
+            port: 监听端口（0表示由系统分配，启动后见 self.port）
+            tag_count / duplicate_ratio / rssi_mean / rssi_std / rssi_jitter / antennas / seed:
+                见 TagPopulation
+            read_rate: 盘存期间每秒推送的读取次数
+            merge_frames: 每次写出最多合并的帧数，0表示按节拍把到期的帧一次写出
+            split_ratio: 写出的数据被随机拆成多段发送的概率（模拟TCP分段）
+            disconnect_after: 连接建立多少秒后注入故障，None表示不注入
+            fault_mode: 故障类型，'close'正常关闭、'reset'发送RST、'stall'保持连接但不再收发
+            answer_query: 是否应答 CMD_RFID_QUERY（关闭后可用于验证心跳断链检测）
+        """
+        self.host = host
+        self.port = port
+        self.read_rate = read_rate
+        self.merge_frames = merge_frames
+        self.split_ratio = split_ratio
+        self.disconnect_after = disconnect_after
+        self.fault_mode = fault_mode
+        self.answer_query = answer_query
+        self.population_args = dict(tag_count=tag_count, duplicate_ratio=duplicate_ratio, rssi_mean=rssi_mean,
+                                    rssi_std=rssi_std, rssi_jitter=rssi_jitter, antennas=antennas, seed=seed)
+
+        self.server_socket = None
+        self.running = False
+        self.accept_thread = None
+        self.clients: List[socket.socket] = []
+        self._lock = threading.Lock()
+
+        # 统计
+        self.connections = 0
+        self.commands_received = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.faults_injected = 0
+
+    def start(self):
+        """启动监听"""
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(8)
+        self.port = self.server_socket.getsockname()[1]
+        self.running = True
+        self.accept_thread = threading.Thread(target=self._accept_loop, name='reader-simulator', daemon=True)
+        self.accept_thread.start()
+        print(f"RFID读写器模拟器已启动: {self.host}:{self.port}")
+
+    def stop(self):
+        """停止服务并断开所有客户端"""
+        self.running = False
+        if self.server_socket:
+            try:
+                self.server_socket.close()
+            except OSError:
+                pass
+            self.server_socket = None
+        with self._lock:
+            clients, self.clients = self.clients, []
+        for client in clients:
+            try:
+                client.close()
+            except OSError:
+                pass
+        print("RFID读写器模拟器已停止")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'connections': self.connections,
+            'active_clients': len(self.clients),
+            'commands_received': self.commands_received,
+            'frames_sent': self.frames_sent,
+            'bytes_sent': self.bytes_sent,
+            'faults_injected': self.faults_injected
+        }
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                client, address = self.server_socket.accept()
+            except OSError:
+                break
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self.clients.append(client)
+            self.connections += 1
+            print(f"模拟器: 客户端已连接 {address[0]}:{address[1]}")
+            threading.Thread(target=self._client_loop, args=(client,), daemon=True).start()
+
+    def _client_loop(self, client: socket.socket):
+        """处理一个客户端：接收线程解析指令，盘存线程按节拍推送数据"""
+        session = _ClientSession(self, client)
+        assembler = FrameAssembler(text_segments=False)
+        client.settimeout(0.2)
+        try:
+            while self.running and not session.closed:
+                if session.fault_due():
+                    session.inject_fault()
+                    break
+                try:
+                    n = client.recv_into(assembler.writable())
+                except socket.timeout:
+                    continue
+                if not n:
+                    break
+                for frame in assembler.commit(n):
+                    self.commands_received += 1
+                    session.handle_command(frame[4])
+        except OSError:
+            pass
+        finally:
+            session.close(keep_socket=session.stalled)
+            with self._lock:
+                if client in self.clients and not session.stalled:
+                    self.clients.remove(client)
+
+
+class _ClientSession:
+    """单个客户端连接的状态"""
+
+    def __init__(self, server: ReaderSimulator, client: socket.socket):
+        self.server = server
+        self.client = client
+        self.population = TagPopulation(**server.population_args)
+        self.random = random.Random()
+        self.send_lock = threading.Lock()
+        self.looping = threading.Event()
+        self.closed = False
+        self.stalled = False
+        self.connected_at = time.monotonic()
+        self.stream_thread = threading.Thread(target=self._stream_loop, daemon=True)
+        self.stream_thread.start()
+
+    def handle_command(self, command: int):
+        if command == CMD_LOOP_START:
+            self.population.reset()
+            # 短状态应答：命令字与盘存帧相同，按长度字段区分（command.is_inventory_frame）
+            self.send(build_frame(CMD_ACK_TYPE_RFID_LOOP_START, b'\x00'))
+            self.looping.set()
+        elif command == CMD_LOOP_STOP:
+            self.looping.clear()
+            self.send(build_frame(CMD_ACK_TYPE_RFID_LOOP_STOP))
+        elif command == CMD_QUERY and self.server.answer_query:
+            self.send(build_frame(CMD_ACK_TYPE_QUERY, b'\x00'))
+
+    def fault_due(self) -> bool:
+        after = self.server.disconnect_after
+        return after is not None and time.monotonic() - self.connected_at >= after
+
+    def inject_fault(self):
+        mode = self.server.fault_mode
+        self.server.faults_injected += 1
+        print(f"模拟器: 注入故障 {mode}")
+        if mode == 'reset':
+            self.client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        elif mode == 'stall':
+            self.stalled = True
+        self.looping.clear()
+
+    def close(self, keep_socket: bool = False):
+        self.closed = True
+        self.looping.set()  # 唤醒盘存线程使其退出
+        if not keep_socket:
+            try:
+                self.client.close()
+            except OSError:
+                pass
+
+    def send(self, data: bytes):
+        """写出数据，按配置随机拆分为多段"""
+        if self.stalled:
+            return
+        pieces = [data]
+        if self.server.split_ratio and len(data) > 1 and self.random.random() < self.server.split_ratio:
+            cuts = sorted(self.random.sample(range(1, len(data)), min(3, len(data) - 1)))
+            pieces = [data[i:j] for i, j in zip([0] + cuts, cuts + [len(data)])]
+        with self.send_lock:
+            for piece in pieces:
+                self.client.sendall(piece)
+        self.server.bytes_sent += len(data)
+
+    def _stream_loop(self):
+        """盘存推送：按读取速率计算每个节拍应发的帧数，合并后写出"""
+        tick = 0.005
+        try:
+            while not self.closed:
+                self.looping.wait()
+                started = time.monotonic()
+                sent = 0
+                while self.looping.is_set() and not self.closed and not self.stalled:
+                    due = int((time.monotonic() - started) * self.server.read_rate) - sent
+                    if due <= 0:
+                        time.sleep(tick)
+                        continue
+                    batch = self.server.merge_frames or due
+                    while due > 0:
+                        count = min(batch, due)
+                        frames = [self.population.next_frame() for _ in range(count)]
+                        self.send(b''.join(frames))
+                        self.server.frames_sent += count
+                        sent += count
+                        due -= count
+                if self.stalled:
+                    return
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RFID读写器模拟器（A5 5A协议）')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=2000, help='监听端口')
+    parser.add_argument('--tags', type=int, default=200, help='不同标签数量')
+    parser.add_argument('--rate', type=float, default=1000.0, help='每秒读取次数')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.8, help='重复读取概率')
+    parser.add_argument('--rssi-mean', type=float, default=-55.0, help='RSSI均值(dBm)')
+    parser.add_argument('--rssi-std', type=float, default=6.0, help='RSSI标准差(dBm)')
+    parser.add_argument('--rssi-jitter', type=float, default=2.0, help='单次读取RSSI抖动(dBm)')
+    parser.add_argument('--antennas', type=int, default=4, help='天线数量')
+    parser.add_argument('--merge', type=int, default=0, help='每次写出最多合并的帧数，0为按节拍合并')
+    parser.add_argument('--split-ratio', type=float, default=0.0, help='写出数据被拆分发送的概率')
+    parser.add_argument('--disconnect-after', type=float, default=None, help='连接多少秒后注入故障')
+    parser.add_argument('--fault', choices=['close', 'reset', 'stall'], default='close', help='故障类型')
+    parser.add_argument('--no-query-answer', action='store_true', help='不应答查询指令')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    args = parser.parse_args()
+
+    simulator = ReaderSimulator(args.host, args.port, tag_count=args.tags, read_rate=args.rate,
+                                duplicate_ratio=args.duplicate_ratio, rssi_mean=args.rssi_mean,
+                                rssi_std=args.rssi_std, rssi_jitter=args.rssi_jitter, antennas=args.antennas,
+                                merge_frames=args.merge, split_ratio=args.split_ratio,
+                                disconnect_after=args.disconnect_after, fault_mode=args.fault,
+                                answer_query=not args.no_query_answer, seed=args.seed)
+    simulator.start()
+    try:
+        last_frames = 0
+        while True:
+            time.sleep(1)
+            stats = simulator.get_stats()
+            print(f"客户端: {stats['active_clients']}, 发送帧/秒: {stats['frames_sent'] - last_frames}, "
+                  f"累计帧: {stats['frames_sent']}, 指令: {stats['commands_received']}")
+            last_frames = stats['frames_sent']
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
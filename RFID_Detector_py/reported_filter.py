@@ -0,0 +1,312 @@
+# reported_filter.py
+"""
+已上报标签的持久化过滤模块
+重启后 tag_history 和 inbound_total 都会丢失，已经入库上报过的托盘可能被再次计数。
+本模块按 “数据类型 + TID” 记录已上报的标签，回答“最近N天是否上报过”：
+
+- 第一层：按天轮换的内存映射Bloom过滤器，每天一个文件，保留 window_days 个。
+  查询只做几次位测试，绝大多数未上报的标签在这一层即可在微秒级返回“否”。
+- 第二层：SQLite精确索引（WITHOUT ROWID主键），只有Bloom判定“可能存在”时才查询确认，
+  排除Bloom的误判；Bloom文件丢失或损坏时也从这里重建。
+- Bloom文件头记录已同步到磁盘的索引时间（高水位），每次写入先把位数组刷回磁盘再推进高水位。
+  断电后重新打开时，索引中晚于高水位的记录重新加入Bloom，不会因为位数组未落盘而漏判已上报的标签。
+
+规模：每天每百万标签、误判率0.1%约占1.8MB的Bloom文件，千万级标签仍可全部映射在内存中。
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, Any, Iterable, List
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'reported')
+
+BLOOM_MAGIC = b'RFIDBLM2'
+BLOOM_HEADER = struct.Struct('<8sIIQQd')  # 魔数, 日期序号, 哈希函数个数, 位数, 已插入数量, 高水位
+_COUNT_OFFSET = 24
+_SYNCED_OFFSET = 32
+
+
+def _make_key(tid: bytes, data_type: str) -> bytes:
+    """过滤键：数据类型 + TID原始字节（入库和出库分别记录）"""
+    return data_type.encode('utf-8') + b':' + tid
+
+
+def _hashes(key: bytes):
+    """128位摘要拆成两个64位哈希，用双重哈希法生成k个位置"""
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomGeneration:
+    """一天的Bloom过滤器（内存映射文件）"""
+
+    def __init__(self, path: str, day: int, bit_count: int, hash_count: int):
+        """
+        打开或创建过滤器文件
+
+        Args:
+            path: 文件路径
+            day: 日期序号（date.toordinal()）
+            bit_count: 位数
+            hash_count: 哈希函数个数
+        """
+        self.path = path
+        self.day = day
+        size = BLOOM_HEADER.size + (bit_count + 7) // 8
+        created = not os.path.exists(path) or os.path.getsize(path) != size
+        if not created:
+            with open(path, 'rb') as f:
+                magic, file_day, file_k, file_bits, _, _ = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+            created = (magic, file_day, file_k, file_bits) != (BLOOM_MAGIC, day, hash_count, bit_count)
+
+        self._file = open(path, 'w+b' if created else 'r+b')
+        if created:
+            self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        if created:
+            BLOOM_HEADER.pack_into(self._mm, 0, BLOOM_MAGIC, day, hash_count, bit_count, 0, 0.0)
+        _, _, self.hash_count, self.bit_count, self.count, self.synced_until = BLOOM_HEADER.unpack_from(self._mm, 0)
+        self.created = created
+
+    def add(self, h1: int, h2: int):
+        mm = self._mm
+        offset = BLOOM_HEADER.size
+        bits = self.bit_count
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % bits
+            index = offset + (position >> 3)
+            mm[index] |= 1 << (position & 7)
+        self.count += 1
+        struct.pack_into('<Q', mm, _COUNT_OFFSET, self.count)
+
+    def might_contain(self, h1: int, h2: int) -> bool:
+        mm = self._mm
+        offset = BLOOM_HEADER.size
+        bits = self.bit_count
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % bits
+            if not mm[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def checkpoint(self, synced_until: float):
+        """
+        把位数组刷回磁盘后推进高水位（先落盘再记录，断电时高水位只会落后、不会超前）
+
+        Args:
+            synced_until: 索引中此时间之前（含）的记录都已加入本过滤器
+        """
+        self._mm.flush()
+        if synced_until > self.synced_until:
+            self.synced_until = synced_until
+            struct.pack_into('<d', self._mm, _SYNCED_OFFSET, synced_until)
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+
+
+class ReportedFilter:
+    """已上报标签过滤器（线程安全）"""
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, window_days: int = 7,
+                 expected_per_day: int = 1000000, false_positive_rate: float = 0.001):
+        """
+        初始化过滤器
+
+        Args:
+            directory: 数据目录（Bloom文件和SQLite索引），默认为程序目录下的 data/reported，不依赖工作目录
+            window_days: 去重时间窗口（天），超过窗口的记录被轮换淘汰
+            expected_per_day: 每天预计上报的标签数，用于确定Bloom文件大小
+            false_positive_rate: Bloom层期望误判率（误判由SQLite确认排除，只影响查询速度）
+        """
+        self.directory = directory
+        self.window_days = window_days
+        # m = -n·ln(p) / (ln2)^2，k = m/n·ln2
+        self.bit_count = max(1024, int(-expected_per_day * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.bit_count / expected_per_day * math.log(2)))
+        self._lock = threading.Lock()
+        self._generations: List[BloomGeneration] = []
+        self._next_rotation = 0.0
+        self._window_start = 0.0  # 窗口起点（本地时间 window_days-1 天前的零点）
+
+        # 统计
+        self.queries = 0
+        self.bloom_negatives = 0
+        self.confirmed = 0
+        self.false_positives = 0
+        self.inserted = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, 'reported.db'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS reported ('
+                         'key BLOB PRIMARY KEY, reported_at REAL NOT NULL) WITHOUT ROWID')
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_reported_at ON reported(reported_at)')
+        self._db.commit()
+
+        with self._lock:
+            self._rotate(time.time())
+
+    def seen(self, tid: bytes, data_type: str) -> bool:
+        """
+        最近 window_days 天内是否上报过
+
+        Args:
+            tid: TID原始字节
+            data_type: 数据类型（入库/出库）
+
+        Returns:
+            bool: 上报过返回True
+        """
+        key = _make_key(tid, data_type)
+        h1, h2 = _hashes(key)
+        with self._lock:
+            self._check_rotation()
+            self.queries += 1
+            if not any(g.might_contain(h1, h2) for g in self._generations):
+                self.bloom_negatives += 1
+                return False
+            row = self._db.execute('SELECT 1 FROM reported WHERE key = ? AND reported_at >= ?',
+                                   (key, self._window_start)).fetchone()
+            if row:
+                self.confirmed += 1
+                return True
+            self.false_positives += 1
+            return False
+
+    def filter_unreported(self, tids: Iterable[bytes], data_type: str) -> List[bytes]:
+        """返回其中最近未上报过的TID"""
+        return [tid for tid in tids if not self.seen(tid, data_type)]
+
+    def mark_reported(self, tids: Iterable[bytes], data_type: str):
+        """
+        记录一批已上报的标签（一个事务内写入）
+
+        Args:
+            tids: TID原始字节序列
+            data_type: 数据类型（入库/出库）
+        """
+        now = time.time()
+        keys = [_make_key(tid, data_type) for tid in tids]
+        if not keys:
+            return
+        with self._lock:
+            self._check_rotation()
+            current = self._generations[-1]
+            for key in keys:
+                current.add(*_hashes(key))
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO reported (key, reported_at) VALUES (?, ?)',
+                                     [(key, now) for key in keys])
+            current.checkpoint(now)
+            self.inserted += len(keys)
+
+    def flush(self):
+        """把Bloom文件的修改写回磁盘"""
+        with self._lock:
+            for generation in self._generations:
+                generation.flush()
+
+    def close(self):
+        """关闭过滤器"""
+        with self._lock:
+            for generation in self._generations:
+                generation.close()
+            self._generations = []
+            self._db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        with self._lock:
+            indexed = self._db.execute('SELECT COUNT(*) FROM reported').fetchone()[0]
+            return {
+                'queries': self.queries,
+                'bloom_negatives': self.bloom_negatives,
+                'confirmed': self.confirmed,
+                'false_positives': self.false_positives,
+                'inserted': self.inserted,
+                'indexed': indexed,
+                'generations': [(date.fromordinal(g.day).isoformat(), g.count) for g in self._generations],
+                'bloom_bytes_per_day': self.bit_count // 8,
+                'hash_count': self.hash_count
+            }
+
+    def _check_rotation(self):
+        now = time.time()
+        if now >= self._next_rotation:
+            self._rotate(now)
+
+    def _rotate(self, now: float):
+        """打开窗口内每天的Bloom文件，删除过期文件和过期的索引记录"""
+        today = date.fromtimestamp(now).toordinal()
+        first_day = today - self.window_days + 1
+        opened = {g.day: g for g in self._generations}
+        generations = []
+        for day in range(first_day, today + 1):
+            generation = opened.pop(day, None)
+            if generation is None:
+                path = os.path.join(self.directory, f'bloom_{day}.bin')
+                if day < today and not os.path.exists(path) and not self._has_rows(day):
+                    continue
+                # Bloom文件丢失的日期只要索引中有记录就重建，否则这些标签在Bloom层就被判为未上报
+                generation = BloomGeneration(path, day, self.bit_count, self.hash_count)
+                self._rebuild(generation)
+            generations.append(generation)
+        for generation in opened.values():
+            generation.close()
+        self._generations = generations
+
+        for name in os.listdir(self.directory):
+            if name.startswith('bloom_') and name.endswith('.bin'):
+                try:
+                    day = int(name[6:-4])
+                except ValueError:
+                    continue
+                if day < first_day:
+                    os.remove(os.path.join(self.directory, name))
+
+        self._window_start = _day_start(first_day)
+        with self._db:
+            self._db.execute('DELETE FROM reported WHERE reported_at < ?', (self._window_start,))
+        self._next_rotation = _day_start(today + 1)
+
+    def _has_rows(self, day: int) -> bool:
+        """索引中是否有该日的记录"""
+        return self._db.execute('SELECT 1 FROM reported WHERE reported_at >= ? AND reported_at < ? LIMIT 1',
+                                (_day_start(day), _day_start(day + 1))).fetchone() is not None
+
+    def _rebuild(self, generation: BloomGeneration):
+        """
+        从SQLite索引回填Bloom文件：新建（或损坏后重建）的文件回填当天全部记录，
+        已有的文件只回填高水位之后的记录（上次断电前已提交到索引、但位数组未落盘的部分）
+        """
+        synced_until = -1.0 if generation.created else generation.synced_until
+        rows = self._db.execute('SELECT key, reported_at FROM reported '
+                                'WHERE reported_at >= ? AND reported_at > ? AND reported_at < ?',
+                                (_day_start(generation.day), synced_until, _day_start(generation.day + 1))).fetchall()
+        if not rows:
+            return
+        for key, _ in rows:
+            generation.add(*_hashes(key))
+        generation.checkpoint(max(reported_at for _, reported_at in rows))
+        if not generation.created:
+            print(f"已上报过滤器: {date.fromordinal(generation.day).isoformat()} 的Bloom文件落后于索引，"
+                  f"补回{len(rows)}条记录")
+
+
+def _day_start(day: int) -> float:
+    """日期序号对应的本地零点时间戳"""
+    return datetime.combine(date.fromordinal(day), datetime.min.time()).timestamp()
@@ -1,39 +1,124 @@
 # rfid_tag.py
+import time
 from datetime import datetime
 from typing import Optional, Dict, Any
 
 
+# 产品信息字段（从USER数据按需解析）
+PRODUCT_FIELDS = ('product_name', 'manufacturer', 'license_number', 'production_date', 'batch_number',
+                  'package_spec', 'package_method', 'quantity', 'longitude', 'latitude')
+
+
+def _hex_field(name: str, start: int, end: int):
+    """原始帧中的十六进制字段：首次访问时从原始帧格式化并缓存，赋值时直接覆盖"""
+    slot = '_' + name
+
+    def getter(self):
+        value = getattr(self, slot)
+        if value is None:
+            value = self._raw[start:end].hex().upper() if self._raw is not None else ""
+            setattr(self, slot, value)
+        return value
+
+    def setter(self, value):
+        setattr(self, slot, value)
+
+    return property(getter, setter)
+
+
+# 产品信息的空值（所有未解析的标签共享，赋值时才复制）
+EMPTY_PRODUCT_INFO = ("", "", "", "", "", "", "", 0, 0.0, 0.0)
+
+
+def _product_field(name: str):
+    """产品信息字段：首次访问时解析USER数据"""
+    index = PRODUCT_FIELDS.index(name)
+
+    def getter(self):
+        if self._product is None:
+            self._load_product_info()
+        return self._product[index]
+
+    def setter(self, value):
+        if self._product is None:
+            self._load_product_info()
+        elif self._product is EMPTY_PRODUCT_INFO:
+            self._product = list(EMPTY_PRODUCT_INFO)
+        self._product[index] = value
+
+    return property(getter, setter)
+
+
 class RFIDTag:
-    """RFID标签类，用于存储和管理标签信息"""
+    """RFID标签类，用于存储和管理标签信息
+
+    使用 __slots__ 并保留原始帧，EPC/TID/USER/PC 十六进制字符串、产品信息和时间戳字符串
+    都在首次访问时才生成并缓存。去重时被丢弃的重复标签只付出解析RSSI和天线号的代价。
+    """
+
+    __slots__ = ('_raw', '_epc', '_tid', '_user_data', '_pc', 'rssi', 'antenna_num', '_product',
+                 '_read_time', '_timestamp', 'success', 'error_message')
+
+    # 基础RFID数据（十六进制字符串，按需生成）
+    epc = _hex_field('epc', 7, 19)  # EPC数据
+    tid = _hex_field('tid', 19, 31)  # TID数据
+    user_data = _hex_field('user_data', 31, 47)  # USER数据
+    pc = _hex_field('pc', 5, 7)  # PC数据
+
+    # 产品信息（按需解析）
+    product_name = _product_field('product_name')  # 产品名称
+    manufacturer = _product_field('manufacturer')  # 生产企业
+    license_number = _product_field('license_number')  # 生产许可证编号
+    production_date = _product_field('production_date')  # 生产日期
+    batch_number = _product_field('batch_number')  # 批号
+    package_spec = _product_field('package_spec')  # 包装规格
+    package_method = _product_field('package_method')  # 包装方式
+    quantity = _product_field('quantity')  # 数量
+    longitude = _product_field('longitude')  # 经度
+    latitude = _product_field('latitude')  # 纬度
 
     def __init__(self):
         # 基础RFID数据
-        self.epc: str = ""  # EPC数据（十六进制字符串）
-        self.tid: str = ""  # TID数据（十六进制字符串）
-        self.user_data: str = ""  # USER数据（十六进制字符串）
+        self._raw: Optional[bytes] = None  # 原始数据包
+        self._epc: Optional[str] = ""
+        self._tid: Optional[str] = ""
+        self._user_data: Optional[str] = ""
+        self._pc: Optional[str] = ""
         self.rssi: float = 0.0  # RSSI信号强度（dBm）
         self.antenna_num: int = 0  # 天线号
-        self.pc: str = ""  # PC数据（十六进制字符串）
-
-        # 产品信息
-        self.product_name: str = ""  # 产品名称
-        self.manufacturer: str = ""  # 生产企业
-        self.license_number: str = ""  # 生产许可证编号
-        self.production_date: str = ""  # 生产日期
-        self.batch_number: str = ""  # 批号
-        self.package_spec: str = ""  # 包装规格
-        self.package_method: str = ""  # 包装方式
-        self.quantity: int = 0  # 数量
-
-        # 位置信息
-        self.longitude: float = 0.0  # 经度
-        self.latitude: float = 0.0  # 纬度
+
+        # 产品信息（None表示尚未从USER数据解析）
+        self._product = EMPTY_PRODUCT_INFO
 
         # 系统信息
-        self.timestamp: str = ""  # 读取时间戳
+        self._read_time: float = 0.0  # 读取时间（time.time()）
+        self._timestamp: Optional[str] = ""  # 读取时间戳
         self.success: bool = False  # 解析是否成功
         self.error_message: str = ""  # 错误信息
 
+    @property
+    def timestamp(self) -> str:
+        """读取时间戳（首次访问时格式化）"""
+        if self._timestamp is None:
+            self._timestamp = datetime.fromtimestamp(self._read_time).strftime("%Y-%m-%d %H:%M:%S")
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, value: str):
+        self._timestamp = value
+
+    @property
+    def raw(self) -> Optional[bytes]:
+        """原始数据包（from_bytes解析的标签才有）"""
+        return self._raw
+
+    @property
+    def tid_bytes(self) -> bytes:
+        """TID原始字节，适合作为去重的键"""
+        if self._raw is not None and self._tid is None:
+            return self._raw[19:31]
+        return bytes.fromhex(self.tid)
+
     def from_bytes(self, data: bytes) -> bool:
         """
         从字节数据解析RFID标签信息
@@ -51,35 +136,25 @@ class RFIDTag:
                 self.success = False
                 return False
 
-            # 解析PC数据 (字节5-6，共2字节)
-            pc_data = data[5:7]
-            self.pc = ''.join([f'{b:02X}' for b in pc_data])
-
-            # 解析EPC数据 (字节8-19，共12字节)
-            epc_data = data[7:19]
-            self.epc = ''.join([f'{b:02X}' for b in epc_data])
+            # 保留原始帧（memoryview只在回调期间有效，需要复制）
+            self._raw = data if isinstance(data, bytes) else bytes(data)
 
-            # 解析TID数据 (字节20-31，共12字节)
-            tid_data = data[19:31]
-            self.tid = ''.join([f'{b:02X}' for b in tid_data])
-
-            # 解析USER数据 (字节32-47，共16字节)
-            user_data = data[31:47]
-            self.user_data = ''.join([f'{b:02X}' for b in user_data])
+            # PC(字节5-6)、EPC(字节8-19)、TID(字节20-31)、USER(字节32-47)在首次访问时才格式化
+            self._pc = self._epc = self._tid = self._user_data = None
 
             # 解析RSSI数据 (字节47-48，共2字节)
-            rssi_data = data[47:49]
-            rssi_int = int.from_bytes(rssi_data, byteorder='big', signed=True)
+            rssi_int = int.from_bytes(self._raw[47:49], byteorder='big', signed=True)
             self.rssi = rssi_int / 10.0  # 转换为实际值
 
             # 解析天线号 (字节50，第51个字节)
-            self.antenna_num = data[49]
+            self.antenna_num = self._raw[49]
 
-            # 设置时间戳
-            self.timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            # 记录时间，时间戳字符串在首次访问时生成
+            self._read_time = time.time()
+            self._timestamp = None
 
-            # 从USER数据中解析产品信息（根据实际协议实现）
-            self._parse_product_info()
+            # 产品信息在首次访问时从USER数据解析
+            self._product = None
 
             self.success = True
             self.error_message = ""
@@ -90,6 +165,11 @@ class RFIDTag:
             self.success = False
             return False
 
+    def _load_product_info(self):
+        """首次访问产品信息时解析"""
+        self._product = list(EMPTY_PRODUCT_INFO)
+        self._parse_product_info()
+
     def _parse_product_info(self):
         """从USER数据中解析产品信息（需要根据实际协议实现）"""
         try:
@@ -234,4 +314,4 @@ class RFIDTag:
         """详细表示"""
         return (f"RFIDTag(epc='{self.epc}', tid='{self.tid}', "
                 f"product='{self.product_name}', rssi={self.rssi}, "
-                f"antenna={self.antenna_num}, success={self.success})")
\ No newline at end of file
+                f"antenna={self.antenna_num}, success={self.success})")
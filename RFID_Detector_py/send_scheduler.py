@@ -0,0 +1,132 @@
+# send_scheduler.py
+"""
+发送调度模块
+按优先级分为三条通道：控制/紧急、普通指令、批量数据。每条通道有独立的容量上限，
+发送线程每次总是取优先级最高的一条，控制帧（如停止盘存）不会排在已有的普通流量之后。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+from latency_histogram import LatencyHistogram
+
+PRIORITY_CONTROL = 0  # 控制/紧急指令
+PRIORITY_NORMAL = 1  # 普通指令
+PRIORITY_BULK = 2  # 批量/周期性数据
+
+PRIORITY_NAMES = {
+    PRIORITY_CONTROL: 'control',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_BULK: 'bulk'
+}
+
+# 队列元素：(优先级, 入队时间ns, 数据)
+SendItem = Tuple[int, int, Any]
+
+
+class SendScheduler:
+    """带优先级通道的发送队列（线程安全）"""
+
+    def __init__(self, control_size: int = 64, normal_size: int = 256, bulk_size: int = 1024):
+        """
+        初始化发送调度器
+
+        Args:
+            control_size: 控制通道容量
+            normal_size: 普通通道容量
+            bulk_size: 批量通道容量
+        """
+        self.limits = (control_size, normal_size, bulk_size)
+        self._lanes = tuple(deque() for _ in self.limits)
+        self._cond = threading.Condition()
+
+        # 统计
+        self.enqueued = [0, 0, 0]
+        self.sent = [0, 0, 0]
+        self.dropped = [0, 0, 0]
+        self.expired = [0, 0, 0]
+        self.latency = [LatencyHistogram() for _ in self.limits]  # 入队到写出完成的延迟
+
+    def put(self, data: Any, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        加入发送队列
+
+        Args:
+            data: 待发送的数据
+            priority: 通道优先级
+
+        Returns:
+            bool: 是否入队成功（通道已满时返回False）
+        """
+        with self._cond:
+            lane = self._lanes[priority]
+            if len(lane) >= self.limits[priority]:
+                self.dropped[priority] += 1
+                return False
+            lane.append((priority, time.monotonic_ns(), data))
+            self.enqueued[priority] += 1
+            self._cond.notify()
+        return True
+
+    def get(self, timeout: Optional[float] = None) -> Optional[SendItem]:
+        """
+        取出优先级最高的一项，队列为空时等待（入队时立即唤醒，无需轮询）
+
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            (优先级, 入队时间ns, 数据)，超时返回None
+        """
+        with self._cond:
+            item = self._pop()
+            if item is None and self._cond.wait(timeout):
+                item = self._pop()
+            return item
+
+    def requeue(self, item: SendItem):
+        """将发送失败的一项放回所在通道的队首"""
+        with self._cond:
+            self._lanes[item[0]].appendleft(item)
+            self._cond.notify()
+
+    def mark_sent(self, item: SendItem):
+        """记录一项已写出，更新延迟统计"""
+        priority = item[0]
+        self.sent[priority] += 1
+        self.latency[priority].record(time.monotonic_ns() - item[1])
+
+    def mark_expired(self, item: SendItem):
+        """记录一项因过期被丢弃"""
+        self.expired[item[0]] += 1
+
+    def qsize(self) -> int:
+        """队列中等待发送的总数"""
+        return sum(len(lane) for lane in self._lanes)
+
+    def clear(self):
+        """清空所有通道"""
+        with self._cond:
+            for lane in self._lanes:
+                lane.clear()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各通道的计数和发送延迟（毫秒）"""
+        return {
+            name: {
+                'queued': len(self._lanes[p]),
+                'enqueued': self.enqueued[p],
+                'sent': self.sent[p],
+                'dropped': self.dropped[p],
+                'expired': self.expired[p],
+                'latency_ms': self.latency[p].snapshot('ms')
+            }
+            for p, name in PRIORITY_NAMES.items()
+        }
+
+    def _pop(self) -> Optional[SendItem]:
+        for lane in self._lanes:
+            if lane:
+                return lane.popleft()
+        return None
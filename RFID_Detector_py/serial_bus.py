@@ -0,0 +1,363 @@
+# serial_bus.py
+"""
+RS-485多站总线主站
+原来每个光栅控制器独占一个USB串口适配器和一个轮询线程，地址固定为0xFE。
+本模块在一个串口上按地址轮询多个控制器：
+
+- 调度：平滑加权轮询，priority 越大轮到的次数越多（全部为1即普通轮询）；
+- 每个设备有独立的应答超时，连续失败达到 offline_after 次后视为离线，只每隔 probe_interval 探测一次，
+  不再占用总线时间；
+- 半双工总线同一时间只能有一个事务，两帧之间保留3.5个字符的静默间隔（Modbus RTU要求）；
+- 一个控制器带多路光栅时用一次多寄存器读取（quantity 按路数增加）取回所有通道，数据区第i个字节为第i路状态，
+  每一路各自成为一个状态流（队列），与 SerialEngine 的样本格式相同，可以直接喂给 GateFSM；
+- 统计每个设备的应答延迟、采样间隔、超时和校验错误，以及总线利用率和每路光栅的实际采样率。
+
+9600波特率下一次事务约：请求8字节8.3ms + 应答6字节6.3ms + 两次静默间隔7.3ms ≈ 22ms，
+总线每秒约45次事务，由所有设备分享；多路控制器一次读取即可得到所有通道，每路采样率不随路数下降。
+
+用法:
+    python serial_bus.py /dev/ttyUSB0 --device 1 --device 2:2 --device 3::4 --duration 10
+"""
+
+import argparse
+import queue
+import select
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional
+from latency_histogram import LatencyHistogram
+from serial_comm import SerialComm, REPLY_OK, REPLY_EXCEPTION, REPLY_TIMEOUT
+from serial_engine import StatusSample
+
+
+class BusDevice:
+    """总线上的一个光栅控制器"""
+
+    def __init__(self, address: int, name: Optional[str] = None, cmd: int = 0x02, channels: int = 1,
+                 priority: int = 1, timeout: float = 0.05, queue_size: int = 1000):
+        """
+        初始化设备
+
+        Args:
+            address: 设备地址
+            name: 名称，默认为地址
+            cmd: 读取功能码
+            channels: 光栅路数，每路占一个字节（8个离散输入），一次读取全部通道
+            priority: 调度权重，越大采样越频繁
+            timeout: 应答超时（秒）
+            queue_size: 每路状态流的队列长度，满时丢弃最旧的样本
+        """
+        self.address = address
+        self.name = name or f"0x{address:02X}"
+        self.cmd = cmd
+        self.channels = channels
+        # 读离散输入/线圈时每路8位占1字节；读寄存器时每路一个寄存器，取低字节
+        if cmd in (0x01, 0x02):
+            self.quantity = channels * 8
+            self.value_offsets = tuple(range(channels))
+        else:
+            self.quantity = channels
+            self.value_offsets = tuple(channel * 2 + 1 for channel in range(channels))
+        self.priority = max(1, priority)
+        self.timeout = timeout
+        self.streams = [queue.Queue(maxsize=queue_size) for _ in range(channels)]
+        self.latest: List[Optional[StatusSample]] = [None] * channels
+        self.online = True
+        self.request = b''  # 由 SerialBus 按串口设置生成
+
+        self._weight = 0  # 加权轮询的当前权重
+        self._failures = 0  # 连续失败次数
+        self._next_probe_ns = 0
+        self._last_sample_ns = None
+
+        # 统计
+        self.requests = 0
+        self.samples = 0
+        self.timeouts = 0
+        self.errors: Dict[str, int] = {}
+        self.dropped = 0
+        self.offline_count = 0
+        self.latency = LatencyHistogram()
+        self.interval = LatencyHistogram()
+
+    def get_sample(self, channel: int = 0, timeout: Optional[float] = None) -> Optional[StatusSample]:
+        """
+        取出某一路的下一个样本
+
+        Args:
+            channel: 通道号
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            StatusSample，超时返回None
+        """
+        try:
+            return self.streams[channel].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_stats(self, elapsed: float) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'name': self.name,
+            'address': self.address,
+            'online': self.online,
+            'requests': self.requests,
+            'samples': self.samples,
+            'sample_rate': round(self.samples / elapsed, 2) if elapsed > 0 else 0.0,
+            'timeouts': self.timeouts,
+            'errors': dict(self.errors),
+            'dropped': self.dropped,
+            'offline_count': self.offline_count,
+            'latency_ms': self.latency.snapshot('ms'),
+            'interval_ms': self.interval.snapshot('ms')
+        }
+
+
+class SerialBus:
+    """RS-485总线主站（单线程轮询所有设备）"""
+
+    def __init__(self, serial_comm: SerialComm, devices: List[BusDevice], offline_after: int = 3,
+                 probe_interval: float = 1.0):
+        """
+        初始化主站
+
+        Args:
+            serial_comm: 已打开的 SerialComm
+            devices: 总线上的设备
+            offline_after: 连续失败多少次后视为离线
+            probe_interval: 离线设备的探测间隔（秒）
+        """
+        self.comm = serial_comm
+        self.devices = list(devices)
+        self.offline_after = offline_after
+        self.probe_interval_ns = int(probe_interval * 1e9)
+        # 帧间静默：3.5个字符时间（每字符10位）
+        self.gap_ns = int(3.5 * 10 / serial_comm.baudrate * 1e9)
+        self.status_callback: Optional[Callable[[BusDevice, int, StatusSample], None]] = None
+        self.state_callback: Optional[Callable[[BusDevice, bool], None]] = None
+
+        for device in self.devices:
+            device.request = serial_comm.build_request(device.cmd, 0x0000, device.quantity, device.address)
+
+        self._thread = None
+        self._running = False
+        self._last_activity_ns = 0
+        self._started_ns = 0
+
+        # 统计
+        self.transactions = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.stale_bytes = 0  # 事务开始前残留在输入缓冲区的字节（上一设备超时后迟到的应答）
+        self.idle_cycles = 0
+
+    def set_callbacks(self, status_callback=None, state_callback=None):
+        """
+        设置回调
+
+        Args:
+            status_callback: 收到样本时调用 (设备, 通道, 样本)，在总线线程中执行，应尽快返回
+            state_callback: 设备上线/离线时调用 (设备, 是否在线)
+        """
+        self.status_callback = status_callback
+        self.state_callback = state_callback
+
+    def start(self):
+        """启动轮询线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._started_ns = time.monotonic_ns()
+        self._thread = threading.Thread(target=self._run, name='serial-bus', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        """停止轮询线程"""
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息（总线利用率为收发字节占用的线路时间比例）"""
+        elapsed = (time.monotonic_ns() - self._started_ns) / 1e9 if self._started_ns else 0.0
+        line_time = (self.bytes_sent + self.bytes_received) * 10 / self.comm.baudrate
+        return {
+            'elapsed': round(elapsed, 3),
+            'transactions': self.transactions,
+            'transactions_per_second': round(self.transactions / elapsed, 2) if elapsed > 0 else 0.0,
+            'utilization': round(line_time / elapsed, 3) if elapsed > 0 else 0.0,
+            'stale_bytes': self.stale_bytes,
+            'idle_cycles': self.idle_cycles,
+            'devices': [device.get_stats(elapsed) for device in self.devices]
+        }
+
+    def _next_device(self, now_ns: int) -> Optional[BusDevice]:
+        """平滑加权轮询：每轮各设备加上自己的权重，选当前权重最大的，被选中者减去总权重"""
+        best = None
+        total = 0
+        for device in self.devices:
+            if not device.online and now_ns < device._next_probe_ns:
+                continue
+            device._weight += device.priority
+            total += device.priority
+            if best is None or device._weight > best._weight:
+                best = device
+        if best is not None:
+            best._weight -= total
+        return best
+
+    def _run(self):
+        while self._running and self.comm.is_open():
+            try:
+                device = self._next_device(time.monotonic_ns())
+                if device is None:
+                    # 所有设备都离线，等待下一次探测
+                    self.idle_cycles += 1
+                    time.sleep(0.01)
+                    continue
+                self._poll(device)
+            except Exception as e:
+                if self._running and self.comm.is_open():
+                    print(f"总线轮询错误: {e}")
+                    time.sleep(0.5)
+        self._running = False
+
+    def _poll(self, device: BusDevice):
+        """对一个设备执行一次读取事务"""
+        port = self.comm.serial_port
+        wait_ns = self._last_activity_ns + self.gap_ns - time.monotonic_ns()
+        if wait_ns > 0:
+            time.sleep(wait_ns / 1e9)
+        stale = port.in_waiting
+        if stale:
+            self.stale_bytes += stale
+            port.read(stale)
+
+        port.write(device.request)
+        sent_ns = time.monotonic_ns()
+        device.requests += 1
+        self.transactions += 1
+        self.bytes_sent += len(device.request)
+
+        # 请求在线路上的传输时间也计入超时
+        deadline_ns = sent_ns + int(device.timeout * 1e9) + len(device.request) * 10 * 10 ** 9 // self.comm.baudrate
+        received = bytearray()
+        reply = None
+        while True:
+            remaining = (deadline_ns - time.monotonic_ns()) / 1e9
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([port], [], [], remaining)
+            if ready:
+                available = port.in_waiting
+                if available:
+                    received += port.read(available)
+                    reply = self.comm.parse_reply(received, device.cmd, device.quantity, device.address)
+                    if reply.status in (REPLY_OK, REPLY_EXCEPTION):
+                        break
+        arrival_ns = time.monotonic_ns()
+        self._last_activity_ns = arrival_ns
+        self.bytes_received += len(received)
+
+        if reply is None:
+            reply = self.comm.parse_reply(received, device.cmd, device.quantity, device.address)
+        if reply.ok:
+            self._on_reply(device, reply, sent_ns, arrival_ns)
+        else:
+            self._on_failure(device, reply.status, arrival_ns)
+
+    def _on_reply(self, device: BusDevice, reply, sent_ns: int, arrival_ns: int):
+        latency_ns = arrival_ns - sent_ns
+        device.latency.record(latency_ns)
+        if device._last_sample_ns is not None:
+            device.interval.record(arrival_ns - device._last_sample_ns)
+        device._last_sample_ns = arrival_ns
+        device._failures = 0
+        if not device.online:
+            device.online = True
+            print(f"光栅控制器 {device.name} 恢复在线")
+            if self.state_callback:
+                self.state_callback(device, True)
+
+        device.samples += 1
+        for channel, offset in enumerate(device.value_offsets):
+            sample = StatusSample(reply.data[offset], arrival_ns, latency_ns, reply.raw)
+            device.latest[channel] = sample
+            stream = device.streams[channel]
+            try:
+                stream.put_nowait(sample)
+            except queue.Full:
+                try:
+                    stream.get_nowait()
+                except queue.Empty:
+                    pass
+                stream.put_nowait(sample)
+                device.dropped += 1
+            if self.status_callback:
+                self.status_callback(device, channel, sample)
+
+    def _on_failure(self, device: BusDevice, status: str, now_ns: int):
+        if status == REPLY_TIMEOUT:
+            device.timeouts += 1
+        else:
+            device.errors[status] = device.errors.get(status, 0) + 1
+        device._failures += 1
+        if device.online and device._failures >= self.offline_after:
+            device.online = False
+            device.offline_count += 1
+            print(f"光栅控制器 {device.name} 连续{device._failures}次无有效应答，视为离线")
+            if self.state_callback:
+                self.state_callback(device, False)
+        if not device.online:
+            device._next_probe_ns = now_ns + self.probe_interval_ns
+
+
+def parse_device(text: str) -> BusDevice:
+    """解析命令行设备参数：地址[:路数[:权重]]，例如 2、2:2、3::4"""
+    parts = text.split(':')
+    address = int(parts[0], 0)
+    channels = int(parts[1]) if len(parts) > 1 and parts[1] else 1
+    priority = int(parts[2]) if len(parts) > 2 and parts[2] else 1
+    return BusDevice(address, channels=channels, priority=priority)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RS-485光栅控制器总线轮询')
+    parser.add_argument('port', help='串口设备')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--device', action='append', required=True, help='地址[:路数[:权重]]，可重复')
+    parser.add_argument('--duration', type=float, default=10.0, help='运行时间（秒）')
+    args = parser.parse_args()
+
+    comm = SerialComm(args.port, args.baudrate)
+    if not comm.open():
+        return
+    bus = SerialBus(comm, [parse_device(text) for text in args.device])
+
+    def on_status(device, channel, sample):
+        previous = on_status.last.get((device.address, channel))
+        if previous != sample.value:
+            print(f"{device.name}#{channel}: {sample.value:02X}")
+            on_status.last[(device.address, channel)] = sample.value
+    on_status.last = {}
+
+    bus.set_callbacks(status_callback=on_status)
+    bus.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    bus.stop()
+    stats = bus.get_stats()
+    comm.close()
+    print(f"事务{stats['transactions']}次（{stats['transactions_per_second']}/秒），总线利用率{stats['utilization']:.0%}，"
+          f"残留字节{stats['stale_bytes']}")
+    for device in stats['devices']:
+        print(f"  {device['name']}: 采样{device['sample_rate']}/秒，超时{device['timeouts']}，错误{device['errors']}，"
+              f"延迟p50={device['latency_ms']['p50']}ms p99={device['latency_ms']['p99']}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,85 @@ import serial
 import time
 import select
 import struct
+from typing import NamedTuple, Dict, Any
+
+
+def _make_crc16_table(poly=0xA001):
+    """生成Modbus CRC16（反射多项式0xA001）的256项查找表"""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ poly if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _make_crc16_table()
+
+
+def crc16_modbus(data, length=None) -> int:
+    """
+    查表计算Modbus CRC16，每字节一次查表，比逐位计算快约8倍
+
+    Args:
+        data: bytes、bytearray、memoryview或整数列表
+        length: 参与计算的字节数，None表示全部
+
+    Returns:
+        int: CRC16校验值（发送时低字节在前）
+    """
+    if length is not None:
+        data = data[:length]
+    table = CRC16_TABLE
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+# 应答校验结果
+REPLY_OK = 'ok'
+REPLY_TIMEOUT = 'timeout'  # 未收到任何数据
+REPLY_SHORT = 'short'  # 数据不足一帧
+REPLY_BAD_ADDRESS = 'bad_address'  # 设备地址不符
+REPLY_BAD_FUNCTION = 'bad_function'  # 功能码不符
+REPLY_BAD_LENGTH = 'bad_length'  # 字节数与请求不符
+REPLY_BAD_CRC = 'bad_crc'  # CRC错误
+REPLY_EXCEPTION = 'exception'  # 设备返回异常应答（功能码最高位置1）
+REPLY_NOT_OPEN = 'not_open'  # 串口未打开或发送失败
+
+
+class RegisterReply(NamedTuple):
+    """寄存器读取结果"""
+    status: str  # REPLY_* 之一
+    data: bytes = b''  # 数据区（不含地址、功能码、字节数和CRC）
+    raw: bytes = b''  # 收到的原始数据
+    exception_code: int = 0  # 异常应答的异常码
+
+    @property
+    def ok(self) -> bool:
+        return self.status == REPLY_OK
+
+    @property
+    def value(self) -> int:
+        """数据区第一个字节（光栅状态），无数据时为-1"""
+        return self.data[0] if self.data else -1
 
 
 class SerialComm:
-    def __init__(self, port, baudrate=9600, timeout=3):
+    def __init__(self, port, baudrate=9600, timeout=3, address=0xFE):
         """初始化串口设置"""
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
+        self.address = address  # 设备地址
         self.serial_port = None
 
+        # 应答统计
+        self.reply_counts = {}  # 校验结果 -> 次数
+        self.last_error = None
+
     def open(self):
         """打开串口"""
         try:
@@ -74,70 +143,149 @@ class SerialComm:
 
         return received_data
 
-    def read_register(self, cmd, timeout=1.0):
+    def build_request(self, cmd, start=0x0000, quantity=0x0008, address=None):
         """
-        读取寄存器数据（优化版本）
+        组装读取请求帧：地址 + 功能码 + 起始地址 + 数量 + CRC（低字节在前）
 
         Args:
-            cmd: 命令字节
-            timeout: 总超时时间（秒）
+            cmd: 功能码
+            start: 起始地址
+            quantity: 读取数量
+            address: 设备地址，None表示使用 self.address（同一总线上有多个设备时指定）
 
         Returns:
-            tuple: (data, length) - 接收到的数据和长度
+            bytes: 8字节请求帧
         """
-        if not self.serial_port or not self.serial_port.is_open:
-            return bytearray(), -1
+        if address is None:
+            address = self.address
+        frame = bytearray((address, cmd, start >> 8, start & 0xFF, quantity >> 8, quantity & 0xFF))
+        crc_value = crc16_modbus(frame)
+        frame.append(crc_value & 0xFF)
+        frame.append((crc_value >> 8) & 0xFF)
+        return bytes(frame)
 
-        start_time = time.time()
+    @staticmethod
+    def expected_byte_count(cmd, quantity=0x0008):
+        """读取应答中的字节数：读线圈/离散输入按位打包，读寄存器每个2字节"""
+        if cmd in (0x01, 0x02):
+            return (quantity + 7) // 8
+        return quantity * 2
 
-        # 准备发送缓冲区
-        buffer = [0xFE, cmd, 0x00, 0x00, 0x00, 0x08]
-        crc_value = self.crc16(buffer, 6)
-        buffer.append(crc_value & 0xFF)
-        buffer.append((crc_value >> 8) & 0xFF)
+    def read_register(self, cmd, timeout=1.0, quantity=0x0008, address=None):
+        """
+        读取寄存器数据并校验应答
+
+        Args:
+            cmd: 功能码
+            timeout: 总超时时间（秒）
+            quantity: 读取数量
+            address: 设备地址，None表示使用 self.address
+
+        Returns:
+            RegisterReply: 校验结果；只有 ok 为True时数据区可信
+        """
+        if not self.serial_port or not self.serial_port.is_open:
+            return self._count(RegisterReply(REPLY_NOT_OPEN))
 
         # 清空输入缓冲区，避免旧数据干扰
         self.serial_port.reset_input_buffer()
-        # print([hex(b) for b in buffer])
-        # 发送数据
-        bytes_sent = self.send(buffer)
-        if bytes_sent < 0:
-            return bytearray(), -1
+        if self.send(list(self.build_request(cmd, 0x0000, quantity, address))) < 0:
+            return self._count(RegisterReply(REPLY_NOT_OPEN))
 
-        # 接收数据（使用更短的超时）
-        rx_data = self.receive(100, timeout=0.3)  # 接收超时300ms
+        # 收齐一帧即返回：正常应答 3+N+2 字节，异常应答 5 字节
+        frame_length = 5 + self.expected_byte_count(cmd, quantity)
+        deadline = time.time() + timeout
+        rx_data = bytearray()
+        while len(rx_data) < frame_length:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            chunk = self.receive(frame_length - len(rx_data), timeout=min(0.3, remaining))
+            if not chunk and rx_data:
+                break
+            rx_data.extend(chunk)
+            if len(rx_data) >= 5 and rx_data[1] == cmd | 0x80:
+                break
 
-        # 如果收到数据但长度不够，可能是数据还在传输中，再等待一下
-        if 0 < len(rx_data) < 8:  # 假设完整帧至少8字节
-            remaining_time = timeout - (time.time() - start_time)
-            if remaining_time > 0:
-                # 继续接收剩余数据
-                additional_data = self.receive(100 - len(rx_data), timeout=min(0.2, remaining_time))
-                rx_data.extend(additional_data)
+        return self._count(self.parse_reply(rx_data, cmd, quantity, address))
 
-        return rx_data, len(rx_data)
+    def parse_reply(self, data, cmd, quantity=0x0008, address=None):
+        """
+        校验读取应答：地址、功能码、字节数和CRC，帧前有杂散字节时向后查找
+
+        Args:
+            data: 收到的原始数据
+            cmd: 请求的功能码
+            quantity: 请求的读取数量
+            address: 期望的设备地址，None表示使用 self.address
+
+        Returns:
+            RegisterReply: 校验结果
+        """
+        raw = bytes(data)
+        if not raw:
+            return RegisterReply(REPLY_TIMEOUT)
+        if address is None:
+            address = self.address
+        byte_count = self.expected_byte_count(cmd, quantity)
+        frame_length = 5 + byte_count
+        first_error = None
+        position = raw.find(address)
+        if position < 0:
+            return RegisterReply(REPLY_BAD_ADDRESS if len(raw) >= 5 else REPLY_SHORT, raw=raw)
+        while position >= 0:
+            frame = raw[position:]
+            if len(frame) < 5:
+                error = RegisterReply(REPLY_SHORT, raw=raw)
+            elif frame[1] == cmd | 0x80:
+                if crc16_modbus(frame, 5) == 0:  # 含CRC一起计算结果为0即校验通过
+                    return RegisterReply(REPLY_EXCEPTION, raw=raw, exception_code=frame[2])
+                error = RegisterReply(REPLY_BAD_CRC, raw=raw)
+            elif frame[1] != cmd:
+                error = RegisterReply(REPLY_BAD_FUNCTION, raw=raw)
+            elif frame[2] != byte_count:
+                error = RegisterReply(REPLY_BAD_LENGTH, raw=raw)
+            elif len(frame) < frame_length:
+                error = RegisterReply(REPLY_SHORT, raw=raw)
+            elif crc16_modbus(frame, frame_length) != 0:
+                error = RegisterReply(REPLY_BAD_CRC, raw=raw)
+            else:
+                return RegisterReply(REPLY_OK, frame[3:3 + byte_count], raw)
+            first_error = first_error or error
+            position = raw.find(address, position + 1)
+        return first_error
+
+    def _count(self, reply):
+        """累计应答校验结果"""
+        self.reply_counts[reply.status] = self.reply_counts.get(reply.status, 0) + 1
+        if not reply.ok:
+            self.last_error = reply.status
+        return reply
+
+    def get_reply_stats(self) -> Dict[str, Any]:
+        """获取应答统计信息"""
+        total = sum(self.reply_counts.values())
+        errors = total - self.reply_counts.get(REPLY_OK, 0)
+        return {
+            'total': total,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'counts': dict(self.reply_counts),
+            'last_error': self.last_error
+        }
 
     def crc16(self, data, length):
         """
-        CRC16校验计算（对应C++的crc16方法）
+        CRC16校验计算（对应C++的crc16方法，查表实现）
 
         Args:
-            data: 数据列表
+            data: 数据列表、bytes或memoryview
             length: 数据长度
 
         Returns:
             int: CRC16校验值
         """
-        crc = 0xFFFF
-        for i in range(length):
-            crc ^= data[i]
-            for j in range(8):
-                if crc & 1:
-                    crc >>= 1
-                    crc ^= 0xA001
-                else:
-                    crc >>= 1
-        return crc
+        return crc16_modbus(data, length)
 
     def read_data_from_port(self, data_buffer, max_length):
         """
@@ -0,0 +1,301 @@
+# serial_engine.py
+"""
+光栅串口采样引擎
+原来的读取循环每50ms调用一次 read_register：清空输入缓冲区、发送请求、最多等待300ms接收，
+光栅变化到开始盘存的延迟为50~350ms，短暂的遮挡可能整个落在两次采样之间而被漏掉。
+
+本模块让串口保持在持续的帧重组循环中：
+- 按固定周期发送请求，不清空输入缓冲区；RS-485是半双工总线，默认同一时刻只有一个请求在途，
+  每次发送前保证总线已空闲 Modbus RTU 规定的3.5个字符时间；全双工线路（RS-422、串口服务器）
+  可以调大 max_outstanding 让多个请求在途（流水线）；
+- select 等待数据，读出 in_waiting 的全部字节追加到滚动缓冲区，按地址、功能码、字节数和CRC切出应答帧，
+  校验失败时后移一个字节重新同步；
+- 每个状态样本在到达时打上单调时钟时间戳，放入队列供状态机消费；
+- 设备支持主动上报时（push_mode）不再发送请求，只接收；
+- 统计请求应答延迟、样本间隔和抖动（相对采样周期的偏差），以及超时未应答（漏采样）的次数。
+"""
+
+import queue
+import select
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional, Dict, Any
+from latency_histogram import LatencyHistogram
+from serial_comm import SerialComm, crc16_modbus
+
+
+class StatusSample(NamedTuple):
+    """一次光栅状态采样"""
+    value: int  # 状态字节
+    timestamp_ns: int  # 到达时间（单调时钟ns）
+    latency_ns: int  # 请求到应答的延迟，主动上报时为0
+    raw: bytes  # 应答帧
+
+
+class SerialEngine:
+    """持续帧重组的串口采样引擎"""
+
+    def __init__(self, serial_comm: SerialComm, cmd: int = 0x02, quantity: int = 0x0008,
+                 poll_interval: float = 0.02, max_outstanding: int = 1, reply_timeout: float = 0.06,
+                 push_mode: bool = False, push_interval: Optional[float] = None, queue_size: int = 1000,
+                 frame_gap_chars: float = 3.5):
+        """
+        初始化引擎
+
+        Args:
+            serial_comm: 已打开的 SerialComm
+            cmd: 读取功能码
+            quantity: 读取数量
+            poll_interval: 采样周期（秒），9600波特率下一次请求+应答约15ms，加上设备处理时间和帧间隔约20ms
+            max_outstanding: 最多在途请求数，超过时推迟发送；半双工RS-485必须为1，只有全双工线路才能调大
+            reply_timeout: 请求超过该时间未应答记为漏采样（秒），半双工下应答丢失时总线最多空等这么久
+            push_mode: 设备主动上报状态时为True，不发送请求
+            push_interval: 主动上报的周期（秒），用于统计抖动和漏采样，None表示不统计
+            queue_size: 样本队列长度，满时丢弃最旧的样本
+            frame_gap_chars: 发送前总线至少空闲的字符时间数（Modbus RTU帧间隔为3.5个字符）
+        """
+        self.comm = serial_comm
+        self.cmd = cmd
+        self.quantity = quantity
+        self.poll_interval = poll_interval
+        self.max_outstanding = max_outstanding
+        self.reply_timeout = reply_timeout
+        self.push_mode = push_mode
+        self.push_interval = push_interval
+        self.samples = queue.Queue(maxsize=queue_size)
+        self.latest: Optional[StatusSample] = None
+
+        self._request = serial_comm.build_request(cmd, 0x0000, quantity)
+        self._byte_count = serial_comm.expected_byte_count(cmd, quantity)
+        self._frame_length = 5 + self._byte_count
+        # 最短往返时间：请求和应答在线路上的传输时间（每字节10位）
+        self._min_rtt_ns = int((len(self._request) + self._frame_length) * 10 / serial_comm.baudrate * 1e9)
+        # 帧间隔按每字符11位计算，19200波特率以上固定为1.75ms（Modbus RTU规范）
+        if serial_comm.baudrate > 19200:
+            self._gap_ns = int(frame_gap_chars / 3.5 * 1.75e6)
+        else:
+            self._gap_ns = int(frame_gap_chars * 11 / serial_comm.baudrate * 1e9)
+        self._tx_ns = int(len(self._request) * 10 / serial_comm.baudrate * 1e9)  # 请求在线路上的传输时间
+        self._bus_idle_ns = 0  # 总线上最后一个字节结束的时间（单调时钟ns）
+        self._buffer = bytearray()
+        self._outstanding = deque()  # 在途请求的发送时间（单调时钟ns）
+        self._thread = None
+        self._running = False
+
+        # 统计
+        self.requests_sent = 0
+        self.sample_count = 0
+        self.unsolicited = 0  # 没有对应请求的应答（主动上报）
+        self.missed = 0  # 超时未应答的请求，或主动上报模式下缺失的周期
+        self.deferred = 0  # 总线忙（在途请求已满或帧间隔未满）而推迟的发送
+        self.crc_errors = 0
+        self.bad_frames = 0  # 功能码或字节数不符
+        self.exceptions = 0  # 设备异常应答
+        self.discarded_bytes = 0
+        self.dropped = 0  # 队列满时丢弃的样本
+        self.latency = LatencyHistogram()  # 请求到应答
+        self.interval = LatencyHistogram()  # 相邻样本到达间隔
+        self.jitter = LatencyHistogram()  # 到达间隔与周期之差的绝对值
+        self._last_sample_ns = None
+
+    def start(self):
+        """启动采样线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='serial-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        """停止采样线程"""
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def get_sample(self, timeout: Optional[float] = None) -> Optional[StatusSample]:
+        """
+        取出下一个样本
+
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            StatusSample，超时返回None
+        """
+        try:
+            return self.samples.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'push_mode': self.push_mode,
+            'requests_sent': self.requests_sent,
+            'samples': self.sample_count,
+            'unsolicited': self.unsolicited,
+            'missed': self.missed,
+            'deferred': self.deferred,
+            'crc_errors': self.crc_errors,
+            'bad_frames': self.bad_frames,
+            'exceptions': self.exceptions,
+            'discarded_bytes': self.discarded_bytes,
+            'dropped': self.dropped,
+            'outstanding': len(self._outstanding),
+            'latency_ms': self.latency.snapshot('ms'),
+            'interval_ms': self.interval.snapshot('ms'),
+            'jitter_ms': self.jitter.snapshot('ms')
+        }
+
+    def _run(self):
+        port = self.comm.serial_port
+        interval_ns = int(self.poll_interval * 1e9)
+        timeout_ns = int(self.reply_timeout * 1e9)
+        next_send = time.monotonic_ns()
+        deferred_for = None  # 已计入推迟次数的周期
+        while self._running and self.comm.is_open():
+            try:
+                now = time.monotonic_ns()
+                if not self.push_mode:
+                    # 超时未应答的请求记为漏采样
+                    outstanding = self._outstanding
+                    while outstanding and now - outstanding[0] > timeout_ns:
+                        outstanding.popleft()
+                        self.missed += 1
+                    wait_until = next_send
+                    if now >= next_send:
+                        quiet_at = self._bus_idle_ns + self._gap_ns
+                        if len(outstanding) < self.max_outstanding and now >= quiet_at:
+                            port.write(self._request)
+                            outstanding.append(now)
+                            self._bus_idle_ns = now + self._tx_ns
+                            self.requests_sent += 1
+                            next_send += interval_ns
+                            if next_send <= now:  # 落后超过一个周期时不补发，从现在重新计时
+                                next_send = now + interval_ns
+                            wait_until = next_send
+                        else:
+                            # 总线忙（上一个应答未到或帧间隔未满）：不跳过本周期，应答到达或超时后立即发送
+                            if deferred_for != next_send:
+                                deferred_for = next_send
+                                self.deferred += 1
+                            if len(outstanding) < self.max_outstanding:
+                                wait_until = quiet_at
+                            else:
+                                wait_until = outstanding[0] + timeout_ns
+                    wait = max(0.0, (wait_until - time.monotonic_ns()) / 1e9)
+                else:
+                    wait = 0.05
+
+                ready, _, _ = select.select([port], [], [], wait)
+                if ready:
+                    available = port.in_waiting
+                    if available:
+                        self._buffer += port.read(available)
+                        arrival_ns = time.monotonic_ns()
+                        self._bus_idle_ns = arrival_ns
+                        self._extract(arrival_ns)
+            except Exception as e:
+                if self._running and self.comm.is_open():
+                    print(f"串口采样错误: {e}")
+                    time.sleep(0.5)
+        self._running = False
+
+    def _extract(self, arrival_ns: int):
+        """从滚动缓冲区切出完整的应答帧"""
+        buffer = self._buffer
+        address = self.comm.address
+        cmd = self.cmd
+        while buffer:
+            position = buffer.find(address)
+            if position < 0:
+                self.discarded_bytes += len(buffer)
+                buffer.clear()
+                return
+            if position:
+                self.discarded_bytes += position
+                del buffer[:position]
+            if len(buffer) < 3:
+                return
+
+            function = buffer[1]
+            if function == cmd:
+                if buffer[2] != self._byte_count:
+                    self.bad_frames += 1
+                    self.discarded_bytes += 1
+                    del buffer[:1]
+                    continue
+                length = self._frame_length
+            elif function == cmd | 0x80:
+                length = 5
+            else:
+                self.bad_frames += 1
+                self.discarded_bytes += 1
+                del buffer[:1]
+                continue
+
+            if len(buffer) < length:
+                return
+            frame = bytes(buffer[:length])
+            if crc16_modbus(frame) != 0:
+                self.crc_errors += 1
+                self.discarded_bytes += 1
+                del buffer[:1]
+                continue
+            del buffer[:length]
+
+            sent_ns = self._match_request(arrival_ns)
+            if function != cmd:
+                self.exceptions += 1
+                continue
+            self._on_sample(frame, arrival_ns, sent_ns)
+
+    def _match_request(self, arrival_ns: int) -> Optional[int]:
+        """
+        为应答找到对应的请求：应答按请求顺序返回，若后一个请求发出的时间已经早于一个最短往返时间，
+        说明队首请求的应答已经丢失，记为漏采样，避免之后的延迟统计整体错位
+        """
+        outstanding = self._outstanding
+        if not outstanding:
+            return None
+        while len(outstanding) > 1 and arrival_ns - outstanding[1] >= self._min_rtt_ns:
+            outstanding.popleft()
+            self.missed += 1
+        return outstanding.popleft()
+
+    def _on_sample(self, frame: bytes, arrival_ns: int, sent_ns: Optional[int]):
+        latency_ns = 0
+        if sent_ns is None:
+            self.unsolicited += 1
+        else:
+            latency_ns = arrival_ns - sent_ns
+            self.latency.record(latency_ns)
+
+        period = self.push_interval if self.push_mode else self.poll_interval
+        expected_ns = int(period * 1e9) if period else 0
+        if self._last_sample_ns is not None:
+            gap = arrival_ns - self._last_sample_ns
+            self.interval.record(gap)
+            if expected_ns:
+                self.jitter.record(abs(gap - expected_ns))
+                if self.push_mode and gap > expected_ns * 3 // 2:
+                    self.missed += (gap + expected_ns // 2) // expected_ns - 1
+        self._last_sample_ns = arrival_ns
+
+        sample = StatusSample(frame[3], arrival_ns, latency_ns, frame)
+        self.latest = sample
+        self.sample_count += 1
+        try:
+            self.samples.put_nowait(sample)
+        except queue.Full:
+            try:
+                self.samples.get_nowait()
+            except queue.Empty:
+                pass
+            self.samples.put_nowait(sample)
+            self.dropped += 1
@@ -0,0 +1,179 @@
+# tag_batch.py
+"""
+盘存帧批量解码模块
+一次解码缓冲区中的大量 0x83 盘存帧，输出按列存放的结果（结构数组）：
+EPC/TID/USER 为定长原始字节拼接，PC为uint16，RSSI为int16（0.1dBm），天线号为uint8，另有有效性掩码。
+解码使用 struct.iter_unpack 在C层完成拆字段，再用 zip 转置为列，避免逐字节格式化十六进制字符串；
+需要单个标签时才按需构造 RFIDTag。
+"""
+
+import struct
+from array import array
+from typing import Iterable, Iterator, List
+from rfid_tag import RFIDTag
+
+INVENTORY_FRAME_SIZE = 53
+INVENTORY_COMMAND = 0x83
+EPC_SIZE = 12
+TID_SIZE = 12
+USER_SIZE = 16
+
+# 帧头 长度 命令 PC EPC TID USER RSSI 天线 校验 帧尾
+INVENTORY_FRAME = struct.Struct('>2sHBH12s12s16shBB2s')
+_HEADER = b'\xA5\x5A'
+_TRAILER = b'\x0D\x0A'
+_CHECKSUM_SPAN = INVENTORY_FRAME_SIZE - 5  # 长度字段起到校验位之前的字节数
+
+
+class InventoryBatch:
+    """批量解码结果（列式存储）"""
+
+    def __init__(self, frames: bytes, pc: array, epc: bytes, tid: bytes, user: bytes, rssi: array,
+                 antenna: array, valid: bytearray):
+        self.frames = frames  # 对齐的原始帧，第i帧为 frames[i*53:(i+1)*53]
+        self.pc = pc  # array('H')
+        self.epc = epc  # 每个EPC占12字节
+        self.tid = tid  # 每个TID占12字节
+        self.user = user  # 每个USER占16字节
+        self.rssi = rssi  # array('h')，单位0.1dBm
+        self.antenna = antenna  # array('B')
+        self.valid = valid  # 1表示帧头、长度、命令字、帧尾（及可选的校验）均正确
+
+    def __len__(self) -> int:
+        return len(self.rssi)
+
+    @property
+    def valid_count(self) -> int:
+        """有效帧数量"""
+        return self.valid.count(1)
+
+    def epc_at(self, index: int) -> bytes:
+        return self.epc[index * EPC_SIZE:(index + 1) * EPC_SIZE]
+
+    def tid_at(self, index: int) -> bytes:
+        return self.tid[index * TID_SIZE:(index + 1) * TID_SIZE]
+
+    def user_at(self, index: int) -> bytes:
+        return self.user[index * USER_SIZE:(index + 1) * USER_SIZE]
+
+    def frame_at(self, index: int) -> bytes:
+        return self.frames[index * INVENTORY_FRAME_SIZE:(index + 1) * INVENTORY_FRAME_SIZE]
+
+    def rssi_dbm(self, index: int) -> float:
+        return self.rssi[index] / 10.0
+
+    def valid_indices(self) -> List[int]:
+        """有效帧的下标"""
+        return [i for i, ok in enumerate(self.valid) if ok]
+
+    def tag(self, index: int) -> RFIDTag:
+        """按需构造单个 RFIDTag"""
+        tag = RFIDTag()
+        tag.from_bytes(self.frame_at(index))
+        return tag
+
+    def iter_tags(self, valid_only: bool = True) -> Iterator[RFIDTag]:
+        """逐个构造 RFIDTag（只在确实需要对象时使用）"""
+        for index in range(len(self)):
+            if not valid_only or self.valid[index]:
+                yield self.tag(index)
+
+    def unique_tid_indices(self) -> List[int]:
+        """每个TID首次出现（且有效）的帧下标，用于批内去重"""
+        seen = set()
+        result = []
+        tid = self.tid
+        for index, ok in enumerate(self.valid):
+            if ok:
+                key = tid[index * TID_SIZE:(index + 1) * TID_SIZE]
+                if key not in seen:
+                    seen.add(key)
+                    result.append(index)
+        return result
+
+
+def _xor_fold(data: bytes) -> int:
+    """对字节串做按字节异或（先转成大整数再对半折叠，避免逐字节循环），适用于不超过64字节的数据"""
+    value = int.from_bytes(data, 'big')
+    for shift in (256, 128, 64, 32, 16, 8):
+        value = (value ^ (value >> shift)) & ((1 << shift) - 1)
+    return value
+
+
+def extract_inventory_frames(buffer) -> bytes:
+    """
+    从任意帧序列中按长度字段逐帧扫描，挑出完整的 0x83 盘存帧并拼接为对齐的缓冲区
+
+    Args:
+        buffer: 连续的 A5 5A 帧（可混有应答帧或无效数据）
+
+    Returns:
+        bytes: 只包含53字节盘存帧的对齐缓冲区
+    """
+    data = bytes(buffer)
+    size = len(data)
+    out = bytearray()
+    pos = data.find(_HEADER)
+    while 0 <= pos and pos + 5 <= size:
+        length = (data[pos + 2] << 8) | data[pos + 3]
+        end = pos + length
+        if length >= 8 and end <= size and data[end - 2:end] == _TRAILER:
+            if length == INVENTORY_FRAME_SIZE and data[pos + 4] == INVENTORY_COMMAND:
+                out += data[pos:end]
+            pos = data.find(_HEADER, end)
+        else:
+            pos = data.find(_HEADER, pos + 1)
+    return bytes(out)
+
+
+def decode_inventory(buffer, verify_checksum: bool = False) -> InventoryBatch:
+    """
+    批量解码盘存帧
+
+    Args:
+        buffer: 多个 0x83 盘存帧组成的缓冲区；若未按53字节对齐或混有其他帧，先按长度字段提取
+        verify_checksum: 是否校验异或校验位（单帧解析 RFIDTag.from_bytes 不校验，默认保持一致）
+
+    Returns:
+        InventoryBatch: 列式解码结果
+    """
+    frames = bytes(buffer)
+    if len(frames) % INVENTORY_FRAME_SIZE or not _aligned(frames):
+        frames = extract_inventory_frames(frames)
+
+    if not frames:
+        return InventoryBatch(b'', array('H'), b'', b'', b'', array('h'), array('B'), bytearray())
+
+    header, length, command, pc, epc, tid, user, rssi, antenna, checksum, trailer = \
+        zip(*INVENTORY_FRAME.iter_unpack(frames))
+    valid = bytearray(h == _HEADER and n == INVENTORY_FRAME_SIZE and c == INVENTORY_COMMAND and t == _TRAILER
+                      for h, n, c, t in zip(header, length, command, trailer))
+    if verify_checksum:
+        step = INVENTORY_FRAME_SIZE
+        for index, expected in enumerate(checksum):
+            offset = index * step + 2
+            if valid[index] and _xor_fold(frames[offset:offset + _CHECKSUM_SPAN]) != expected:
+                valid[index] = 0
+
+    return InventoryBatch(frames, array('H', pc), b''.join(epc), b''.join(tid), b''.join(user),
+                          array('h', rssi), array('B', antenna), valid)
+
+
+def decode_frames(frames: Iterable, verify_checksum: bool = False) -> InventoryBatch:
+    """
+    批量解码已分好帧的数据（例如 FrameAssembler 输出的帧），非盘存帧被跳过
+
+    Args:
+        frames: 帧序列（bytes或memoryview）
+        verify_checksum: 是否校验异或校验位
+    """
+    joined = b''.join(frame for frame in frames
+                      if len(frame) == INVENTORY_FRAME_SIZE and frame[4] == INVENTORY_COMMAND)
+    return decode_inventory(joined, verify_checksum)
+
+
+def _aligned(frames: bytes) -> bool:
+    """快速检查缓冲区是否由连续的53字节盘存帧组成（抽查每帧的帧头和命令字）"""
+    step = INVENTORY_FRAME_SIZE
+    head = _HEADER + b'\x00\x35\x83'
+    return all(frames[i:i + 5] == head for i in range(0, len(frames), step))
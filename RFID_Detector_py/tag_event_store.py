@@ -0,0 +1,348 @@
+# tag_event_store.py
+"""
+标签事件持久化模块
+tag_history 只在内存中，过门中途程序崩溃会丢失全部数据。本模块把每次被接受的读取和每次过门
+（方向、开始/结束时间、标签数、结果）写入SQLite（WAL模式）：
+
+- 调用方只把事件放入队列，立即返回，不在读取热路径上做任何磁盘IO；
+- 专用写线程攒批后在一个事务中批量插入（达到批大小或超过刷新间隔即提交）；
+- 按TID、批号、时间建立索引，便于追溯查询；
+- 写线程定期执行保留策略：删除超过保留天数的记录，检查点截断WAL并增量回收空闲页，
+  避免数据库在边缘设备上无限增长。
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional
+from rfid_tag import RFIDTag
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'tag_events.db')
+
+PASS_STATUS_OPEN = 'open'
+PASS_STATUS_COMPLETED = 'completed'
+PASS_STATUS_ABORTED = 'aborted'
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS tag_reads ('
+    ' id INTEGER PRIMARY KEY,'
+    ' pass_id INTEGER,'
+    ' read_time REAL NOT NULL,'
+    ' tid TEXT NOT NULL,'
+    ' epc TEXT,'
+    ' rssi REAL,'
+    ' antenna INTEGER,'
+    ' batch_number TEXT)',
+    'CREATE INDEX IF NOT EXISTS idx_reads_tid ON tag_reads(tid)',
+    'CREATE INDEX IF NOT EXISTS idx_reads_batch ON tag_reads(batch_number)',
+    'CREATE INDEX IF NOT EXISTS idx_reads_time ON tag_reads(read_time)',
+    'CREATE INDEX IF NOT EXISTS idx_reads_pass ON tag_reads(pass_id)',
+    'CREATE TABLE IF NOT EXISTS passes ('
+    ' pass_id INTEGER PRIMARY KEY,'
+    ' direction TEXT,'
+    ' start_time REAL NOT NULL,'
+    ' end_time REAL,'
+    ' tag_count INTEGER,'
+    ' status TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS idx_passes_time ON passes(start_time)',
+)
+
+# 写队列中的操作类型
+_OP_READ = 0
+_OP_PASS_BEGIN = 1
+_OP_PASS_END = 2
+_OP_RETENTION = 3
+
+
+class TagEventStore:
+    """标签事件存储（SQLite WAL + 批量写线程）"""
+
+    def __init__(self, path: str = DEFAULT_PATH, batch_size: int = 500, flush_interval: float = 0.2,
+                 retention_days: float = 30.0, retention_interval: float = 3600.0, max_queue: int = 100000):
+        """
+        初始化存储
+
+        Args:
+            path: 数据库文件路径
+            batch_size: 每个事务最多写入的事件数
+            flush_interval: 最长提交间隔（秒），决定崩溃时最多丢失多久的数据
+            retention_days: 记录保留天数，None表示不删除
+            retention_interval: 保留策略执行间隔（秒）
+            max_queue: 读取记录队列上限，写线程跟不上时丢弃新读取并计数，而不是阻塞调用方；
+                过门开始/结束走单独的无界控制队列，既不丢弃也不阻塞调用方
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.retention_interval = retention_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._control = queue.Queue()  # 过门开始/结束和保留策略请求，写线程优先处理
+        self._writer_thread = None
+        self._running = False
+        self._pass_lock = threading.Lock()
+
+        # 统计
+        self.reads_written = 0
+        self.passes_written = 0
+        self.transactions = 0
+        self.dropped = 0
+        self.rows_purged = 0
+        self.last_commit_ms = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # auto_vacuum必须在切换到WAL之前、建表之前设置，否则SQLite忽略该设置，用普通连接初始化
+        db = sqlite3.connect(path)
+        try:
+            db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            for statement in _SCHEMA:
+                db.execute(statement)
+            db.commit()
+            if db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # 旧版本创建的数据库：执行一次VACUUM使增量回收生效
+                print("标签事件库启用增量回收，执行一次VACUUM...")
+                db.execute('VACUUM')
+            db.execute('PRAGMA journal_mode=WAL')
+            row = db.execute('SELECT MAX(m) FROM (SELECT MAX(pass_id) AS m FROM passes '
+                             'UNION ALL SELECT MAX(pass_id) FROM tag_reads)').fetchone()
+            self._next_pass_id = (row[0] or 0) + 1
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def start(self):
+        """启动写线程"""
+        if self._writer_thread and self._writer_thread.is_alive():
+            return
+        self._running = True
+        self._writer_thread = threading.Thread(target=self._writer_loop, name='tag-event-writer', daemon=True)
+        self._writer_thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中剩余的事件后停止写线程"""
+        if not self._running:
+            return
+        self._running = False
+        if self._writer_thread:
+            self._writer_thread.join(timeout)
+
+    def begin_pass(self, direction: Optional[str]) -> int:
+        """
+        开始一次过门
+
+        Args:
+            direction: 方向（入库/出库），未知时为None
+
+        Returns:
+            int: 过门编号
+        """
+        with self._pass_lock:
+            pass_id = self._next_pass_id
+            self._next_pass_id += 1
+        self._control.put((_OP_PASS_BEGIN, (pass_id, direction, time.time(), PASS_STATUS_OPEN)))
+        return pass_id
+
+    def end_pass(self, pass_id: int, tag_count: int, status: str = PASS_STATUS_COMPLETED,
+                 direction: Optional[str] = None):
+        """
+        结束一次过门
+
+        Args:
+            pass_id: begin_pass返回的编号
+            tag_count: 标签数量
+            status: 结果（completed/aborted）
+            direction: 方向，None表示保持开始时的记录
+        """
+        self._control.put((_OP_PASS_END, (time.time(), tag_count, status, direction, pass_id)))
+
+    def record_read(self, tag: RFIDTag, pass_id: Optional[int] = None) -> bool:
+        """
+        记录一次被接受的读取（不阻塞，队列已满时丢弃）
+
+        Args:
+            tag: 标签
+            pass_id: 所属过门编号
+
+        Returns:
+            bool: 是否已放入写队列
+        """
+        # 只入队原始帧，TID/EPC/批号在写线程中格式化，不在调用方线程触发标签的延迟解析
+        raw = tag.raw
+        fields = raw if raw is not None else (tag.tid, tag.epc, tag.batch_number)
+        row = (pass_id, time.time(), fields, tag.rssi, tag.antenna_num)
+        try:
+            self._queue.put_nowait((_OP_READ, row))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def run_retention(self):
+        """请求写线程立即执行一次保留策略"""
+        self._control.put((_OP_RETENTION, None))
+
+    def query_reads(self, tid: Optional[str] = None, batch_number: Optional[str] = None,
+                    start: Optional[float] = None, end: Optional[float] = None,
+                    pass_id: Optional[int] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        查询读取记录（使用独立连接，WAL模式下不阻塞写线程）
+
+        Args:
+            tid: TID（十六进制字符串）
+            batch_number: 批号
+            start: 开始时间（时间戳）
+            end: 结束时间（时间戳）
+            pass_id: 过门编号
+            limit: 最多返回条数
+
+        Returns:
+            记录字典列表，按时间排序
+        """
+        conditions, params = [], []
+        for column, op, value in (('tid', '=', tid), ('batch_number', '=', batch_number),
+                                  ('read_time', '>=', start), ('read_time', '<', end), ('pass_id', '=', pass_id)):
+            if value is not None:
+                conditions.append(f'{column} {op} ?')
+                params.append(value)
+        sql = 'SELECT pass_id, read_time, tid, epc, rssi, antenna, batch_number FROM tag_reads'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY read_time LIMIT ?'
+        params.append(limit)
+        return self._query(sql, params)
+
+    def query_passes(self, start: Optional[float] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """查询过门记录（最近的在前）"""
+        sql = 'SELECT pass_id, direction, start_time, end_time, tag_count, status FROM passes'
+        params = []
+        if start is not None:
+            sql += ' WHERE start_time >= ?'
+            params.append(start)
+        sql += ' ORDER BY start_time DESC LIMIT ?'
+        params.append(limit)
+        return self._query(sql, params)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'queued': self._queue.qsize() + self._control.qsize(),
+            'reads_written': self.reads_written,
+            'passes_written': self.passes_written,
+            'transactions': self.transactions,
+            'dropped': self.dropped,
+            'rows_purged': self.rows_purged,
+            'last_commit_ms': round(self.last_commit_ms, 3)
+        }
+
+    def _query(self, sql: str, params: list) -> List[Dict[str, Any]]:
+        db = sqlite3.connect(self.path)
+        try:
+            db.row_factory = sqlite3.Row
+            return [dict(row) for row in db.execute(sql, params)]
+        finally:
+            db.close()
+
+    def _drain_control(self) -> list:
+        items = []
+        try:
+            while True:
+                items.append(self._control.get_nowait())
+        except queue.Empty:
+            return items
+
+    def _writer_loop(self):
+        """写线程：攒批、单事务提交、定期执行保留策略"""
+        db = self._connect()
+        next_retention = time.monotonic() + 60.0  # 启动一分钟后首次执行
+        try:
+            while True:
+                # 控制操作先处理，不在读取记录后面排队
+                batch = self._drain_control()
+                try:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+                    deadline = time.monotonic() + self.flush_interval
+                    while len(batch) < self.batch_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    pass
+
+                retention = False
+                if batch:
+                    batch += self._drain_control()
+                    retention = any(op == _OP_RETENTION for op, _ in batch)
+                    self._write_batch(db, batch)
+
+                if self.retention_days is not None and (retention or time.monotonic() >= next_retention):
+                    self._apply_retention(db)
+                    next_retention = time.monotonic() + self.retention_interval
+
+                if not self._running and self._queue.empty() and self._control.empty():
+                    break
+        except Exception as e:
+            print(f"标签事件写线程异常: {e}")
+        finally:
+            db.close()
+
+    def _write_batch(self, db: sqlite3.Connection, batch: list):
+        reads = [self._format_read(row) for op, row in batch if op == _OP_READ]
+        started = time.perf_counter()
+        try:
+            with db:
+                # 过门开始/结束按顺序执行，保证同一批内先开始后结束
+                for op, row in batch:
+                    if op == _OP_PASS_BEGIN:
+                        db.execute('INSERT OR REPLACE INTO passes (pass_id, direction, start_time, status) '
+                                   'VALUES (?, ?, ?, ?)', row)
+                    elif op == _OP_PASS_END:
+                        db.execute('UPDATE passes SET end_time = ?, tag_count = ?, status = ?, '
+                                   'direction = COALESCE(?, direction) WHERE pass_id = ?', row)
+                        self.passes_written += 1
+                if reads:
+                    db.executemany('INSERT INTO tag_reads (pass_id, read_time, tid, epc, rssi, antenna, '
+                                   'batch_number) VALUES (?, ?, ?, ?, ?, ?, ?)', reads)
+            self.reads_written += len(reads)
+            self.transactions += 1
+        except sqlite3.Error as e:
+            print(f"写入标签事件失败: {e}")
+        self.last_commit_ms = (time.perf_counter() - started) * 1000
+
+    @staticmethod
+    def _format_read(row: tuple) -> tuple:
+        """把队列中的读取记录转换为数据库行（在写线程中执行）"""
+        pass_id, read_time, fields, rssi, antenna = row
+        if isinstance(fields, bytes):
+            tag = RFIDTag()
+            tag.from_bytes(fields)
+            fields = (tag.tid, tag.epc, tag.batch_number)
+        tid, epc, batch_number = fields
+        return pass_id, read_time, tid, epc, rssi, antenna, batch_number
+
+    def _apply_retention(self, db: sqlite3.Connection):
+        """删除过期记录，截断WAL，回收空闲页"""
+        cutoff = time.time() - self.retention_days * 86400
+        try:
+            with db:
+                purged = db.execute('DELETE FROM tag_reads WHERE read_time < ?', (cutoff,)).rowcount
+                purged += db.execute("DELETE FROM passes WHERE start_time < ? AND status != 'open'",
+                                     (cutoff,)).rowcount
+            self.rows_purged += purged
+            db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            if purged:
+                db.executescript('PRAGMA incremental_vacuum;')  # execute()只执行一步，只释放一页
+            db.execute('PRAGMA optimize')
+            if purged:
+                print(f"标签事件保留策略: 删除{purged}条过期记录")
+        except sqlite3.Error as e:
+            print(f"执行保留策略失败: {e}")
@@ -0,0 +1,518 @@
+# tag_log.py
+"""
+标签读取追加日志模块
+SQLite对资源受限的站点偏重时使用：被接受的标签读取以定长二进制记录追加到分段文件，
+接口与 TagEventStore 相同（begin_pass/end_pass/record_read/close/get_stats），可直接替换。
+
+- 记录：<时间ns:8><过门编号:4><TID:12><EPC:12><RSSI 0.1dBm:2><天线:1><保留:1>，共40字节（小端）；
+- 分段：单段达到上限后切换到新段，超出保留段数时删除最旧的一段；
+- 稀疏索引：每段一个索引文件，每 index_interval 条记录写一项 <时间ns:8><记录序号:8>，
+  读取时内存映射索引文件二分查找起点，范围扫描只读取需要的部分，不加载整段；
+- 组提交：record_read 只把记录打包追加到内存缓冲区，后台线程每 commit_interval 秒一次性写入文件，
+  每 fsync_interval 秒做一次 fsync（0表示每次提交都fsync，None表示交给操作系统），
+  断电最多丢失一个fsync周期的数据，段尾不完整的记录在读取时被忽略。
+
+文件格式:
+    <prefix>.<序号>.log  段文件：文件头 MAGIC + 记录大小(4字节) + 记录序列
+    <prefix>.<序号>.idx  稀疏索引
+
+用法:
+    python tag_log.py dump data/tag_log/reads --limit 20
+    python tag_log.py export data/tag_log/reads out.csv --start "2024-01-01 00:00:00"
+"""
+
+import argparse
+import bisect
+import csv
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from typing import Callable, Dict, Any, Iterator, List, Optional
+from command import build_frame
+from rfid_tag import RFIDTag
+
+DEFAULT_PREFIX = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'tag_log', 'reads')
+
+LOG_MAGIC = b'RFIDLOG1'
+LOG_HEADER = struct.Struct('<8sI')
+LOG_RECORD = struct.Struct('<qI12s12shBx')
+INDEX_ENTRY = struct.Struct('<qQ')
+
+TagLogRecord = namedtuple('TagLogRecord', 'timestamp_ns pass_id tid epc rssi antenna')
+
+
+def _segment_paths(prefix: str) -> List[str]:
+    """按序号排列的段文件路径"""
+    return sorted(glob.glob(glob.escape(prefix) + '.[0-9]*.log'))
+
+
+def _segment_number(path: str) -> int:
+    return int(path.rsplit('.', 2)[-2])
+
+
+class TagLogWriter:
+    """追加日志写入器（线程安全）"""
+
+    def __init__(self, prefix: str = DEFAULT_PREFIX, max_segment_bytes: int = 64 * 1024 * 1024,
+                 max_segments: int = 16, index_interval: int = 1024, commit_interval: float = 0.05,
+                 fsync_interval: Optional[float] = 1.0):
+        """
+        初始化写入器
+
+        Args:
+            prefix: 文件路径前缀
+            max_segment_bytes: 单个段文件的最大字节数
+            max_segments: 最多保留的段数，0表示不限制
+            index_interval: 每隔多少条记录写一项稀疏索引
+            commit_interval: 组提交间隔（秒）
+            fsync_interval: fsync间隔（秒），0表示每次提交都fsync，None表示不主动fsync
+        """
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self.index_interval = index_interval
+        self.commit_interval = commit_interval
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()  # 保护内存缓冲区
+        self._io_lock = threading.Lock()  # 保护文件写入
+        self._pending = bytearray()
+        self._pending_count = 0
+        self._last_ns = 0  # 保证同一日志内时间戳不递减，索引才能二分
+        self._file = None
+        self._file_path = None
+        self._index_file = None
+        self._segment_records = 0
+        self._segment_bytes = 0
+        self._last_fsync = time.monotonic()
+        self._stop_event = threading.Event()
+        self._commit_thread = None
+
+        # 统计
+        self.records = 0
+        self.commits = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        self.max_commit_records = 0
+        self.last_commit_ms = 0.0
+
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        existing = _segment_paths(prefix)
+        self._next_segment = _segment_number(existing[-1]) + 1 if existing else 0
+        self._next_pass_id = 1
+        if existing:
+            last = TagLogReader(prefix).last_record()
+            if last:
+                self._next_pass_id = last.pass_id + 1
+                self._last_ns = last.timestamp_ns
+        self._open_segment()
+
+    def start(self):
+        """启动组提交线程"""
+        if self._commit_thread and self._commit_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._commit_thread = threading.Thread(target=self._commit_loop, name='tag-log-commit', daemon=True)
+        self._commit_thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """提交剩余记录并关闭文件"""
+        self._stop_event.set()
+        if self._commit_thread:
+            self._commit_thread.join(timeout)
+            self._commit_thread = None
+        self.commit(fsync=True)
+        with self._io_lock:
+            if self._file:
+                self._file.close()
+                self._index_file.close()
+                self._file = None
+                if not self._segment_records:
+                    # 没有写入任何记录的段直接删除，避免反复启停留下空段
+                    for path in (self._file_path, self._file_path[:-4] + '.idx'):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+
+    def begin_pass(self, direction: Optional[str] = None) -> int:
+        """
+        开始一次过门（日志中只记录过门编号，方向和结果由上报记录）
+
+        Returns:
+            int: 过门编号
+        """
+        with self._lock:
+            pass_id = self._next_pass_id
+            self._next_pass_id += 1
+        return pass_id
+
+    def end_pass(self, pass_id: int, tag_count: int, status: str = 'completed', direction: Optional[str] = None):
+        """结束一次过门（与 TagEventStore 接口一致，日志中无需额外记录）"""
+
+    def record_read(self, tag: RFIDTag, pass_id: Optional[int] = None) -> bool:
+        """
+        记录一次被接受的读取（只追加到内存缓冲区）
+
+        Args:
+            tag: 标签
+            pass_id: 所属过门编号，None记为0
+
+        Returns:
+            bool: 始终为True
+        """
+        raw = tag.raw
+        if raw is not None and len(raw) >= 31:
+            tid, epc = raw[19:31], raw[7:19]
+        else:
+            tid, epc = tag.tid_bytes, bytes.fromhex(tag.epc)
+        self.append(tid, epc, int(round(tag.rssi * 10)), tag.antenna_num, pass_id or 0)
+        return True
+
+    def append(self, tid: bytes, epc: bytes, rssi: int, antenna: int, pass_id: int = 0,
+               timestamp_ns: Optional[int] = None):
+        """
+        追加一条原始记录
+
+        Args:
+            tid: TID原始字节（12字节）
+            epc: EPC原始字节（12字节）
+            rssi: 信号强度（0.1dBm）
+            antenna: 天线号
+            pass_id: 过门编号
+            timestamp_ns: 时间（time.time_ns()），None表示当前时间
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        with self._lock:
+            if timestamp_ns < self._last_ns:
+                timestamp_ns = self._last_ns
+            self._last_ns = timestamp_ns
+            self._pending += LOG_RECORD.pack(timestamp_ns, pass_id, tid, epc, rssi, antenna)
+            self._pending_count += 1
+
+    def commit(self, fsync: bool = False):
+        """
+        把缓冲区中的记录一次性写入文件
+
+        Args:
+            fsync: 是否强制fsync；否则按 fsync_interval 决定
+        """
+        with self._lock:
+            if not self._pending_count and not fsync:
+                return
+            data, count = self._pending, self._pending_count
+            self._pending = bytearray()
+            self._pending_count = 0
+        started = time.perf_counter()
+        with self._io_lock:
+            if self._file is None:
+                return
+            view = memoryview(data)
+            size = LOG_RECORD.size
+            offset = 0
+            while offset < len(data):
+                room = max(1, (self.max_segment_bytes - self._segment_bytes) // size)
+                chunk = view[offset:offset + room * size]
+                self._write_chunk(chunk)
+                offset += len(chunk)
+                if self._segment_bytes + size > self.max_segment_bytes:
+                    self._rotate()
+            self._file.flush()
+            self._index_file.flush()
+            now = time.monotonic()
+            if fsync or (self.fsync_interval is not None and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                os.fsync(self._index_file.fileno())
+                self._last_fsync = now
+                self.fsyncs += 1
+        if count:
+            self.records += count
+            self.commits += 1
+            self.max_commit_records = max(self.max_commit_records, count)
+            self.last_commit_ms = (time.perf_counter() - started) * 1000
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'records': self.records,
+            'pending': self._pending_count,
+            'commits': self.commits,
+            'fsyncs': self.fsyncs,
+            'rotations': self.rotations,
+            'max_commit_records': self.max_commit_records,
+            'last_commit_ms': round(self.last_commit_ms, 3),
+            'segments': len(_segment_paths(self.prefix))
+        }
+
+    def _write_chunk(self, chunk: memoryview):
+        """写入一段记录，并为跨过索引间隔的记录补写索引项"""
+        size = LOG_RECORD.size
+        interval = self.index_interval
+        first = self._segment_records
+        count = len(chunk) // size
+        next_indexed = -(-first // interval) * interval  # 不小于first的最小间隔整数倍
+        for record_no in range(next_indexed, first + count, interval):
+            timestamp_ns = struct.unpack_from('<q', chunk, (record_no - first) * size)[0]
+            self._index_file.write(INDEX_ENTRY.pack(timestamp_ns, record_no))
+        self._file.write(chunk)
+        self._segment_records += count
+        self._segment_bytes += len(chunk)
+
+    def _open_segment(self):
+        path = f"{self.prefix}.{self._next_segment:06d}.log"
+        self._next_segment += 1
+        self._file_path = path
+        self._file = open(path, 'wb')
+        self._file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_RECORD.size))
+        self._index_file = open(path[:-4] + '.idx', 'wb')
+        self._segment_records = 0
+        self._segment_bytes = LOG_HEADER.size
+
+    def _rotate(self):
+        self._file.close()
+        self._index_file.close()
+        self.rotations += 1
+        segments = _segment_paths(self.prefix)
+        while self.max_segments and len(segments) >= self.max_segments:
+            oldest = segments.pop(0)
+            for path in (oldest, oldest[:-4] + '.idx'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        self._open_segment()
+
+    def _commit_loop(self):
+        while not self._stop_event.wait(self.commit_interval):
+            try:
+                self.commit()
+            except OSError as e:
+                print(f"标签日志写入失败: {e}")
+
+
+class TagLogReader:
+    """追加日志读取器：范围扫描、导出和回放"""
+
+    def __init__(self, prefix: str, chunk_records: int = 4096):
+        """
+        初始化读取器
+
+        Args:
+            prefix: 文件路径前缀
+            chunk_records: 顺序扫描时每次读取的记录数
+        """
+        self.prefix = prefix
+        self.chunk_records = chunk_records
+
+    def segments(self) -> List[Dict[str, Any]]:
+        """各段的文件名、记录数和首末时间"""
+        result = []
+        for path in _segment_paths(self.prefix):
+            count = self._record_count(path)
+            first = last = None
+            if count:
+                with open(path, 'rb') as f:
+                    first = self._read_records(f, 0, 1)[0].timestamp_ns
+                    last = self._read_records(f, count - 1, 1)[0].timestamp_ns
+            result.append({'file': os.path.basename(path), 'records': count, 'first_ns': first, 'last_ns': last})
+        return result
+
+    def last_record(self) -> Optional[TagLogRecord]:
+        """最后一条记录（写入器重启时用于接续过门编号和时间戳）"""
+        for path in reversed(_segment_paths(self.prefix)):
+            count = self._record_count(path)
+            if count:
+                with open(path, 'rb') as f:
+                    return self._read_records(f, count - 1, 1)[0]
+        return None
+
+    def scan(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+             pass_id: Optional[int] = None) -> Iterator[TagLogRecord]:
+        """
+        按时间范围扫描记录
+
+        Args:
+            start_ns: 开始时间（含，time.time_ns()），None表示从头开始
+            end_ns: 结束时间（不含），None表示到末尾
+            pass_id: 只返回指定过门的记录
+
+        Returns:
+            TagLogRecord 迭代器（按时间顺序）
+        """
+        size = LOG_RECORD.size
+        for path in _segment_paths(self.prefix):
+            count = self._record_count(path)
+            if not count:
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    if end_ns is not None and self._read_records(f, 0, 1)[0].timestamp_ns >= end_ns:
+                        return
+                    if start_ns is not None and self._read_records(f, count - 1, 1)[0].timestamp_ns < start_ns:
+                        continue
+                    position = self._seek_index(path, start_ns) if start_ns is not None else 0
+                    f.seek(LOG_HEADER.size + position * size)
+                    while position < count:
+                        n = min(self.chunk_records, count - position)
+                        data = f.read(n * size)
+                        position += n
+                        for fields in LOG_RECORD.iter_unpack(data[:len(data) // size * size]):
+                            timestamp_ns = fields[0]
+                            if start_ns is not None and timestamp_ns < start_ns:
+                                continue
+                            if end_ns is not None and timestamp_ns >= end_ns:
+                                return
+                            if pass_id is None or fields[1] == pass_id:
+                                yield TagLogRecord._make(fields)
+            except OSError as e:
+                print(f"读取标签日志失败: {path}, {e}")
+
+    def export_csv(self, path: str, start_ns: Optional[int] = None, end_ns: Optional[int] = None) -> int:
+        """
+        导出为CSV
+
+        Returns:
+            int: 导出的记录数
+        """
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['时间', '过门编号', 'TID', 'EPC', 'RSSI(dBm)', '天线'])
+            for record in self.scan(start_ns, end_ns):
+                timestamp = datetime.fromtimestamp(record.timestamp_ns / 1e9).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                writer.writerow([timestamp, record.pass_id, record.tid.hex().upper(), record.epc.hex().upper(),
+                                 record.rssi / 10.0, record.antenna])
+                count += 1
+        return count
+
+    def replay(self, callback: Callable[[bytes], Any], start_ns: Optional[int] = None,
+               end_ns: Optional[int] = None, speed: float = 0.0,
+               stop_event: Optional[threading.Event] = None) -> int:
+        """
+        把记录还原成 0x83 盘存帧（USER区为0）按原始间隔送给回调，例如 update_rfid_data
+
+        Args:
+            callback: 帧回调
+            start_ns: 开始时间
+            end_ns: 结束时间
+            speed: 回放倍速，0表示最快速度
+            stop_event: 置位时中止回放
+
+        Returns:
+            int: 回放的记录数
+        """
+        count = 0
+        first_ns = None
+        started = time.perf_counter()
+        for record in self.scan(start_ns, end_ns):
+            if stop_event is not None and stop_event.is_set():
+                break
+            if first_ns is None:
+                first_ns = record.timestamp_ns
+            if speed > 0:
+                wait = (record.timestamp_ns - first_ns) / 1e9 / speed - (time.perf_counter() - started)
+                if wait > 0:
+                    time.sleep(wait)
+            callback(record_frame(record))
+            count += 1
+        return count
+
+    def _seek_index(self, path: str, start_ns: int) -> int:
+        """在内存映射的稀疏索引中二分查找，返回不晚于start_ns的最近索引项对应的记录序号"""
+        index_path = path[:-4] + '.idx'
+        try:
+            size = os.path.getsize(index_path)
+        except OSError:
+            return 0
+        entries = size // INDEX_ENTRY.size
+        if not entries:
+            return 0
+        with open(index_path, 'rb') as f, mmap.mmap(f.fileno(), entries * INDEX_ENTRY.size,
+                                                    access=mmap.ACCESS_READ) as mm:
+            keys = _IndexKeys(mm, entries)
+            slot = bisect.bisect_left(keys, start_ns) - 1
+            return INDEX_ENTRY.unpack_from(mm, slot * INDEX_ENTRY.size)[1] if slot >= 0 else 0
+
+    @staticmethod
+    def _record_count(path: str) -> int:
+        try:
+            with open(path, 'rb') as f:
+                magic, record_size = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+            if magic != LOG_MAGIC or record_size != LOG_RECORD.size:
+                print(f"标签日志格式错误: {path}")
+                return 0
+            return (os.path.getsize(path) - LOG_HEADER.size) // LOG_RECORD.size
+        except (OSError, struct.error):
+            return 0
+
+    @staticmethod
+    def _read_records(f, position: int, count: int) -> List[TagLogRecord]:
+        f.seek(LOG_HEADER.size + position * LOG_RECORD.size)
+        data = f.read(count * LOG_RECORD.size)
+        return [TagLogRecord._make(fields) for fields in LOG_RECORD.iter_unpack(data)]
+
+
+class _IndexKeys:
+    """把内存映射的索引文件包装成时间戳序列，供bisect直接二分（不复制整个索引）"""
+
+    def __init__(self, mm: mmap.mmap, entries: int):
+        self._mm = mm
+        self._entries = entries
+
+    def __len__(self) -> int:
+        return self._entries
+
+    def __getitem__(self, i: int) -> int:
+        return struct.unpack_from('<q', self._mm, i * INDEX_ENTRY.size)[0]
+
+
+def record_frame(record: TagLogRecord) -> bytes:
+    """把日志记录还原成 0x83 盘存帧（PC和USER区为0）"""
+    payload = (b'\x00\x00' + record.epc + record.tid + bytes(16) +
+               record.rssi.to_bytes(2, 'big', signed=True) + bytes((record.antenna,)))
+    return build_frame(0x83, payload)
+
+
+def _parse_time(text: Optional[str]) -> Optional[int]:
+    if not text:
+        return None
+    return int(datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timestamp() * 1e9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='标签读取日志查看与导出')
+    sub = parser.add_subparsers(dest='action', required=True)
+    dump_parser = sub.add_parser('dump', help='打印日志记录')
+    dump_parser.add_argument('prefix', help='日志文件路径前缀')
+    dump_parser.add_argument('--start', help='开始时间，例如 "2024-01-01 08:00:00"')
+    dump_parser.add_argument('--end', help='结束时间')
+    dump_parser.add_argument('--limit', type=int, default=100, help='最多打印的记录数')
+    export_parser = sub.add_parser('export', help='导出为CSV')
+    export_parser.add_argument('prefix', help='日志文件路径前缀')
+    export_parser.add_argument('output', help='CSV文件路径')
+    export_parser.add_argument('--start', help='开始时间')
+    export_parser.add_argument('--end', help='结束时间')
+    args = parser.parse_args()
+
+    reader = TagLogReader(args.prefix)
+    if args.action == 'dump':
+        for count, record in enumerate(reader.scan(_parse_time(args.start), _parse_time(args.end))):
+            if count >= args.limit:
+                break
+            timestamp = datetime.fromtimestamp(record.timestamp_ns / 1e9).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            print(f"{timestamp} 过门{record.pass_id} TID:{record.tid.hex().upper()} "
+                  f"EPC:{record.epc.hex().upper()} RSSI:{record.rssi / 10.0:.1f}dBm 天线:{record.antenna}")
+    else:
+        count = reader.export_csv(args.output, _parse_time(args.start), _parse_time(args.end))
+        print(f"已导出{count}条记录到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+# tag_store.py
+"""
+标签会话存储模块
+以TID原始字节为键的插入有序字典保存本次过门（会话）读到的标签，配合记录插入顺序的deque淘汰最旧的标签。
+判重、插入、淘汰都是O(1)，取代在列表上线性查找TID、用pop(0)裁剪的做法。
+重复读取不再直接丢弃，而是由读取统计器累计每个TID的读取次数、首末读取时间、RSSI范围和天线。
+输送线连续作业没有过门边界时可设置TTL：标签计数后经过TTL秒才会被再次计数。所有条目的TTL相同，
+到期顺序与加入顺序一致，因此到期队列就是与插入顺序平行的deque，每次加入时顺带弹出已到期的条目，
+均摊O(1)，无需定期全量扫描。
+会话存储由串口线程（过门结束上报、中断清空）和界面线程（标签入库）同时访问，所有操作在一把锁内完成，
+插入路径只做几次字典和deque操作，持锁时间极短；上报使用 seal() 原子地换下整个会话并开始新的会话，
+之后的读取进入新会话，不会在上报和清空之间丢失或重复计数。快照均为不可变的元组。
+"""
+
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from rfid_tag import RFIDTag
+
+
+class TagReadAggregator:
+    """按TID累计读取统计（列式数组存储，每次读取O(1)更新）"""
+
+    def __init__(self):
+        self._rows: Dict[bytes, int] = {}  # TID -> 行号
+        self._free: List[int] = []  # 已释放可复用的行号
+        self.read_count = array('I')
+        self.first_ns = array('q')  # 首次读取（单调时钟ns）
+        self.last_ns = array('q')  # 最近读取（单调时钟ns）
+        self.rssi_min = array('h')  # 0.1dBm
+        self.rssi_max = array('h')
+        self.rssi_sum = array('q')
+        self.antenna_mask = array('I')  # 第n位表示n号天线读到过
+
+        self.total_reads = 0
+
+    def record(self, tid: bytes, rssi: float, antenna: int, now_ns: Optional[int] = None) -> int:
+        """
+        记录一次读取
+
+        Args:
+            tid: TID原始字节
+            rssi: 信号强度（dBm）
+            antenna: 天线号
+            now_ns: 读取时间（单调时钟ns），None表示当前时间
+
+        Returns:
+            int: 该TID累计读取次数
+        """
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        value = int(round(rssi * 10))
+        bit = 1 << (antenna & 31)
+        self.total_reads += 1
+
+        row = self._rows.get(tid)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self.read_count[row] = 1
+                self.first_ns[row] = self.last_ns[row] = now_ns
+                self.rssi_min[row] = self.rssi_max[row] = value
+                self.rssi_sum[row] = value
+                self.antenna_mask[row] = bit
+            else:
+                row = len(self.read_count)
+                self.read_count.append(1)
+                self.first_ns.append(now_ns)
+                self.last_ns.append(now_ns)
+                self.rssi_min.append(value)
+                self.rssi_max.append(value)
+                self.rssi_sum.append(value)
+                self.antenna_mask.append(bit)
+            self._rows[tid] = row
+            return 1
+
+        count = self.read_count[row] + 1
+        self.read_count[row] = count
+        self.last_ns[row] = now_ns
+        if value < self.rssi_min[row]:
+            self.rssi_min[row] = value
+        elif value > self.rssi_max[row]:
+            self.rssi_max[row] = value
+        self.rssi_sum[row] += value
+        self.antenna_mask[row] |= bit
+        return count
+
+    def remove(self, tid: bytes):
+        """删除一个TID的统计（标签被淘汰时调用）"""
+        row = self._rows.pop(tid, None)
+        if row is not None:
+            self._free.append(row)
+
+    def clear(self):
+        """清空所有统计"""
+        self._rows.clear()
+        self._free.clear()
+        for column in (self.read_count, self.first_ns, self.last_ns, self.rssi_min, self.rssi_max,
+                       self.rssi_sum, self.antenna_mask):
+            del column[:]
+
+    def get(self, tid: bytes, wall_offset: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        获取一个TID的读取统计
+
+        Args:
+            tid: TID原始字节
+            wall_offset: 单调时钟到系统时间的偏移（秒），None表示现算；批量获取时传入同一个值
+
+        Returns:
+            统计字典，TID不存在时返回None
+        """
+        row = self._rows.get(tid)
+        if row is None:
+            return None
+        if wall_offset is None:
+            wall_offset = time.time() - time.monotonic()
+        count = self.read_count[row]
+        mask = self.antenna_mask[row]
+        return {
+            'read_count': count,
+            'first_seen': _format_time(self.first_ns[row] / 1e9 + wall_offset),
+            'last_seen': _format_time(self.last_ns[row] / 1e9 + wall_offset),
+            'dwell_ms': round((self.last_ns[row] - self.first_ns[row]) / 1e6, 1),
+            'rssi_min': self.rssi_min[row] / 10.0,
+            'rssi_max': self.rssi_max[row] / 10.0,
+            'rssi_mean': round(self.rssi_sum[row] / count / 10.0, 1),
+            'antennas': [n for n in range(32) if mask >> n & 1]
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取汇总信息"""
+        return {
+            'tracked_tags': len(self._rows),
+            'total_reads': self.total_reads
+        }
+
+    def __contains__(self, tid: bytes) -> bool:
+        return tid in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def _format_time(timestamp: float) -> str:
+    """格式化为带毫秒的时间字符串"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) + f".{int(timestamp * 1000) % 1000:03d}"
+
+
+class TagSessionStore:
+    """按TID去重的标签会话存储"""
+
+    def __init__(self, max_size: int = 10000, aggregator: Optional[TagReadAggregator] = None,
+                 ttl: Optional[float] = None):
+        """
+        初始化存储
+
+        Args:
+            max_size: 最多保存的标签数，超出时淘汰最早加入的标签
+            aggregator: 读取统计器，每次读取（包括重复读取）都会记录，None表示不统计
+            ttl: 去重时间窗口（秒），标签加入后超过该时间即过期、可再次计数；None表示整个会话内去重
+        """
+        self.max_size = max_size
+        self.aggregator = aggregator
+        self.ttl = ttl
+        self._ttl_ns = int(ttl * 1e9) if ttl is not None else None
+        self._tags: Dict[bytes, RFIDTag] = {}
+        self._order = deque()  # TID按加入顺序排列，用于O(1)淘汰
+        self._expiry = deque()  # 与_order一一对应的过期时间（单调时钟ns），仅TTL模式使用
+        self._unreported: List[RFIDTag] = []  # TTL模式下尚未上报的新计数标签
+        self._lock = threading.Lock()
+
+        # 统计
+        self.inserted = 0
+        self.duplicates = 0
+        self.evicted = 0
+        self.expired = 0
+        self.sealed = 0
+        self.lock_acquisitions = 0
+        self.lock_contended = 0  # 需要等待其他线程释放锁的次数
+        self.lock_wait_ns = 0  # 累计等待时间
+        self.lock_max_wait_ns = 0
+
+    def _acquire(self):
+        """获取锁并统计争用：先尝试非阻塞获取，失败时才计时等待；计数在持锁后更新，不会丢失"""
+        if self._lock.acquire(False):
+            self.lock_acquisitions += 1
+            return
+        started = time.perf_counter_ns()
+        self._lock.acquire()
+        waited = time.perf_counter_ns() - started
+        self.lock_acquisitions += 1
+        self.lock_contended += 1
+        self.lock_wait_ns += waited
+        if waited > self.lock_max_wait_ns:
+            self.lock_max_wait_ns = waited
+
+    def add(self, tag: RFIDTag, now_ns: Optional[int] = None) -> bool:
+        """
+        加入一个标签
+
+        Args:
+            tag: 解析成功的标签
+            now_ns: 当前时间（单调时钟ns），None表示现取，仅TTL模式使用
+
+        Returns:
+            bool: True表示新标签（或TTL已过期后再次读到），False表示TID已存在（重复读取）
+        """
+        key = tag.tid_bytes
+        if self._ttl_ns is not None and now_ns is None:
+            now_ns = time.monotonic_ns()
+        self._acquire()
+        try:
+            if self._ttl_ns is not None:
+                self._expire(now_ns)
+            if self.aggregator is not None:
+                self.aggregator.record(key, tag.rssi, tag.antenna_num, now_ns)
+            if key in self._tags:
+                self.duplicates += 1
+                return False
+
+            self._tags[key] = tag
+            self._order.append(key)
+            if self._ttl_ns is not None:
+                self._expiry.append(now_ns + self._ttl_ns)
+                self._unreported.append(tag)
+            self.inserted += 1
+            while len(self._order) > self.max_size:
+                self._pop_oldest()
+                self.evicted += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def expire(self, now_ns: Optional[int] = None) -> int:
+        """
+        移除已过期的标签（仅TTL模式），只检查队首，均摊O(1)
+
+        Args:
+            now_ns: 当前时间（单调时钟ns），None表示现取
+
+        Returns:
+            int: 本次移除的数量
+        """
+        if self._ttl_ns is None:
+            return 0
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        self._acquire()
+        try:
+            return self._expire(now_ns)
+        finally:
+            self._lock.release()
+
+    def _expire(self, now_ns: int) -> int:
+        expiry = self._expiry
+        count = 0
+        while expiry and expiry[0] <= now_ns:
+            self._pop_oldest()
+            count += 1
+        self.expired += count
+        return count
+
+    def take_unreported(self) -> Tuple[tuple, ...]:
+        """
+        取出TTL模式下自上次调用以来新计数的标签及其读取统计，用于输送线模式的周期上报
+
+        Returns:
+            (标签, 读取统计) 元组；标签已过期（统计已移除）时统计为None
+        """
+        wall_offset = time.time() - time.monotonic()
+        self._acquire()
+        try:
+            tags, self._unreported = self._unreported, []
+            result = []
+            for tag in tags:
+                key = tag.tid_bytes
+                stats = None
+                if self.aggregator is not None and self._tags.get(key) is tag:
+                    stats = self.aggregator.get(key, wall_offset)
+                result.append((tag, stats))
+            return tuple(result)
+        finally:
+            self._lock.release()
+
+    def unreported_count(self) -> int:
+        """TTL模式下尚未上报的新计数标签数量"""
+        self._acquire()
+        try:
+            return len(self._unreported)
+        finally:
+            self._lock.release()
+
+    def _pop_oldest(self):
+        oldest = self._order.popleft()
+        if self._expiry:
+            self._expiry.popleft()
+        del self._tags[oldest]
+        if self.aggregator is not None:
+            self.aggregator.remove(oldest)
+
+    def contains(self, tid: bytes) -> bool:
+        """TID（原始字节）是否已存在"""
+        self._acquire()
+        try:
+            return tid in self._tags
+        finally:
+            self._lock.release()
+
+    def get(self, tid: bytes) -> Optional[RFIDTag]:
+        """按TID（原始字节）获取标签"""
+        self._acquire()
+        try:
+            return self._tags.get(tid)
+        finally:
+            self._lock.release()
+
+    def snapshot(self) -> Tuple[RFIDTag, ...]:
+        """按加入顺序返回当前所有标签的不可变快照（上报、导出时使用，不受之后的增删影响）"""
+        self._acquire()
+        try:
+            return tuple(self._tags.values())
+        finally:
+            self._lock.release()
+
+    def snapshot_with_stats(self) -> Tuple[tuple, ...]:
+        """按加入顺序返回 (标签, 读取统计) 元组，未启用统计器时统计为None"""
+        wall_offset = time.time() - time.monotonic()
+        self._acquire()
+        try:
+            if self.aggregator is None:
+                return tuple((tag, None) for tag in self._tags.values())
+            get = self.aggregator.get
+            return tuple((tag, get(key, wall_offset)) for key, tag in self._tags.items())
+        finally:
+            self._lock.release()
+
+    def seal(self) -> Tuple[tuple, ...]:
+        """
+        原子地封存当前会话并开始新的会话（过门结束上报时使用）
+        持锁期间只交换引用，读取统计在锁外生成；封存之后到达的读取全部计入新会话。
+
+        Returns:
+            封存会话的 (标签, 读取统计) 元组，按加入顺序排列
+        """
+        fresh = TagReadAggregator() if self.aggregator is not None else None
+        self._acquire()
+        try:
+            tags, aggregator = self._tags, self.aggregator
+            self._tags = {}
+            self._order = deque()
+            self._expiry = deque()
+            self._unreported = []
+            self.aggregator = fresh
+            self.sealed += 1
+        finally:
+            self._lock.release()
+        if aggregator is None:
+            return tuple((tag, None) for tag in tags.values())
+        wall_offset = time.time() - time.monotonic()
+        return tuple((tag, aggregator.get(key, wall_offset)) for key, tag in tags.items())
+
+    def read_stats(self, tid: bytes) -> Optional[Dict[str, Any]]:
+        """获取一个TID（原始字节）的读取统计"""
+        self._acquire()
+        try:
+            return self.aggregator.get(tid) if self.aggregator is not None else None
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """清空（开始新的一次过门）"""
+        self._acquire()
+        try:
+            self._tags.clear()
+            self._order.clear()
+            self._expiry.clear()
+            self._unreported.clear()
+            if self.aggregator is not None:
+                self.aggregator.clear()
+        finally:
+            self._lock.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息（持锁读取，与 seal() 交换会话互斥）"""
+        self._acquire()
+        try:
+            return self._stats()
+        finally:
+            self._lock.release()
+
+    def _stats(self) -> Dict[str, Any]:
+        return {
+            'size': len(self._tags),
+            'max_size': self.max_size,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'evicted': self.evicted,
+            'expired': self.expired,
+            'ttl': self.ttl,
+            'sealed': self.sealed,
+            'lock_acquisitions': self.lock_acquisitions,
+            'lock_contended': self.lock_contended,
+            'lock_wait_ms': round(self.lock_wait_ns / 1e6, 3),
+            'lock_max_wait_us': round(self.lock_max_wait_ns / 1e3, 1)
+        }
+
+    def __contains__(self, tid: bytes) -> bool:
+        return self.contains(tid)
+
+    def __len__(self) -> int:
+        self._acquire()
+        try:
+            return len(self._tags)
+        finally:
+            self._lock.release()
+
+    def __iter__(self) -> Iterator[RFIDTag]:
+        return iter(self.snapshot())
@@ -0,0 +1,73 @@
+# test_gate_fsm.py
+"""光栅过门状态机测试：两个方向的路径1、路径2，以及中断、超时、冷却（用 replay_samples 离线回放）"""
+
+import pytest
+from gate_fsm import (GateFSM, replay_samples, STATE_IDLE, DIRECTION_INBOUND as IN, DIRECTION_OUTBOUND as OUT,
+                      EVENT_START, EVENT_COMPLETE, EVENT_ABORT, EVENT_TIMEOUT)
+
+START_IN = (EVENT_START, IN, False, False)
+START_OUT = (EVENT_START, OUT, False, False)
+COMPLETE_IN = (EVENT_COMPLETE, IN, True, False)
+COMPLETE_OUT = (EVENT_COMPLETE, OUT, True, False)
+
+
+def scenario(statuses, step_ms=100, **kwargs):
+    """按固定间隔生成样本并回放，返回 (事件类型, 方向, report, clear) 列表"""
+    samples = [(i * step_ms * 1000000, status) for i, status in enumerate(statuses)]
+    return [(e.kind, e.direction, e.report, e.clear) for e in replay_samples(samples, **kwargs)]
+
+
+@pytest.mark.parametrize('statuses, expected', [
+    ([0, 1, 3, 2, 0], [START_IN, COMPLETE_IN]),  # 入库路径1：1 → 3 → 2 → 0
+    ([0, 1, 0, 2, 0], [START_IN, COMPLETE_IN]),  # 入库路径2：1 → 0 → 2 → 0
+    ([0, 1, 2, 0], [START_IN, COMPLETE_IN]),  # 入库路径2：1 → 2 → 0
+    ([0, 2, 3, 1, 0], [START_OUT, COMPLETE_OUT]),  # 出库路径1：2 → 3 → 1 → 0
+    ([0, 2, 0, 1, 0], [START_OUT, COMPLETE_OUT]),  # 出库路径2：2 → 0 → 1 → 0
+    ([0, 2, 1, 0], [START_OUT, COMPLETE_OUT]),  # 出库路径2：2 → 1 → 0
+])
+def test_paths(statuses, expected):
+    assert scenario(statuses) == expected
+
+
+def test_repeated_samples_ignored():
+    assert scenario([0, 0, 1, 1, 1, 3, 3, 2, 2, 0, 0]) == [START_IN, COMPLETE_IN]
+
+
+@pytest.mark.parametrize('statuses, expected', [
+    ([0, 1, 3, 0], [START_IN, (EVENT_ABORT, IN, False, False)]),  # 中间状态无遮挡：中断但不清空
+    ([0, 2, 3, 0], [START_OUT, (EVENT_ABORT, OUT, False, False)]),
+    ([0, 1, 0, 1], [START_IN, (EVENT_ABORT, IN, False, False)]),  # 结束状态回到起始光栅
+    ([0, 2, 0, 2], [START_OUT, (EVENT_ABORT, OUT, False, False)]),
+])
+def test_abort(statuses, expected):
+    assert scenario(statuses) == expected
+
+
+def test_cooldown_skips_second_report():
+    events = scenario([0, 1, 2, 0, 1, 2, 0], step_ms=100)
+    assert events == [START_IN, COMPLETE_IN, START_IN, (EVENT_COMPLETE, IN, False, False)]
+
+
+def test_cooldown_elapsed_reports_again():
+    events = scenario([0, 1, 2, 0, 1, 2, 0], step_ms=400)
+    assert events[-1] == COMPLETE_IN
+
+
+def test_timeout_between_samples():
+    # 光栅1一直遮挡，超过10秒无变化：超时并清空
+    samples = [(0, 0), (10 ** 8, 1)] + [(10 ** 8 + i * 5 * 10 ** 7, 1) for i in range(1, 220)]
+    assert [(e.kind, e.clear) for e in replay_samples(samples)] == [(EVENT_START, False), (EVENT_TIMEOUT, True)]
+
+
+def test_timeout_on_tick_then_new_pass():
+    fsm = GateFSM()
+    fsm.feed(2, 0)
+    fsm.tick(int(10.5e9))
+    assert fsm.events.get_nowait().kind == EVENT_START
+    assert fsm.events.get_nowait().kind == EVENT_TIMEOUT
+    assert fsm.state == STATE_IDLE
+    # 超时后光栅恢复无遮挡不会产生新事件，之后可以正常开始新的过门
+    fsm.feed(0, int(11e9))
+    assert fsm.events.empty()
+    fsm.feed(1, int(12e9))
+    assert fsm.events.get_nowait().kind == EVENT_START
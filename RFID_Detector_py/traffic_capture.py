@@ -0,0 +1,304 @@
+# traffic_capture.py
+"""
+原始通信抓包与回放模块
+抓包：把收发的原始数据块（方向、单调时钟纳秒、长度、内容）追加写入紧凑的二进制分段文件，
+每段达到上限后切换到新段，超出保留段数时删除最旧的一段，索引文件记录各段的时间范围和记录数。
+回放：按原始时间间隔（1倍速、N倍速或最快速度）把接收数据重新送入 SocketClient 的帧重组和回调，
+既可以复现现场问题，也可以作为接近真实流量的吞吐量基准。
+
+文件格式:
+    <prefix>.<序号>.cap  段文件：文件头 MAGIC + 记录序列，记录头为 <方向:1><时间ns:8><长度:4>（小端）
+    <prefix>.idx        索引（JSON）：各段文件名、首末记录时间、记录数和字节数
+
+用法:
+    python traffic_capture.py dump capture/session
+    python traffic_capture.py replay capture/session --speed 0
+"""
+
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+DIRECTION_RX = 0  # 读写器 -> 本机
+DIRECTION_TX = 1  # 本机 -> 读写器
+DIRECTION_NAMES = {DIRECTION_RX: 'RX', DIRECTION_TX: 'TX'}
+
+CAPTURE_MAGIC = b'RFIDCAP1'
+RECORD_HEADER = struct.Struct('<BQI')
+
+# 抓包记录：(方向, 单调时钟ns, 数据)
+CaptureRecord = Tuple[int, int, bytes]
+
+
+class CaptureWriter:
+    """抓包写入器（线程安全，收发线程可同时写入）"""
+
+    def __init__(self, prefix: str, max_segment_bytes: int = 16 * 1024 * 1024, max_segments: int = 8,
+                 buffer_size: int = 64 * 1024):
+        """
+        初始化写入器
+
+        Args:
+            prefix: 文件路径前缀，例如 capture/session
+            max_segment_bytes: 单个分段文件的最大字节数
+            max_segments: 最多保留的分段数，超出时删除最旧的分段，0表示不限制
+            buffer_size: 文件写缓冲大小
+        """
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self.buffer_size = buffer_size
+        self.index_path = prefix + '.idx'
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment = None
+        self._segments: List[Dict[str, Any]] = []
+        self._next_segment = 0
+
+        # 统计
+        self.records = 0
+        self.bytes_written = 0
+        self.rotations = 0
+
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load_index()
+        self._open_segment()
+
+    def write(self, direction: int, data) -> None:
+        """
+        追加一条记录
+
+        Args:
+            direction: DIRECTION_RX 或 DIRECTION_TX
+            data: 原始数据（bytes、bytearray或memoryview）
+        """
+        timestamp = time.monotonic_ns()
+        size = len(data)
+        with self._lock:
+            if self._file is None:
+                return
+            if self._segment['bytes'] + RECORD_HEADER.size + size > self.max_segment_bytes \
+                    and self._segment['records']:
+                self._rotate()
+            self._file.write(RECORD_HEADER.pack(direction, timestamp, size))
+            self._file.write(data)
+            segment = self._segment
+            if not segment['records']:
+                segment['first_ns'] = timestamp
+            segment['last_ns'] = timestamp
+            segment['records'] += 1
+            segment['bytes'] += RECORD_HEADER.size + size
+            self.records += 1
+            self.bytes_written += RECORD_HEADER.size + size
+
+    def flush(self):
+        """把缓冲写入磁盘并更新索引"""
+        with self._lock:
+            if self._file:
+                self._file.flush()
+                self._save_index()
+
+    def close(self):
+        """关闭写入器"""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+                self._save_index()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'records': self.records,
+            'bytes_written': self.bytes_written,
+            'segments': len(self._segments),
+            'rotations': self.rotations,
+            'current_segment': self._segment['file'] if self._segment else None
+        }
+
+    def _open_segment(self):
+        name = f"{os.path.basename(self.prefix)}.{self._next_segment:06d}.cap"
+        self._next_segment += 1
+        self._file = open(os.path.join(os.path.dirname(self.prefix), name), 'wb', buffering=self.buffer_size)
+        self._file.write(CAPTURE_MAGIC)
+        self._segment = {'file': name, 'first_ns': 0, 'last_ns': 0, 'records': 0, 'bytes': len(CAPTURE_MAGIC)}
+        self._segments.append(self._segment)
+        self._save_index()
+
+    def _rotate(self):
+        self._file.close()
+        self.rotations += 1
+        while self.max_segments and len(self._segments) >= self.max_segments:
+            oldest = self._segments.pop(0)
+            try:
+                os.remove(os.path.join(os.path.dirname(self.prefix), oldest['file']))
+            except OSError:
+                pass
+        self._open_segment()
+
+    def _load_index(self):
+        """追加到已有抓包：沿用原索引，新分段序号接在后面"""
+        index = load_index(self.index_path)
+        self._segments = index
+        if index:
+            self._next_segment = int(index[-1]['file'].rsplit('.', 2)[-2]) + 1
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'segments': self._segments}, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+
+def load_index(index_path: str) -> List[Dict[str, Any]]:
+    """读取索引文件，不存在时返回空列表"""
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('segments', [])
+    except (OSError, ValueError):
+        return []
+
+
+def read_capture(prefix: str, directions: Optional[Tuple[int, ...]] = None) -> Iterator[CaptureRecord]:
+    """
+    按时间顺序读取抓包记录
+
+    Args:
+        prefix: 抓包文件路径前缀
+        directions: 只返回指定方向的记录，None表示全部
+
+    Returns:
+        (方向, 单调时钟ns, 数据) 的迭代器；段尾不完整的记录（写入时断电）被忽略
+    """
+    directory = os.path.dirname(prefix)
+    for segment in load_index(prefix + '.idx'):
+        path = os.path.join(directory, segment['file'])
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+                    print(f"抓包文件格式错误: {path}")
+                    continue
+                while True:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    direction, timestamp, size = RECORD_HEADER.unpack(header)
+                    data = f.read(size)
+                    if len(data) < size:
+                        break
+                    if directions is None or direction in directions:
+                        yield direction, timestamp, data
+        except OSError as e:
+            print(f"读取抓包文件失败: {path}, {e}")
+
+
+class CaptureReplayer:
+    """抓包回放器：把接收方向的数据按原始节奏送入 SocketClient.feed_received_data"""
+
+    def __init__(self, prefix: str, client, speed: float = 1.0):
+        """
+        初始化回放器
+
+        Args:
+            prefix: 抓包文件路径前缀
+            client: SocketClient（或其子类）实例，可以是未连接的
+            speed: 回放速度倍数，1为原始速度，0表示不等待、以最快速度回放
+        """
+        self.prefix = prefix
+        self.client = client
+        self.speed = speed
+        self._stop_event = threading.Event()
+
+        # 统计
+        self.records = 0
+        self.bytes = 0
+        self.frames = 0
+        self.elapsed = 0.0
+        self.max_lag = 0.0  # 实际送入时间落后于计划时间的最大值（秒）
+
+    def run(self) -> Dict[str, Any]:
+        """执行回放（阻塞直到结束或被stop()中止），返回统计信息"""
+        last_ns = None
+        schedule_ns = 0  # 相对回放开始的计划时间（按原始间隔累加，追加的多次会话间隔不会为负）
+        started = time.perf_counter()
+        frames_before = self.client.get_frame_stats()['frames']
+        for _, timestamp, data in read_capture(self.prefix, (DIRECTION_RX,)):
+            if self._stop_event.is_set():
+                break
+            if last_ns is not None:
+                schedule_ns += max(0, timestamp - last_ns)
+            last_ns = timestamp
+            if self.speed > 0:
+                due = schedule_ns / 1e9 / self.speed
+                wait = due - (time.perf_counter() - started)
+                if wait > 0:
+                    self._stop_event.wait(wait)
+                else:
+                    self.max_lag = max(self.max_lag, -wait)
+            self.client.feed_received_data(data)
+            self.records += 1
+            self.bytes += len(data)
+        self.elapsed = time.perf_counter() - started
+        self.frames = self.client.get_frame_stats()['frames'] - frames_before
+        return self.get_stats()
+
+    def stop(self):
+        """中止回放"""
+        self._stop_event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        elapsed = self.elapsed or 1e-9
+        return {
+            'records': self.records,
+            'bytes': self.bytes,
+            'frames': self.frames,
+            'elapsed': round(self.elapsed, 3),
+            'frames_per_second': round(self.frames / elapsed, 1),
+            'megabytes_per_second': round(self.bytes / elapsed / 1e6, 2),
+            'max_lag_ms': round(self.max_lag * 1000, 3)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RFID通信抓包查看与回放')
+    sub = parser.add_subparsers(dest='action', required=True)
+    dump_parser = sub.add_parser('dump', help='打印抓包记录')
+    dump_parser.add_argument('prefix', help='抓包文件路径前缀')
+    dump_parser.add_argument('--limit', type=int, default=100, help='最多打印的记录数')
+    replay_parser = sub.add_parser('replay', help='回放接收数据并统计吞吐量')
+    replay_parser.add_argument('prefix', help='抓包文件路径前缀')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='回放倍速，0为最快速度')
+    args = parser.parse_args()
+
+    if args.action == 'dump':
+        first_ns = None
+        for count, (direction, timestamp, data) in enumerate(read_capture(args.prefix)):
+            if count >= args.limit:
+                break
+            first_ns = timestamp if first_ns is None else first_ns
+            print(f"{(timestamp - first_ns) / 1e6:12.3f}ms {DIRECTION_NAMES.get(direction, direction)} "
+                  f"{len(data):5d} {data.hex(' ').upper()}")
+    else:
+        from SocketClient import SocketClient
+        client = SocketClient(auto_reconnect=False)
+        frames_by_command = {}
+
+        def on_receive(data):
+            if not isinstance(data, dict) and len(data) > 4:
+                frames_by_command[data[4]] = frames_by_command.get(data[4], 0) + 1
+
+        client.set_callbacks(receive_callback=on_receive)
+        stats = CaptureReplayer(args.prefix, client, args.speed).run()
+        print(f"回放完成: {stats}")
+        print("按命令字统计: " + ', '.join(f"0x{c:02X}={n}" for c, n in sorted(frames_by_command.items())))
+
+
+if __name__ == "__main__":
+    main()